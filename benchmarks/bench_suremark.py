@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+#
+# Benchmarks for the SureMark driver, run against the simulated printer
+#
+# Results are printed as JSON (or written to --output). With --save-baseline they are stored as the baseline, with
+# --compare they are checked against it and the exit status is 1 if a result got worse by more than --tolerance.
+# No baseline is shipped, host results depend on the machine: record one with --save-baseline first, --compare
+# without a baseline exits with 2.
+# The exit status is also 1 if "import posprinter.suremark" takes longer than --import-budget or loads one of the
+# modules in IMPORT_FORBIDDEN, which only the features that need them should load.
+#
+# Results measured on the simulator's virtual clock ("device" results) only depend on the protocol and the code
+# paths, they are exactly reproducible. Host CPU results depend on the machine and need a larger tolerance.
+#
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import posprinter
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+    import posprinter
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_decoder import ResponseDecoder
+from posprinter.suremark_sim import SimulatedSureMark
+from posprinter.suremark_spooler import Spooler
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+#: Seconds "import posprinter.suremark" may take in a fresh interpreter
+IMPORT_BUDGET = 0.03
+#: Modules that must not be loaded by "import posprinter.suremark"
+IMPORT_FORBIDDEN = ('posprinter.suremark_debug', 'posprinter.suremark_raster', 'posprinter.suremark_async', 'numpy',
+                    'asyncio', 'serial_asyncio')
+
+_IMPORT_PROBE = '''
+import json, sys, time
+t = time.perf_counter()
+import posprinter.suremark
+t = time.perf_counter() - t
+print(json.dumps({'time': t, 'modules': sorted(sys.modules)}))
+'''
+
+RECEIPT_LINES = [
+    '{:<32}{:>8}'.format('ITEM {:02d}'.format(i), '{}.{:02d}'.format(i, (i * 37) % 100)).encode('ascii') + b'\n'
+    for i in range(20)
+]
+
+
+class NullDevice:
+    """
+    Accepts and drops everything, for measuring the host side only.
+    """
+
+    def write(self, data):
+        return len(data)
+
+    def read(self, n):
+        return b''
+
+
+def build_receipt(p):
+    with p.batch():
+        p.align_positions(SureMark.ALIGN_POSITIONS_CENTER)
+        p.write(b'POSPRINTER BENCHMARK STORE\n')
+        p.align_positions(SureMark.ALIGN_POSITIONS_LEFT)
+        for line in RECEIPT_LINES:
+            p.write(line)
+        p.barcode_set_height(80)
+        p.barcode('4006381333931', type=SureMark.BARCODE_EAN13)
+        p.cut()
+
+
+def bench_import(repeat=5):
+    # a fresh interpreter each time, the import is only slow once
+    env = dict(os.environ)
+    paths = [os.path.dirname(os.path.dirname(os.path.abspath(posprinter.__file__)))]
+    if env.get('PYTHONPATH'):
+        paths.append(env['PYTHONPATH'])
+    env['PYTHONPATH'] = os.pathsep.join(paths)
+    times = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', _IMPORT_PROBE], env=env)
+        probe = json.loads(out.decode())
+        times.append(probe['time'])
+    return min(times), [m for m in IMPORT_FORBIDDEN if m in probe['modules']]
+
+
+def result(value, unit, higher_is_better, kind):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better, 'kind': kind}
+
+
+def bench_receipts(count):
+    sim = SimulatedSureMark(baudrate=19200)
+    p = SureMark(sim)
+    start = sim.clock()
+    for _ in range(count):
+        build_receipt(p)
+        # a receipt is done once the printer emptied its buffer
+        while not p.query_status().buffer_empty():
+            sim.sleep(0.05)
+    return count / (sim.clock() - start)
+
+
+def bench_build_cpu(count):
+    p = SureMark(NullDevice())
+    start = time.process_time()
+    for _ in range(count):
+        build_receipt(p)
+    return (time.process_time() - start) / count * 1e6
+
+
+def bench_parse(count):
+    sim = SimulatedSureMark(baudrate=115200)
+    # capture one ID response to build a stream of them
+    sim.write(SureMark.CMD_RETRIEVE_PRINTER_ID)
+    message = sim.read(64)
+    stream = message * count
+    decoder = ResponseDecoder(size=len(stream))
+    start = time.perf_counter()
+    decoder.feed(stream)
+    n = 0
+    for m in decoder:
+        m.buffer_empty()
+        n += 1
+    elapsed = time.perf_counter() - start
+    if n != count:
+        raise ValueError('Decoded {} of {} messages'.format(n, count))
+    return count / elapsed
+
+
+def bench_receive(count):
+    sim = SimulatedSureMark(baudrate=115200)
+    p = SureMark(sim)
+    with p.batch():
+        for _ in range(count):
+            p.write(SureMark.CMD_RETRIEVE_PRINTER_ID)
+    start = time.perf_counter()
+    for _ in range(count):
+        p.receive_message()
+    return count / (time.perf_counter() - start)
+
+
+def bench_identify(count):
+    sim = SimulatedSureMark(baudrate=19200)
+    p = SureMark(sim)
+    start = sim.clock()
+    wall = time.perf_counter()
+    for _ in range(count):
+        p.identify()
+    return (sim.clock() - start) / count * 1e3, (time.perf_counter() - wall) / count * 1e6
+
+
+def bench_usage_stats():
+    sim = SimulatedSureMark(baudrate=19200)
+    p = SureMark(sim)
+    start = sim.clock()
+    p.get_usage_snapshot()
+    return (sim.clock() - start) * 1e3
+
+
+def bench_line_rate(baudrate, size):
+    # fast enough to never fill, so only the line and the flow control limit the rate
+    sim = SimulatedSureMark(baudrate=baudrate, drain_rate=baudrate)
+    p = SureMark(sim)
+    spooler = Spooler(p, clock=sim.clock, sleep=sim.sleep)
+    spooler.print_job(b'x' * size)
+    return spooler.bytes_per_second() / (baudrate / 10)
+
+
+def best(fn, higher_is_better, repeat=3):
+    # host timings are noisy, the best of a few runs is the most stable figure
+    values = [fn() for _ in range(repeat)]
+    return max(values) if higher_is_better else min(values)
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    results = {}
+    results['receipts_per_second'] = result(bench_receipts(20 // scale or 1), 'receipts/s', True, 'device')
+    results['build_cpu_per_receipt'] = result(
+        best(lambda: bench_build_cpu(2000 // scale), False), 'us', False, 'host')
+    results['parse_rate'] = result(best(lambda: bench_parse(100000 // scale), True), 'messages/s', True, 'host')
+    results['receive_message_rate'] = result(
+        best(lambda: bench_receive(20000 // scale), True), 'messages/s', True, 'host')
+    device, _ = bench_identify(200 // scale)
+    results['identify_latency'] = result(device, 'ms', False, 'device')
+    results['identify_cpu'] = result(
+        best(lambda: bench_identify(200 // scale)[1], False), 'us', False, 'host')
+    results['usage_stats_time'] = result(bench_usage_stats(), 'ms', False, 'device')
+    for baudrate in (9600, 19200, 115200):
+        results['line_efficiency_{}'.format(baudrate)] = result(
+            bench_line_rate(baudrate, 65536 // scale), 'fraction of line rate', True, 'device')
+    import_time, loaded = bench_import()
+    results['import_time'] = result(import_time, 's', False, 'host')
+    return {
+        'import_forbidden_loaded': loaded,
+        'quick': quick,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance, host_tolerance):
+    """
+    Returns a list of (name, baseline value, current value, change) for results that got worse.
+    """
+    regressions = []
+    for name, old in sorted(baseline['results'].items()):
+        new = current['results'].get(name)
+        if new is None or old['value'] == 0:
+            continue
+        change = (new['value'] - old['value']) / old['value']
+        if not old['higher_is_better']:
+            change = -change
+        limit = host_tolerance if old['kind'] == 'host' else tolerance
+        if change < -limit:
+            regressions.append((name, old['value'], new['value'], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for posprinter.suremark')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.02, help='allowed loss for device results')
+    parser.add_argument('--host-tolerance', type=float, default=0.5, help='allowed loss for host results')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='seconds "import posprinter.suremark" may take (default: %(default)s)')
+    args = parser.parse_args()
+
+    # baselines are machine specific, none is shipped
+    if args.compare and not args.save_baseline and not os.path.exists(args.baseline):
+        print('No baseline at {}, record one with --save-baseline first'.format(args.baseline), file=sys.stderr)
+        return 2
+
+    current = run(quick=args.quick)
+    text = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(text + '\n')
+
+    status = 0
+    if current['import_forbidden_loaded']:
+        print('IMPORT posprinter.suremark loads {}'.format(', '.join(current['import_forbidden_loaded'])),
+              file=sys.stderr)
+        status = 1
+    if current['results']['import_time']['value'] > args.import_budget:
+        print('IMPORT posprinter.suremark took {:.1f}ms, budget is {:.1f}ms'.format(
+            current['results']['import_time']['value'] * 1e3, args.import_budget * 1e3), file=sys.stderr)
+        status = 1
+
+    if args.compare:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('quick') != current['quick']:
+            print('Baseline was recorded {} --quick, can\'t compare'.format(
+                'with' if baseline.get('quick') else 'without'), file=sys.stderr)
+            return 2
+        regressions = compare(current, baseline, args.tolerance, args.host_tolerance)
+        for name, old, new, change in regressions:
+            print('REGRESSION {}: {:.4g} -> {:.4g} ({:+.1%})'.format(name, old, new, change), file=sys.stderr)
+        if regressions:
+            return 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -25,12 +25,18 @@ setup(
         'pyserial>=3.4',
     ],
     extras_require={
+        'async': [
+            'pyserial-asyncio',
+        ],
         'dev': [
             'pytest',
         ],
         'docs': [
             'Sphinx>=2.0',
         ],
+        'raster': [
+            'numpy',
+        ],
     },
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
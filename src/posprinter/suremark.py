@@ -1,12 +1,101 @@
 #!/usr/bin/env python3
 
+import contextlib
 import struct
 
-from .suremark_status import PrinterMessage, PrinterID
+from .suremark_batch import CommandBatch
+from .suremark_decoder import ResponseDecoder
+from .suremark_status import PrinterMessage, PrinterID, UsageSnapshot
 
 PRT_DEVICE = '/dev/ttyUSB0'
 PRT_BAUDRATE = 19200
 PRT_TIMEOUT = 5
+#: Initial buffer size of a command batch
+BATCH_CAPACITY = 1024
+
+
+class ReceiveTimeout(ValueError):
+    """
+    Raised by :func:`SureMark.receive_message` when the printer didn't send a complete message in time. It is a
+    ValueError like the errors for broken messages, so existing handlers still catch it.
+    """
+
+
+def mct_counter(m):
+    """
+    Returns the 16 bit counter contained in the MCT response message "m".
+    """
+    if not m.is_mct_response():
+        raise ValueError('Expected an MCT response')
+    if m.payload_length() < 2:
+        raise ValueError('Payload length was {}, expected at least 2'.format(m.payload_length()))
+    return struct.unpack_from('>H', m.payload())[0]
+
+
+def usage_snapshot(messages):
+    """
+    Builds a :class:`UsageSnapshot` from the responses to the requests in
+    :attr:`SureMark.USAGE_SNAPSHOT_STATS`, given in the same order.
+    """
+    values = {}
+    for stat, m in zip(SureMark.USAGE_SNAPSHOT_STATS, messages):
+        values[stat] = mct_counter(m) if m.is_mct_response() and m.payload_length() >= 2 else None
+
+    def combined(stat, remainder_stat, factor):
+        if values[stat] is None or values[remainder_stat] is None:
+            return None
+        return values[stat] * factor + values[remainder_stat]
+
+    chars_low = values[SureMark.STATS_RAW_NUMBER_CHARACTERS_THERMAL_LOW]
+    chars_high = values[SureMark.STATS_RAW_NUMBER_CHARACTERS_THERMAL_HIGH]
+    return UsageSnapshot(
+        manufacture_week=values[SureMark.STATS_RAW_MANUFACTURE_WEEK],
+        paper_cuts=combined(SureMark.STATS_RAW_NUMBER_PAPER_CUTS, SureMark.STATS_RAW_REMAINDER_NUMBER_PAPER_CUTS, 32),
+        failed_paper_cuts=values[SureMark.STATS_RAW_NUMBER_CUTS_FAILED],
+        thermal_motor_steps=combined(SureMark.STATS_RAW_NUMBER_STEPS_THERMAL,
+                                     SureMark.STATS_RAW_REMAINDER_NUMBER_STEPS_THERMAL, 50000),
+        printed_characters_thermal=None if chars_low is None or chars_high is None else (chars_low << 16) | chars_high,
+        thermal_cover_opened=values[SureMark.STATS_RAW_NUMBER_CUST_RECEIPT_COVER_OPENED],
+        barcodes_printed=combined(SureMark.STATS_RAW_NUMBER_BARCODES_PRINTED,
+                                  SureMark.STATS_RAW_REMAINDER_NUMBER_BARCODES_PRINTED, 32),
+        tone_sounds=combined(SureMark.STATS_RAW_NUMBER_TONE_SOUND_COUNT,
+                             SureMark.STATS_RAW_REMAINDER_NUMBER_TONE_SOUND_COUNT, 32),
+        counters=values,
+    )
+
+
+def printer_id(m):
+    """
+    Returns the :class:`PrinterID` contained in the response message "m".
+    """
+    if not m.is_printer_id_response():
+        raise ValueError('Expected a printer id response')
+    if m.payload_length() < 5:
+        raise ValueError('Payload length was {}, expected at least 5'.format(m.payload_length()))
+    return PrinterID(m.raw_payload())
+
+
+def user_flash_size(m):
+    """
+    Returns the user flash size contained in the response message "m".
+    """
+    if not m.is_user_flash_read_response():
+        raise ValueError('Expected a User flash read response')
+    if not m.has_payload():
+        raise ValueError('Payload missing')
+    if m.payload_length() != 8:
+        raise ValueError('Payload length was {}, expected 8'.format(m.payload_length()))
+    # data is sent as ASCII decimal data
+    return int(m.raw_payload())
+
+
+def user_flash_data(m):
+    """
+    Returns the data contained in the user flash read response message "m" as a memoryview.
+    """
+    if not m.is_user_flash_read_response():
+        raise ValueError('Expected a User flash read response')
+    return m.payload()
 
 
 class SureMark:
@@ -18,6 +107,8 @@ class SureMark:
     CMD_RESET_PRINTER = b'\x10\x05\x40'
     #: Request the amount of flash for use by the user
     CMD_RETRIEVE_USER_FLASH_SIZE = b'\x1b\x34\x08\xff\xff\xff'
+    #: Read user flash, requires parameters (count, 3 byte address)
+    CMD_RETRIEVE_USER_FLASH = b'\x1b\x34'
     #: Retrieve usage statistics, requires parameter.
     CMD_RETRIEVE_PRINTER_USAGE_STATISTICS = b'\x1b\x51'
     #: Retrieve the "Printer ID", detailed information about the printer model and its features.
@@ -43,6 +134,8 @@ class SureMark:
     CMD_BARCODE_SET_HRI_POSITION = b'\x1d\x48'
     #: Set the barcode HRI (human readable information) font, requires parameter (font).
     CMD_BARCODE_SET_HRI_FONT = b'\x1d\x66'
+    #: Two dimensional symbol (``GS ( k``), requires parameters (2 byte length, symbol, function, arguments).
+    CMD_2D_SYMBOL = b'\x1d\x28\x6b'
 
     # print etc
     #: Print a line feed (LF) in the selected station.
@@ -96,7 +189,7 @@ class SureMark:
     STATS_RAW_NUMBER_CHARACTERS_IMPACT = b'\x87'
     STATS_RAW_NUMBER_STEPS_IMPACT = b'\x88'
     STATS_RAW_NUMBER_MOTOR_STARTS_IMPACT = b'\x89'
-    STATS_RAW_NUMBER_HOME_ERRORS = '\x8a'
+    STATS_RAW_NUMBER_HOME_ERRORS = b'\x8a'
     STATS_RAW_NUMBER_IMPACT_COVER_OPENED = b'\x8b'
     STATS_RAW_NUMBER_FORMS_INSERTED_IMPACT = b'\x8c'
     STATS_RAW_NUMBER_MICR_READS = b'\x8d'
@@ -128,6 +221,54 @@ class SureMark:
     STATS_RAW_NUMBER_MAX_TEMP = b'\xd9'
     STATS_RAW_REMAINDER_NUMBER_TONE_SOUND_COUNT = b'\xda'
 
+    #: Statistics requested by :func:`SureMark.get_usage_snapshot`, in request order: every MCT counter
+    USAGE_SNAPSHOT_STATS = [
+        STATS_RAW_RUNTIME_IMAGE_BRIGHTNESS_CONTRAST,
+        STATS_RAW_RUNTIME_IMAGE_FOCUS,
+        STATS_RAW_MANUFACTURE_WEEK,
+        STATS_RAW_FRU_CARD_INV_USAGE_COUNTERS,
+        STATS_RAW_NUMBER_PAPER_CUTS,
+        STATS_RAW_NUMBER_CHARACTERS_THERMAL_LOW,
+        STATS_RAW_NUMBER_CHARACTERS_THERMAL_HIGH,
+        STATS_RAW_NUMBER_STEPS_THERMAL,
+        STATS_RAW_NUMBER_CUST_RECEIPT_COVER_OPENED,
+        STATS_RAW_NUMBER_CUTS_FAILED,
+        STATS_RAW_NUMBER_CHARACTERS_IMPACT,
+        STATS_RAW_NUMBER_STEPS_IMPACT,
+        STATS_RAW_NUMBER_MOTOR_STARTS_IMPACT,
+        STATS_RAW_NUMBER_HOME_ERRORS,
+        STATS_RAW_NUMBER_IMPACT_COVER_OPENED,
+        STATS_RAW_NUMBER_FORMS_INSERTED_IMPACT,
+        STATS_RAW_NUMBER_MICR_READS,
+        STATS_RAW_NUMBER_MICR_READS_HIGH_INTERFERENCE,
+        STATS_RAW_NUMBER_MICR_READS_FAILED,
+        STATS_RAW_NUMBER_CHECK_FLIPS,
+        STATS_RAW_NUMBER_CHECK_FLIPS_FAILED,
+        STATS_RAW_REMAINDER_NUMBER_STEPS_THERMAL,
+        STATS_RAW_REMAINDER_NUMBER_PAPER_CUTS,
+        STATS_RAW_REMAINDER_NUMBER_CHARACTERS_IMPACT,
+        STATS_RAW_REMAINDER_NUMBER_STEPS_IMPACT,
+        STATS_RAW_REMAINDER_NUMBER_FORMS_INSERTED_IMPACT,
+        STATS_RAW_REMAINDER_NUMBER_MOTOR_STARTS_IMPACT,
+        STATS_RAW_REMAINDER_NUMBER_CHECK_FLIPS_FAILED,
+        STATS_RAW_REMAINDER_NUMBER_MICR_READS_FAILED,
+        STATS_RAW_REMAINDER_NUMBER_CHECK_FLIPS,
+        STATS_RAW_REMAINDER_NUMBER_MICR_READS,
+        STATS_RAW_REMAINDER_NUMBER_MICR_READS_HIGH_INTERFERENCE,
+        STATS_RAW_REMAINDER_NUMBER_BARCODES_PRINTED,
+        STATS_RAW_REMAINDER_NUMBER_SCANNED_DOCUMENTS,
+        STATS_RAW_REMAINDER_NUMBER_CASH_DRAWER_SUCCESSFUL,
+        STATS_RAW_NUMBER_FLASH_ERASE,
+        STATS_RAW_NUMBER_SCANNED_DOCUMENTS,
+        STATS_RAW_NUMBER_CHECK_QUALITY_COUNT,
+        STATS_RAW_NUMBER_TONE_SOUND_COUNT,
+        STATS_RAW_NUMBER_CASH_DRAWER_SUCCESSFUL,
+        STATS_RAW_NUMBER_CASH_DRAWER_FAILED,
+        STATS_RAW_NUMBER_BARCODES_PRINTED,
+        STATS_RAW_NUMBER_MAX_TEMP,
+        STATS_RAW_REMAINDER_NUMBER_TONE_SOUND_COUNT,
+    ]
+
     # Barcode types
     #: Barcode UPC_A
     BARCODE_UPC_A = b'\x00'
@@ -156,7 +297,8 @@ class SureMark:
     #: Barcode CODE_128B (alias for CODE_128A)
     BARCODE_CODE_128B = BARCODE_CODE_128A
 
-    # TODO BARCODE_PDF417
+    #: Symbol PDF417 for the two dimensional symbol command, see :func:`pdf417`
+    SYMBOL_PDF417 = b'\x30'
 
     # BEEPER
 
@@ -192,7 +334,7 @@ class SureMark:
     ALIGN_POSITIONS_LEFT = b'\x00'
     ALIGN_POSITIONS_CENTER = b'\x01'
     ALIGN_POSITIONS_RIGHT = b'\x02'
-    ALIGN_POSITIONS_COLUMN_RIGHT = '\x04'
+    ALIGN_POSITIONS_COLUMN_RIGHT = b'\x04'
 
     MAX_PRINT_SPEED = b'\x1b\x2f'
     MAX_PRINT_SPEED_52 = b'\x00'
@@ -200,16 +342,24 @@ class SureMark:
     MAX_PRINT_SPEED_26 = b'\x02'
     MAX_PRINT_SPEED_15 = b'\x03'
 
-    def __init__(self, device, model=PrinterID.MODEL_UNKNOWN, debug=False):
+    def __init__(self, device, model=PrinterID.MODEL_UNKNOWN, debug=False, metrics=None, text_encoder=None):
         """
         Initializes the class. This does not send commands to the printer yet.
         Pass an open serial device, or any device that behaves like it. An instance of serial.Serial is assumed, though.
+        ``metrics`` takes a :class:`~posprinter.suremark_metrics.Metrics` instance that records what is exchanged.
+        ``text_encoder`` takes the :class:`~posprinter.suremark_text.TextEncoder` used by :func:`text`, a default one
+        is created when text is first printed.
         """
         if device is None:
             raise ValueError('Can\'t operate without a device')
         self.__device = device
         self.__model = model
         self.__debug = debug
+        self.__batch = None
+        self.__decoder = ResponseDecoder()
+        self.__metrics = metrics
+        self.__text_encoder = text_encoder
+        self.__barcodes = None
 
     def hexdump(s):
         """
@@ -217,19 +367,63 @@ class SureMark:
         """
         print(":".join("{:02x}".format(c) for c in s))
 
+    def write(self, data):
+        """
+        Sends raw data (text or an already built command) to the printer. Inside of a :func:`batch`, the data is
+        collected and sent when the batch ends.
+        """
+        if self.__batch is not None:
+            self.__batch.append(data)
+        else:
+            self.__device.write(data)
+            if self.__metrics is not None:
+                self.__metrics.written(data)
+
+    @contextlib.contextmanager
+    def batch(self, max_write=None, capacity=BATCH_CAPACITY):
+        """
+        Context manager that collects all commands issued within it and sends them in a single write (or in writes of
+        at most ``max_write`` bytes) when the block ends. If the block is left because of an exception, nothing is
+        sent. Nested batches join the outermost one. Reading a message from the printer sends the commands collected
+        so far, as they might trigger the response. Yields the :class:`~posprinter.suremark_batch.CommandBatch`, which
+        reports how many bytes and writes were used::
+
+            with p.batch() as b:
+                p.barcode_set_hri_position(SureMark.BARCODE_HRI_POSITION_BELOW)
+                p.barcode('03600029145', type=SureMark.BARCODE_UPC_A)
+                p.cut()
+            print('{} writes saved'.format(b.writes_saved()))
+        """
+        if self.__batch is not None:
+            yield self.__batch
+            return
+        batch = CommandBatch(self.__device.write, capacity=capacity, max_write=max_write, metrics=self.__metrics)
+        self.__batch = batch
+        try:
+            yield batch
+            self.__batch = None
+            batch.flush()
+        finally:
+            self.__batch = None
+
+    def query_status(self):
+        """
+        Requests a status message from the printer and returns it. The printer ID request is used for this, as it is
+        cheap, has no side effects and is always answered with the full 8 byte status.
+        """
+        self.write(self.CMD_RETRIEVE_PRINTER_ID)
+        return self.receive_message()
+
     def identify(self):
         """
-        Attempts to identify the printer model and capabilities
+        Attempts to identify the printer model and capabilities, returns a :class:`PrinterID`.
         """
-        self.__device.write(self.CMD_RETRIEVE_PRINTER_ID)
-        m = self.receive_message()
-        if not m.is_printer_id_response():
-            raise ValueError('Expected a printer id response')
-        pass
+        self.write(self.CMD_RETRIEVE_PRINTER_ID)
+        return printer_id(self.receive_message())
 
     def beep(self, enable=False, duration=0, note=None, octave=None, volume=None):
         data = bytearray(2 + 1 + 1)
-        data[0:1] = self.CMD_BEEPER
+        data[0:2] = self.CMD_BEEPER
 
         if not isinstance(enable, bool):
             raise TypeError('invalid type for "enable": {}'.format(type(enable)))
@@ -260,27 +454,28 @@ class SureMark:
         data[3] |= note
         data[3] |= (octave << 4)
         data[3] |= (volume << 6)
-        SureMark.hexdump(data)
-        self.__device.write(data)
+        if self.__debug:
+            SureMark.hexdump(data)
+        self.write(data)
 
     def print_line_feed(self):
         """
         Prints the buffer content (if any) and feed the paper by a preset amount
         """
-        self.__device.write(self.CMD_PRINT_LINE_FEED)
+        self.write(self.CMD_PRINT_LINE_FEED)
 
     def print_line_feed_alt(self):
         """
         Alternative to print_line_feed that has to be activated before it can be used
         """
-        self.__device.write(self.CMD_PRINT_LINE_FEED_ALT)
+        self.write(self.CMD_PRINT_LINE_FEED_ALT)
 
     def print_form_feed_cut(self):
         """
         Prints the buffer content (if any) and form-feeds the paper until it exits the feed rollers.
         If the thermal station is selected, cuts the paper
         """
-        self.__device.write(self.CMD_PRINT_FORM_FEED_CUT)
+        self.write(self.CMD_PRINT_FORM_FEED_CUT)
 
     def cut(self):
         """
@@ -288,15 +483,55 @@ class SureMark:
         """
         self.print_form_feed_cut()
 
+    def print_logo(self, slot):
+        """
+        Prints the logo stored in flash slot "slot", see :class:`~posprinter.suremark_flashslots.FlashSlots` for
+        keeping the stored logos up to date.
+        """
+        if slot < 0 or slot > 255:
+            raise ValueError('Logo slot outside allowed range 0 <= slot <= 255')
+        self.write(self.CMD_PRINT_PREDEFINED_LOGO + bytes([slot]))
+
+    def set_code_page(self, page):
+        """
+        Selects the code page "page" for the following text. :func:`text` selects code pages by itself.
+        """
+        if page < 0 or page > 255:
+            raise ValueError('Code page outside allowed range 0 <= page <= 255')
+        self.write(self.CMD_SET_CODE_PAGE + bytes([page]))
+        if self.__text_encoder is not None:
+            self.__text_encoder.reset(page)
+
+    def text(self, text):
+        """
+        Prints the string "text", encoded by the :class:`~posprinter.suremark_text.TextEncoder` of the printer, which
+        selects the code pages its characters need and only sends the set code page command on changes.
+        """
+        if self.__text_encoder is None:
+            from .suremark_text import TextEncoder
+            self.__text_encoder = TextEncoder()
+        self.write(self.__text_encoder.encode(text))
+
     # Barcode handling commands {{{
     def barcode(self, data, type=BARCODE_EAN13):
         """
-        Prints a barcode. Setup for a barcode can be done using the various barcode_set-functions.
+        Prints a barcode. Setup for a barcode can be done using the various barcode_set-functions. The data is
+        validated and check digits are added by the :class:`~posprinter.suremark_barcode.BarcodeBuilder` of the
+        printer, which raises a ValueError for data the printer would reject.
+        """
+        if self.__barcodes is None:
+            from .suremark_barcode import BarcodeBuilder
+            self.__barcodes = BarcodeBuilder()
+        self.write(self.__barcodes.command(data, type))
+
+    def pdf417(self, data, **kwargs):
+        """
+        Prints "data" (bytes or str) as PDF417 symbol, rendered by the printer. See
+        :func:`~posprinter.suremark_barcode.pdf417_commands` for the keyword arguments, which are validated before
+        anything is sent.
         """
-        _data = data.encode('utf-8')
-        if _data[-1] != b'\x00':
-            _data += b'\x00'
-        self.__device.write(self.CMD_BARCODE_PRINT + type + _data)
+        from .suremark_barcode import pdf417_commands
+        self.write(pdf417_commands(data, **kwargs))
 
     def barcode_set_horizontal_size(self, m):
         """
@@ -304,7 +539,7 @@ class SureMark:
         """
         if m < 2 or m > 4:
             raise ValueError('Barcode horizontal size (magnification) outside allowed range 2 <= m <= 4')
-        self.__device.write(self.CMD_BARCODE_SET_HORIZONTAL_SIZE + m)
+        self.write(self.CMD_BARCODE_SET_HORIZONTAL_SIZE + bytes([m]))
 
     def barcode_set_height(self, h):
         """
@@ -312,7 +547,7 @@ class SureMark:
         """
         if h < 1 or h > 255:
             raise ValueError('Barcode height outside allowed range 1 <= h <= 255')
-        self.__device.write(self.CMD_BARCODE_SET_HEIGHT + h)
+        self.write(self.CMD_BARCODE_SET_HEIGHT + bytes([h]))
 
     def barcode_set_hri_position(self, p):
         """
@@ -320,7 +555,7 @@ class SureMark:
         """
         if p < self.BARCODE_HRI_POSITION_NONE or p > self.BARCODE_HRI_POSITION_BOTH:
             raise ValueError('Barcode HRI position invalid')
-        self.__device.write(self.CMD_BARCODE_SET_HRI_POSITION + p)
+        self.write(self.CMD_BARCODE_SET_HRI_POSITION + p)
 
     def barcode_set_hri_font(self, f):
         """
@@ -328,7 +563,7 @@ class SureMark:
         """
         if f not in [self.BARCODE_HRI_FONT_A, self.BARCODE_HRI_FONT_B]:
             raise ValueError('Barcode HRI font invalid')
-        self.__device.write(self.CMD_BARCODE_SET_HRI_FONT + f)
+        self.write(self.CMD_BARCODE_SET_HRI_FONT + f)
 
     # }}}
 
@@ -337,161 +572,124 @@ class SureMark:
         Sets the alignment of text. Note that not all alignments are valid everywhere.
         PDF: Page 140
         '''
-        if align < 0 or align > 2 or align != 4:
+        if align not in [self.ALIGN_POSITIONS_LEFT, self.ALIGN_POSITIONS_CENTER, self.ALIGN_POSITIONS_RIGHT,
+                         self.ALIGN_POSITIONS_COLUMN_RIGHT]:
             raise ValueError('Invalid alignment')
-        return self.CMD_ALIGN_POSITIONS + align
+        self.write(self.ALIGN_POSITIONS + align)
 
     def select_maximum_print_speed(self, speed):
         '''
         Select the maximum print speed.
         PDF: Page 132
         '''
-        if speed < 0 or speed > 3:
+        if speed not in [self.MAX_PRINT_SPEED_52, self.MAX_PRINT_SPEED_35, self.MAX_PRINT_SPEED_26,
+                         self.MAX_PRINT_SPEED_15]:
             raise ValueError('Invalid speed')
-        return self.MAX_PRINT_SPEED + speed
+        self.write(self.MAX_PRINT_SPEED + speed)
 
     def get_printer_usage_stats_raw(self, stat):
         """
         Requests the counter given in "stat". This function does not perform conversions or factors.
         Returns a message object.
         """
-        self.__device.write(self.CMD_RETRIEVE_PRINTER_USAGE_STATISTICS + stat)
+        self.write(self.CMD_RETRIEVE_PRINTER_USAGE_STATISTICS + stat)
         return self.receive_message()
 
+    def _combined_counter(self, stat, remainder_stat, factor, label):
+        """
+        Reads a counter that the printer keeps as a part stored in flash (counting in units of "factor") and a
+        remainder.
+        """
+        flash = mct_counter(self.get_printer_usage_stats_raw(stat))
+        remainder = mct_counter(self.get_printer_usage_stats_raw(remainder_stat))
+        if self.__debug:
+            print('{} (w/o factor): {} flash + {} remainder'.format(label, flash, remainder))
+        return flash * factor + remainder
+
     def get_printer_usage_stat_manufacture_week(self):
         """
         Returns the week of manufacture in the form WWYY, so 2009 is 20th week 2009
         """
         m = self.get_printer_usage_stats_raw(self.STATS_RAW_MANUFACTURE_WEEK)
-        # if m.command_complete():
-        return struct.unpack('>H', m.raw_payload())[0]
-        # raise ValueError('command was not successful')
+        return mct_counter(m)
 
     def get_printer_usage_stat_number_paper_cuts(self):
         """
         Returns the number of paper cuts.
         """
-        FACTOR = 32
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_PAPER_CUTS)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        cuts_flash = struct.unpack('>H', m.raw_payload())[0]
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_REMAINDER_NUMBER_PAPER_CUTS)
-        if not m.is_mct_response():
-            raise ValueError('Expected an MCT response')
-        cuts_remainder = struct.unpack('>H', m.raw_payload())[0]
-        if self.__debug:
-            print('Paper cuts (w/o factor): {} flash + {} remainder'.format(cuts_flash, cuts_remainder))
-        return cuts_flash * FACTOR + cuts_remainder
+        return self._combined_counter(self.STATS_RAW_NUMBER_PAPER_CUTS, self.STATS_RAW_REMAINDER_NUMBER_PAPER_CUTS,
+                                      32, 'Paper cuts')
 
     def get_printer_usage_stat_number_failed_paper_cuts(self):
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_CUTS_FAILED)
-        if not m.is_mct_response():
-            raise ValueError('Expected an MCT response')
-        cuts_failed = struct.unpack('>H', m.raw_payload())[0]
-        return cuts_failed
+        return mct_counter(self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_CUTS_FAILED))
 
     def get_printer_usage_stats_thermal_motor_steps(self):
         """
         Returns te number of steps the motor in the CR (thermal) station performed.
         """
-        FACTOR = 50000
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_STEPS_THERMAL)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        steps_flash = struct.unpack('>H', m.raw_payload())[0]
-
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_REMAINDER_NUMBER_STEPS_THERMAL)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        steps_remainder = struct.unpack('>H', m.raw_payload())[0]
-        if self.__debug:
-            print('Thermal motor steps (w/o factor): {} flash + {} remainder'.format(steps_flash, steps_remainder))
-        return steps_flash * FACTOR + steps_remainder
+        return self._combined_counter(self.STATS_RAW_NUMBER_STEPS_THERMAL,
+                                      self.STATS_RAW_REMAINDER_NUMBER_STEPS_THERMAL, 50000, 'Thermal motor steps')
 
     def get_printer_usage_stats_printed_characters_thermal(self):
         """
         TODO this number seems wrong...
         """
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_CHARACTERS_THERMAL_LOW)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        p_low = m.raw_payload()
-
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_CHARACTERS_THERMAL_HIGH)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        p_high = m.raw_payload()
-
-        return struct.unpack('>I', p_low + p_high)[0]
+        low = mct_counter(self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_CHARACTERS_THERMAL_LOW))
+        high = mct_counter(self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_CHARACTERS_THERMAL_HIGH))
+        return (low << 16) | high
 
     def get_printer_usage_stats_thermal_cover_opened(self):
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_CUST_RECEIPT_COVER_OPENED)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        return struct.unpack('>H', m.raw_payload())[0]
+        return mct_counter(self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_CUST_RECEIPT_COVER_OPENED))
 
     def get_printer_usage_stats_barcodes_printed(self):
-        FACTOR = 32
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_BARCODES_PRINTED)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        barcodes_flash = struct.unpack('>H', m.raw_payload())[0]
-
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_REMAINDER_NUMBER_BARCODES_PRINTED)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        barcodes_remainder = struct.unpack('>H', m.raw_payload())[0]
-        if self.__debug:
-            print('Barcodes printed (w/o factor): {} flash + {} remainder'.format(barcodes_flash, barcodes_remainder))
-        return barcodes_flash * FACTOR + barcodes_remainder
+        return self._combined_counter(self.STATS_RAW_NUMBER_BARCODES_PRINTED,
+                                      self.STATS_RAW_REMAINDER_NUMBER_BARCODES_PRINTED, 32, 'Barcodes printed')
 
     def get_printer_usage_stats_tone_sounds(self):
-        FACTOR = 32
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_NUMBER_TONE_SOUND_COUNT)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        tones_flash = struct.unpack('>H', m.raw_payload())[0]
-
-        m = self.get_printer_usage_stats_raw(self.STATS_RAW_REMAINDER_NUMBER_TONE_SOUND_COUNT)
-        if not m.is_mct_response():
-            raise ValueError('Excpected an MCT response')
-        tones_remainder = struct.unpack('>H', m.raw_payload())[0]
-        if self.__debug:
-            print('Tone sounds (w/o factor): {} flash + {} remainder'.format(tones_flash, tones_remainder))
-        return tones_flash * FACTOR + tones_remainder
+        return self._combined_counter(self.STATS_RAW_NUMBER_TONE_SOUND_COUNT,
+                                      self.STATS_RAW_REMAINDER_NUMBER_TONE_SOUND_COUNT, 32, 'Tone sounds')
+
+    def get_usage_snapshot(self):
+        """
+        Reads all usage statistics at once and returns a :class:`UsageSnapshot`. All requests are sent in a single
+        write, then the responses are read in order, so the time needed depends on the amount of data rather than on
+        the number of round trips.
+        """
+        with self.batch():
+            for stat in self.USAGE_SNAPSHOT_STATS:
+                self.write(self.CMD_RETRIEVE_PRINTER_USAGE_STATISTICS + stat)
+        # read all responses before interpreting them, so an unexpected one doesn't leave the rest in the buffer
+        messages = [self.receive_message() for _ in self.USAGE_SNAPSHOT_STATS]
+        return usage_snapshot(messages)
 
     def get_user_flash_storage_size(self):
         """
         Requests that the printer responds with the size of its flash available to users.
         Unit is bytes
         """
-        self.__device.write(self.CMD_RETRIEVE_USER_FLASH_SIZE)
-        m = self.receive_message()
-        if not m.is_user_flash_read_response():
-            raise ValueError('Expected a User flash read response')
-        if m.has_payload():
-            if m.payload_length() != 8:
-                raise ValueError('Payload length was {}, expected 8'.format(m.payload_length()))
+        self.write(self.CMD_RETRIEVE_USER_FLASH_SIZE)
+        return user_flash_size(self.receive_message())
 
-            # data is sent as ASCII decimal data
-            return int(m.raw_payload())
-        else:
-            raise ValueError('Payload missing')
-
-#    def dump_flash(self):
-#        """
-#        This issues a dump of the entire user flash of the printer.
-#        """
-#        size = self.get_user_flash_storage_size()
-#        addr = 0
-#        count = 100
-#        buf = None
-#        while addr < size:
-#            print('addr: {:02X}, count: {}, size: {}'.format(addr, count, size))
-#            (m, b) = retrieve_flash_storage(count, addr)
-#            print('Read {} bytes'.format(len(b)))
-#            addr +=
+    def dump_flash(self, path, **kwargs):
+        """
+        Dumps the entire user flash of the printer to the file "path", see
+        :class:`~posprinter.suremark_flash.FlashDumper` for the keyword arguments. An interrupted dump is resumed when
+        called again. Returns the number of bytes read.
+        """
+        from .suremark_flash import FlashDumper
+        return FlashDumper(self, path, **kwargs).run()
+
+    def request_flash_storage(self, count, addr):
+        """
+        Sends the request for 'count' bytes beginning at address 'addr' without waiting for the response. Several
+        requests can be sent before reading the responses with :func:`receive_message`.
+        """
+        if count < 1 or count > 0xff:
+            raise ValueError('count must be between 1 and 255')
+        # addresses are 24 bit, 0xffffff requests the flash size instead (see get_user_flash_storage_size)
+        if addr < 0 or addr == 0xffffff or addr + count > 0x1000000:
+            raise ValueError('Address out of range')
+        self.write(self.CMD_RETRIEVE_USER_FLASH + bytes([count]) + addr.to_bytes(3, 'big'))
 
     def retrieve_flash_storage(self, count=100, addr=0):
         """
@@ -499,23 +697,41 @@ class SureMark:
         IBM suggests that the amount of data requested to be held below 200 bytes, at least for rs-485 connected printers.
         You can retrieve the amount of flash storage present by calling "get_user_flash_storage_size".
         """
-        pass
+        self.request_flash_storage(count, addr)
+        data = user_flash_data(self.receive_message())
+        if len(data) != count:
+            raise ValueError('Received {} bytes of flash data, expected {}'.format(len(data), count))
+        return data.tobytes()
 
     def receive_message(self):
         """
         Assuming that a command has been sent that triggers a response from the printer, this function retrieves it
         and returns a PrinterMessage object that represents the message. Note that the message size reported by the
-        printer is discarded.
-        """
-        length_bytes = self.__device.read(2)
-        if len(length_bytes) != 2:
-            raise ValueError('Did not receive 2 length-bytes, read {} instead'.format(len(length_bytes)))
-        message_length = struct.unpack('>H', length_bytes)[0]
+        printer is discarded. Responses that are already buffered (when several requests were sent at once) are
+        returned in order.
+        """
+        if self.__batch is not None:
+            self.__batch.flush()
+        while True:
+            frame = self.__decoder.next_frame()
+            if frame is not None:
+                break
+            # only read what the current message needs, so a blocking read doesn't wait for more
+            if self.__decoder.readinto(self.__device) == 0:
+                buffered = len(self.__decoder)
+                self.__decoder.reset()
+                if self.__metrics is not None:
+                    self.__metrics.timed_out()
+                raise ReceiveTimeout('Timeout while receiving a message, {} bytes were received'.format(buffered))
 
         if self.__debug:
-            print('Message length: {}'.format(message_length))
-        buf = self.__device.read(message_length - 2)    # we've already read the first two bytes, they're included in the message length
+            print('Message length: {}'.format(len(frame) + 2))
+        # copy, the decoders buffer is reused for the next message
+        buf = bytes(frame)
         if self.__debug:
             print('RAW MESSAGE: ', end='')
             SureMark.hexdump(buf)
-        return PrinterMessage(buf, debug=self.__debug)
+        m = PrinterMessage(buf, debug=self.__debug)
+        if self.__metrics is not None:
+            self.__metrics.received(m, len(buf) + 2)
+        return m
@@ -0,0 +1,301 @@
+#
+# asyncio based client for SureMark printers
+#
+
+import asyncio
+import collections
+
+from .suremark import (SureMark, PRT_BAUDRATE, PRT_TIMEOUT, mct_counter, printer_id, usage_snapshot, user_flash_data,
+                       user_flash_size)
+from .suremark_decoder import ResponseDecoder
+from .suremark_status import PrinterMessage
+
+#: Maximum number of bytes read from the transport at once
+READ_SIZE = 4096
+
+
+class _StreamDevice:
+    """
+    Device for the embedded :class:`~posprinter.suremark.SureMark` that hands written data to an asyncio transport.
+    Reading is done by :class:`AsyncSureMark` itself.
+    """
+
+    def __init__(self, writer):
+        self.__writer = writer
+
+    def write(self, data):
+        # the transport may keep a reference, and batch buffers are reused
+        self.__writer.write(bytes(data))
+        return len(data)
+
+    def read(self, size=1):
+        raise RuntimeError('AsyncSureMark reads asynchronously')
+
+
+class AsyncSureMark:
+    """
+    asyncio version of :class:`~posprinter.suremark.SureMark`, driven by an ``asyncio.StreamReader`` /
+    ``asyncio.StreamWriter`` pair, for example from ``serial_asyncio.open_serial_connection`` (see :func:`open`).
+
+    Commands that only send data (the ``SureMark`` methods in :attr:`COMMANDS`, such as ``beep``, ``barcode``,
+    ``cut`` and ``batch``) are the same as in ``SureMark`` and are queued in the transport without blocking, use
+    :func:`drain` to wait until they are written. Everything that reads a response from the printer is a coroutine and
+    takes a ``timeout`` (seconds for the whole operation) and a ``deadline`` (absolute time of the event loop clock).
+    Other ``SureMark`` methods raise an AttributeError. Requests may be issued concurrently, they are sent right away
+    (not as part of a batch) and the printer answers them in order. A response whose request has been cancelled is
+    discarded when it arrives. A single event loop can drive as many printers as needed.
+
+    The printer may never answer a request that timed out, so the responses after it can't be assigned to the
+    requests anymore: when a request times out, all other outstanding requests fail with an
+    ``asyncio.TimeoutError`` as well. Responses of a different type than the oldest outstanding request expects are
+    late answers to such requests and are dropped.
+    """
+
+    #: ``SureMark`` methods that only send data and can be called on the client
+    COMMANDS = frozenset([
+        'write', 'batch', 'beep', 'print_line_feed', 'print_line_feed_alt', 'print_form_feed_cut', 'cut', 'print_logo',
+        'set_code_page', 'text', 'barcode', 'pdf417', 'barcode_set_horizontal_size', 'barcode_set_height',
+        'barcode_set_hri_position', 'barcode_set_hri_font', 'align_positions', 'select_maximum_print_speed',
+    ])
+
+    # response type flag expected for a request, by the start of the command
+    _RESPONSES = (
+        (SureMark.CMD_RETRIEVE_PRINTER_ID, PrinterMessage.STATUS_PRINTER_ID_RESPONSE),
+        (SureMark.CMD_RETRIEVE_PRINTER_USAGE_STATISTICS, PrinterMessage.STATUS_MCT_RESPONSE),
+        (SureMark.CMD_RETRIEVE_USER_FLASH, PrinterMessage.STATUS_USER_FLASH_READ_RESPONSE),
+    )
+
+    def __init__(self, reader, writer, debug=False, metrics=None):
+        """
+        ``metrics`` takes a :class:`~posprinter.suremark_metrics.Metrics` instance, see
+        :class:`~posprinter.suremark.SureMark`.
+        """
+        self.__reader = reader
+        self.__writer = writer
+        self.__printer = SureMark(_StreamDevice(writer), debug=debug, metrics=metrics)
+        self.__debug = debug
+        self.__metrics = metrics
+        self.__pending = collections.deque()
+        self.__decoder = ResponseDecoder()
+        self.__read_task = None
+
+    @classmethod
+    async def open(cls, url, baudrate=PRT_BAUDRATE, debug=False, metrics=None, **kwargs):
+        """
+        Opens the serial port ``url`` using ``pyserial-asyncio`` and returns the client.
+        """
+        try:
+            import serial_asyncio
+        except ImportError:
+            raise ImportError('AsyncSureMark.open requires the "pyserial-asyncio" package')
+        reader, writer = await serial_asyncio.open_serial_connection(url=url, baudrate=baudrate, **kwargs)
+        return cls(reader, writer, debug=debug, metrics=metrics)
+
+    def __getattr__(self, name):
+        if name in self.COMMANDS or name.isupper():
+            return getattr(self.__printer, name)
+        raise AttributeError('{} is not available on {}'.format(name, type(self).__name__))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """
+        Stops reading, fails outstanding requests and closes the transport.
+        """
+        if self.__read_task is not None:
+            self.__read_task.cancel()
+            try:
+                await self.__read_task
+            except asyncio.CancelledError:
+                pass
+            self.__read_task = None
+        self.__fail_pending(ConnectionError('Printer connection closed'))
+        self.__writer.close()
+
+    async def drain(self):
+        """
+        Waits until the transport buffer has been flushed.
+        """
+        await self.__writer.drain()
+
+    def __fail_pending(self, exc):
+        while self.__pending:
+            fut, _ = self.__pending.popleft()
+            if not fut.done():
+                fut.set_exception(exc)
+
+    async def __read_loop(self):
+        # a single reader keeps the framing intact no matter which requests get cancelled
+        try:
+            while True:
+                data = await self.__reader.read(READ_SIZE)
+                if not data:
+                    raise ConnectionError('Printer connection closed')
+                self.__decoder.feed(data)
+                while True:
+                    frame = self.__decoder.next_frame()
+                    if frame is None:
+                        break
+                    # copy, the decoders buffer is reused
+                    buf = bytes(frame)
+                    if self.__debug:
+                        print('RAW MESSAGE: ', end='')
+                        SureMark.hexdump(buf)
+                    m = PrinterMessage(buf, debug=self.__debug)
+                    if self.__metrics is not None:
+                        self.__metrics.received(m, len(buf) + 2)
+                    if not self.__pending:
+                        # late answer to a request that timed out
+                        continue
+                    fut, response = self.__pending[0]
+                    if response and m.status() & response == 0:
+                        continue
+                    self.__pending.popleft()
+                    # if the request was cancelled, its response is dropped
+                    if not fut.done():
+                        fut.set_result(m)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.__fail_pending(e)
+            self.__read_task = None
+
+    def __timeout(self, timeout, deadline):
+        if deadline is not None:
+            remaining = deadline - asyncio.get_event_loop().time()
+            if timeout is None or remaining < timeout:
+                timeout = max(0, remaining)
+        return timeout
+
+    def _expect_response(self, response=0):
+        """
+        Registers a response that is expected after sending a request, returns the future receiving it. ``response``
+        is the response type flag of :class:`~posprinter.suremark_status.PrinterMessage` the response must have, 0
+        for any response.
+        """
+        if self.__read_task is None:
+            self.__read_task = asyncio.ensure_future(self.__read_loop())
+        fut = asyncio.get_event_loop().create_future()
+        self.__pending.append((fut, response))
+        return fut
+
+    async def receive_message(self, timeout=PRT_TIMEOUT, deadline=None):
+        """
+        Waits for the next response of the printer, to a command sent before using :func:`write`.
+        """
+        fut = self._expect_response()
+        return await self.__wait(fut, timeout, deadline)
+
+    async def __wait(self, fut, timeout, deadline):
+        try:
+            return await asyncio.wait_for(fut, self.__timeout(timeout, deadline))
+        except asyncio.TimeoutError:
+            # the responses still to come can't be assigned anymore
+            self.__fail_pending(asyncio.TimeoutError('An earlier request timed out'))
+            if self.__metrics is not None:
+                self.__metrics.timed_out()
+            raise
+
+    async def request(self, command, timeout=PRT_TIMEOUT, deadline=None):
+        """
+        Sends "command", which has to make the printer respond, and returns the response message.
+        """
+        response = 0
+        for prefix, flag in self._RESPONSES:
+            if command.startswith(prefix):
+                response = flag
+                break
+        fut = self._expect_response(response)
+        if self.__metrics is not None:
+            self.__metrics.written(command)
+        self.__writer.write(command)
+        return await self.__wait(fut, timeout, deadline)
+
+    async def query_status(self, timeout=PRT_TIMEOUT, deadline=None):
+        """
+        Requests a status message, see :func:`~posprinter.suremark.SureMark.query_status`.
+        """
+        return await self.request(SureMark.CMD_RETRIEVE_PRINTER_ID, timeout, deadline)
+
+    async def identify(self, timeout=PRT_TIMEOUT, deadline=None):
+        """
+        Returns the :class:`~posprinter.suremark_status.PrinterID` of the printer.
+        """
+        return printer_id(await self.request(SureMark.CMD_RETRIEVE_PRINTER_ID, timeout, deadline))
+
+    async def get_printer_usage_stats_raw(self, stat, timeout=PRT_TIMEOUT, deadline=None):
+        """
+        Requests the counter given in "stat" and returns the message, see
+        :func:`~posprinter.suremark.SureMark.get_printer_usage_stats_raw`.
+        """
+        return await self.request(SureMark.CMD_RETRIEVE_PRINTER_USAGE_STATISTICS + stat, timeout, deadline)
+
+    async def _counters(self, stats, timeout, deadline):
+        # all requests are sent at once, the responses arrive in order
+        futs = [self.get_printer_usage_stats_raw(stat, timeout, deadline) for stat in stats]
+        messages = await asyncio.gather(*futs)
+        return [mct_counter(m) for m in messages]
+
+    async def _combined_counter(self, stat, remainder_stat, factor, timeout, deadline):
+        flash, remainder = await self._counters([stat, remainder_stat], timeout, deadline)
+        return flash * factor + remainder
+
+    async def get_printer_usage_stat_manufacture_week(self, timeout=PRT_TIMEOUT, deadline=None):
+        m = await self.get_printer_usage_stats_raw(SureMark.STATS_RAW_MANUFACTURE_WEEK, timeout, deadline)
+        return mct_counter(m)
+
+    async def get_printer_usage_stat_number_paper_cuts(self, timeout=PRT_TIMEOUT, deadline=None):
+        return await self._combined_counter(SureMark.STATS_RAW_NUMBER_PAPER_CUTS,
+                                            SureMark.STATS_RAW_REMAINDER_NUMBER_PAPER_CUTS, 32, timeout, deadline)
+
+    async def get_printer_usage_stat_number_failed_paper_cuts(self, timeout=PRT_TIMEOUT, deadline=None):
+        return (await self._counters([SureMark.STATS_RAW_NUMBER_CUTS_FAILED], timeout, deadline))[0]
+
+    async def get_printer_usage_stats_thermal_motor_steps(self, timeout=PRT_TIMEOUT, deadline=None):
+        return await self._combined_counter(SureMark.STATS_RAW_NUMBER_STEPS_THERMAL,
+                                            SureMark.STATS_RAW_REMAINDER_NUMBER_STEPS_THERMAL, 50000, timeout, deadline)
+
+    async def get_printer_usage_stats_printed_characters_thermal(self, timeout=PRT_TIMEOUT, deadline=None):
+        low, high = await self._counters([SureMark.STATS_RAW_NUMBER_CHARACTERS_THERMAL_LOW,
+                                          SureMark.STATS_RAW_NUMBER_CHARACTERS_THERMAL_HIGH], timeout, deadline)
+        return (low << 16) | high
+
+    async def get_printer_usage_stats_thermal_cover_opened(self, timeout=PRT_TIMEOUT, deadline=None):
+        return (await self._counters([SureMark.STATS_RAW_NUMBER_CUST_RECEIPT_COVER_OPENED], timeout, deadline))[0]
+
+    async def get_printer_usage_stats_barcodes_printed(self, timeout=PRT_TIMEOUT, deadline=None):
+        return await self._combined_counter(SureMark.STATS_RAW_NUMBER_BARCODES_PRINTED,
+                                            SureMark.STATS_RAW_REMAINDER_NUMBER_BARCODES_PRINTED, 32, timeout, deadline)
+
+    async def get_printer_usage_stats_tone_sounds(self, timeout=PRT_TIMEOUT, deadline=None):
+        return await self._combined_counter(SureMark.STATS_RAW_NUMBER_TONE_SOUND_COUNT,
+                                            SureMark.STATS_RAW_REMAINDER_NUMBER_TONE_SOUND_COUNT, 32, timeout, deadline)
+
+    async def get_usage_snapshot(self, timeout=PRT_TIMEOUT, deadline=None):
+        """
+        Reads all usage statistics at once, see :func:`~posprinter.suremark.SureMark.get_usage_snapshot`.
+        """
+        futs = [self.get_printer_usage_stats_raw(stat, timeout, deadline) for stat in SureMark.USAGE_SNAPSHOT_STATS]
+        return usage_snapshot(await asyncio.gather(*futs))
+
+    async def get_user_flash_storage_size(self, timeout=PRT_TIMEOUT, deadline=None):
+        return user_flash_size(await self.request(SureMark.CMD_RETRIEVE_USER_FLASH_SIZE, timeout, deadline))
+
+    async def retrieve_flash_storage(self, count=100, addr=0, timeout=PRT_TIMEOUT, deadline=None):
+        """
+        Retrieves "count" bytes of the user flash beginning at address "addr", see
+        :func:`~posprinter.suremark.SureMark.retrieve_flash_storage`.
+        """
+        if count < 1 or count > 0xff:
+            raise ValueError('count must be between 1 and 255')
+        if addr < 0 or addr == 0xffffff or addr + count > 0x1000000:
+            raise ValueError('Address out of range')
+        command = SureMark.CMD_RETRIEVE_USER_FLASH + bytes([count]) + addr.to_bytes(3, 'big')
+        data = user_flash_data(await self.request(command, timeout, deadline))
+        if len(data) != count:
+            raise ValueError('Received {} bytes of flash data, expected {}'.format(len(data), count))
+        return data.tobytes()
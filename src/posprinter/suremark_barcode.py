@@ -0,0 +1,421 @@
+#
+# Validation and encoding of barcode data
+#
+
+import collections
+
+from .suremark import SureMark
+from .suremark_raster import PAPER_80MM_DOTS
+
+_DIGITS = frozenset('0123456789')
+_CODE39 = frozenset('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-. $/+%')
+_CODABAR = frozenset('0123456789-$:/.+ABCD')
+
+#: Code 128 subsets
+CODE128_A = 'A'
+CODE128_B = 'B'
+CODE128_C = 'C'
+
+
+def gs1_check_digit(digits):
+    """
+    Returns the GS1 (modulo 10) check digit for the string of digits "digits", as used by EAN-13, EAN-8, UPC-A and
+    ITF-14.
+    """
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        total += int(d) * (3 if i % 2 == 0 else 1)
+    return str((10 - total % 10) % 10)
+
+
+def upc_e_to_upc_a(digits):
+    """
+    Expands the UPC-E number "digits" (number system and six digits, without check digit) to the eleven digits of
+    the UPC-A number it stands for.
+    """
+    ns, d = digits[0], digits[1:7]
+    last = d[5]
+    if last in '012':
+        return ns + d[0:2] + last + '0000' + d[2:5]
+    if last == '3':
+        return ns + d[0:3] + '00000' + d[3:5]
+    if last == '4':
+        return ns + d[0:4] + '00000' + d[4]
+    return ns + d[0:5] + '0000' + last
+
+
+def _digits(data, name):
+    if not data or not set(data) <= _DIGITS:
+        raise ValueError('{} data must consist of digits'.format(name))
+
+
+def _with_check_digit(data, name, length):
+    # "length" digits without check digit: append it, with check digit: verify it
+    _digits(data, name)
+    if len(data) == length:
+        return data + gs1_check_digit(data)
+    if len(data) == length + 1:
+        if gs1_check_digit(data[:-1]) != data[-1]:
+            raise ValueError('{} check digit of "{}" is wrong, expected {}'.format(
+                name, data, gs1_check_digit(data[:-1])))
+        return data
+    raise ValueError('{} data must have {} or {} digits'.format(name, length, length + 1))
+
+
+def _upc_e(data):
+    _digits(data, 'UPC-E')
+    if len(data) == 6:
+        data = '0' + data
+    if len(data) not in (7, 8) or data[0] not in '01':
+        raise ValueError('UPC-E data must have 6 digits, or 7 or 8 with number system 0 or 1')
+    check = gs1_check_digit(upc_e_to_upc_a(data))
+    if len(data) == 8 and data[7] != check:
+        raise ValueError('UPC-E check digit of "{}" is wrong, expected {}'.format(data, check))
+    return data[:7] + check
+
+
+def _itf(data):
+    # ITF encodes pairs of digits, an odd number of digits gets the check digit that makes it even (ITF-14)
+    _digits(data, 'ITF')
+    if len(data) % 2:
+        data += gs1_check_digit(data)
+    return data
+
+
+def _charset(allowed, name):
+    def validate(data):
+        if not data:
+            raise ValueError('{} data is empty'.format(name))
+        bad = set(data) - allowed
+        if bad:
+            raise ValueError('{} data contains invalid characters: {}'.format(name, ''.join(sorted(bad))))
+        return data
+    return validate
+
+
+def _ascii(name):
+    def validate(data):
+        if not data:
+            raise ValueError('{} data is empty'.format(name))
+        if any(c < '\x01' or c > '\x7f' for c in data):
+            raise ValueError('{} data must be ASCII without NUL'.format(name))
+        return data
+    return validate
+
+
+_VALIDATORS = {
+    SureMark.BARCODE_UPC_A: lambda data: _with_check_digit(data, 'UPC-A', 11),
+    SureMark.BARCODE_UPC_E: _upc_e,
+    SureMark.BARCODE_EAN13: lambda data: _with_check_digit(data, 'EAN-13', 12),
+    SureMark.BARCODE_EAN8: lambda data: _with_check_digit(data, 'EAN-8', 7),
+    SureMark.BARCODE_CODE_39: _charset(_CODE39, 'Code 39'),
+    SureMark.BARCODE_ITF: _itf,
+    SureMark.BARCODE_CODABAR: _charset(_CODABAR, 'Codabar'),
+    SureMark.BARCODE_CODE_93: _ascii('Code 93'),
+    SureMark.BARCODE_CODE_128A: _ascii('Code 128'),
+    SureMark.BARCODE_CODE_128C: _ascii('Code 128'),
+}
+
+
+def validate(data, type):
+    """
+    Checks "data" for the barcode type "type" (one of the ``BARCODE_*`` types of
+    :class:`~posprinter.suremark.SureMark`) and returns it as it is to be sent. The check digit is appended to
+    EAN/UPC data given without it, and verified otherwise. ITF data with an odd number of digits gets a check digit.
+    Raises a ValueError if the data can't be printed.
+    """
+    validator = _VALIDATORS.get(type)
+    if validator is None:
+        raise ValueError('Unknown barcode type {!r}'.format(type))
+    return validator(data)
+
+
+def _code128_fits(c, subset):
+    if subset == CODE128_A:
+        return c < '\x60'
+    return c >= ' '
+
+
+def code128_segments(data):
+    """
+    Splits the ASCII string "data" into the Code 128 subsets that need the fewest symbols, returned as a list of
+    (subset, text) pairs. Runs of digits use subset C, which encodes two digits per symbol.
+
+    This is only a plan: the SureMark barcode command takes a single type, so switching subsets within a symbol
+    can't be requested and :class:`BarcodeBuilder` sends the subset chosen by :func:`code128_subset`.
+    """
+    n = len(data)
+    subsets = (CODE128_A, CODE128_B, CODE128_C)
+    infinite = 2 * n + 4
+    # cost[i][s]: fewest symbols (start and switches included) to encode data[:i] ending in subset s
+    cost = [dict((s, infinite) for s in subsets) for _ in range(n + 1)]
+    back = [dict() for _ in range(n + 1)]
+    for s in subsets:
+        cost[0][s] = 1
+    for i in range(n + 1):
+        # switching at position i costs one symbol
+        best = min(subsets, key=lambda s: cost[i][s])
+        for s in subsets:
+            if cost[i][best] + 1 < cost[i][s]:
+                cost[i][s] = cost[i][best] + 1
+                back[i][s] = (i, best)
+        if i == n:
+            break
+        for s in subsets:
+            if s == CODE128_C:
+                if data[i] in _DIGITS and i + 1 < n and data[i + 1] in _DIGITS:
+                    j = i + 2
+                else:
+                    continue
+            elif _code128_fits(data[i], s):
+                j = i + 1
+            else:
+                continue
+            if cost[i][s] + 1 < cost[j][s]:
+                cost[j][s] = cost[i][s] + 1
+                back[j][s] = (i, s)
+    end = min(subsets, key=lambda s: (cost[n][s], s != CODE128_C))
+    if cost[n][end] >= infinite:
+        raise ValueError('Code 128 data must be ASCII without NUL')
+    # walk back, collecting the characters per subset
+    segments = []
+    i, s = n, end
+    while i > 0:
+        prev_i, prev_s = back[i][s]
+        if prev_s == s:
+            if segments and segments[-1][0] == s:
+                segments[-1][1].insert(0, data[prev_i:i])
+            else:
+                segments.append((s, [data[prev_i:i]]))
+        i, s = prev_i, prev_s
+    segments.reverse()
+    return [(s, ''.join(parts)) for s, parts in segments]
+
+
+def code128_subset(data):
+    """
+    Returns the Code 128 subset :class:`BarcodeBuilder` sends "data" in: :data:`CODE128_C` if it consists of pairs of
+    digits, :data:`CODE128_A` (the printer's A/B type) otherwise.
+    """
+    if data and len(data) % 2 == 0 and all(c in _DIGITS for c in data):
+        return CODE128_C
+    return CODE128_A
+
+
+def code128_width(data):
+    """
+    Returns the width of the Code 128 symbol for "data" in modules (without quiet zones), in the single subset
+    chosen by :func:`code128_subset`, as it is printed.
+    """
+    # the start symbol and the data
+    symbols = 1 + (len(data) // 2 if code128_subset(data) == CODE128_C else len(data))
+    # each symbol and the check symbol take 11 modules, the stop pattern 13
+    return (symbols + 1) * 11 + 13
+
+
+class BarcodeBuilder:
+    """
+    Builds the complete print command for a barcode, validating the data (see :func:`validate`) before anything is
+    sent, so bad data raises a ValueError instead of being rejected by the printer. For Code 128, the type is chosen
+    from the data: :attr:`~posprinter.suremark.SureMark.BARCODE_CODE_128C` if it consists of pairs of digits, which
+    halves the number of symbols, the printer's A/B type otherwise. The commands for the last ``cache_size`` distinct
+    barcodes are kept, so repeated SKUs are built once.
+    """
+
+    def __init__(self, cache_size=256):
+        self.__cache_size = cache_size
+        self.__cache = collections.OrderedDict()
+        #: Number of commands answered from the cache
+        self.hits = 0
+        #: Number of commands built
+        self.misses = 0
+
+    def command(self, data, type=SureMark.BARCODE_EAN13):
+        """
+        Returns the command that prints "data" (str or bytes) as barcode of type "type".
+        """
+        if isinstance(data, bytearray):
+            # mutable, so not usable as cache key
+            data = bytes(data)
+        key = (type, data)
+        command = self.__cache.get(key)
+        if command is not None:
+            self.__cache.move_to_end(key)
+            self.hits += 1
+            return command
+        self.misses += 1
+        command = self.__build(data, type)
+        self.__cache[key] = command
+        if len(self.__cache) > self.__cache_size:
+            self.__cache.popitem(last=False)
+        return command
+
+    @staticmethod
+    def __build(data, type):
+        if isinstance(data, (bytes, bytearray)):
+            try:
+                data = bytes(data).decode('ascii')
+            except UnicodeDecodeError:
+                raise ValueError('Barcode data must be ASCII')
+        data = validate(data, type)
+        if type in (SureMark.BARCODE_CODE_128A, SureMark.BARCODE_CODE_128C):
+            if code128_subset(data) == CODE128_C:
+                type = SureMark.BARCODE_CODE_128C
+            elif type == SureMark.BARCODE_CODE_128C:
+                raise ValueError('Code 128C data must be an even number of digits')
+        return SureMark.CMD_BARCODE_PRINT + type + data.encode('ascii') + b'\x00'
+
+
+#: Estimated dimensions of a two dimensional symbol, width and height in dots
+SymbolSize = collections.namedtuple('SymbolSize', ['columns', 'rows', 'codewords', 'width', 'height'])
+
+# PDF417 functions of the two dimensional symbol command
+_PDF417_COLUMNS = b'\x41'
+_PDF417_ROWS = b'\x42'
+_PDF417_MODULE_WIDTH = b'\x43'
+_PDF417_ROW_HEIGHT = b'\x44'
+_PDF417_ERROR_CORRECTION = b'\x45'
+_PDF417_OPTIONS = b'\x46'
+_PDF417_STORE = b'\x50'
+_PDF417_PRINT = b'\x51'
+
+_PDF417_MAX_CODEWORDS = 928
+_PDF417_TEXT = frozenset(range(0x20, 0x7f)) | {0x09, 0x0a, 0x0d}
+
+# text compaction submodes and their characters
+_ALPHA = 'A'
+_LOWER = 'L'
+_MIXED = 'M'
+_PUNCT = 'P'
+_PDF417_SUBMODES = (
+    (_ALPHA, frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ ')),
+    (_LOWER, frozenset(b'abcdefghijklmnopqrstuvwxyz ')),
+    (_MIXED, frozenset(b'0123456789&\r\t,:#-.$/+%*=^ ')),
+    (_PUNCT, frozenset(b';<>@[\\]_`~!\r\t,:\n-.$/"|*()?{}\'')),
+)
+_PDF417_SUBMODE_CHARS = dict(_PDF417_SUBMODES)
+# number of latch codes from one submode to another
+_PDF417_LATCHES = {
+    _ALPHA: {_LOWER: 1, _MIXED: 1, _PUNCT: 2},
+    _LOWER: {_ALPHA: 2, _MIXED: 1, _PUNCT: 2},
+    _MIXED: {_ALPHA: 1, _LOWER: 1, _PUNCT: 1},
+    _PUNCT: {_ALPHA: 1, _LOWER: 2, _MIXED: 2},
+}
+
+
+def _pdf417_text_values(data):
+    # number of text compaction values (two per codeword) for "data", latching to the submode of the next
+    # character, or shifting for a single punctuation character or an upper case one among lower case
+    submode = _ALPHA
+    values = 0
+    for i, b in enumerate(data):
+        if b in _PDF417_SUBMODE_CHARS[submode]:
+            values += 1
+            continue
+        following = data[i + 1] if i + 1 < len(data) else None
+        options = [s for s, chars in _PDF417_SUBMODES if b in chars]
+        target = min(options, key=lambda s: _PDF417_LATCHES[submode][s])
+        chars = _PDF417_SUBMODE_CHARS[target]
+        if submode != _PUNCT and target == _PUNCT and following not in chars:
+            values += 2
+        elif submode == _LOWER and target == _ALPHA and following not in chars:
+            values += 2
+        else:
+            values += _PDF417_LATCHES[submode][target] + 1
+            submode = target
+    return values
+
+
+def _pdf417_codewords(data):
+    # number of data codewords, for the compaction mode that fits all of "data" (the printer may do better by
+    # switching modes), plus the length descriptor
+    n = len(data)
+    if n and all(0x30 <= b <= 0x39 for b in data):
+        # numeric: 44 digits in 15 codewords
+        full, rest = divmod(n, 44)
+        return 2 + full * 15 + (rest // 3 + 1 if rest else 0)
+    if all(b in _PDF417_TEXT for b in data):
+        # text: two values per codeword, characters and the latches and shifts between submodes
+        return 1 + (_pdf417_text_values(data) + 1) // 2
+    # bytes: 6 bytes in 5 codewords
+    full, rest = divmod(n, 6)
+    return 2 + full * 5 + rest
+
+
+def pdf417_size(data, columns=0, rows=0, module_width=3, row_height=3, error_correction=2, paper_width=PAPER_80MM_DOTS):
+    """
+    Estimates the size of the PDF417 symbol for "data" (bytes or str, encoded as UTF-8), with the parameters of
+    :func:`pdf417_commands`. Without ``columns``, the printer uses as many columns as fit on ``paper_width`` dots.
+    The number of codewords is an estimate, the printer's encoder may switch between compaction modes differently.
+    Raises a ValueError if the data doesn't fit into a symbol.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    codewords = _pdf417_codewords(data) + (2 << error_correction)
+    if codewords > _PDF417_MAX_CODEWORDS:
+        raise ValueError('PDF417 data too large: {} codewords, at most {} fit into a symbol'.format(
+            codewords, _PDF417_MAX_CODEWORDS))
+    if not columns:
+        # start, left indicator, right indicator and stop pattern take 69 modules, each column 17
+        columns = max(1, min(30, (paper_width // module_width - 69) // 17))
+        if rows:
+            columns = min(columns, -(-codewords // rows))
+    needed = max(3, -(-codewords // columns))
+    if rows and rows < needed:
+        raise ValueError('PDF417 data needs {} rows with {} columns, {} rows requested'.format(needed, columns, rows))
+    if needed > 90:
+        raise ValueError('PDF417 data needs {} rows with {} columns, at most 90 are possible'.format(needed, columns))
+    rows = rows or needed
+    width = (17 * columns + 69) * module_width
+    if width > paper_width:
+        raise ValueError('PDF417 symbol is {} dots wide, the paper only {}'.format(width, paper_width))
+    return SymbolSize(columns, rows, codewords, width, rows * row_height * module_width)
+
+
+def _symbol_command(function, args=b''):
+    n = 2 + len(args)
+    return SureMark.CMD_2D_SYMBOL + bytes([n & 0xff, n >> 8]) + SureMark.SYMBOL_PDF417 + function + args
+
+
+def pdf417_commands(data, columns=0, rows=0, module_width=3, row_height=3, error_correction=2, truncated=False,
+                    paper_width=PAPER_80MM_DOTS):
+    """
+    Returns the commands that make the printer render "data" (bytes or str, encoded as UTF-8) as PDF417 symbol,
+    so only the data goes over the line instead of a raster image of the symbol.
+
+    * ``columns``: number of data columns 1 to 30, 0 lets the printer choose
+    * ``rows``: number of rows 3 to 90, 0 lets the printer choose
+    * ``module_width``: width of a module in dots, 2 to 8
+    * ``row_height``: height of a row in module widths, 2 to 8
+    * ``error_correction``: error correction level 0 to 8, each level doubles the error correction codewords
+    * ``truncated``: omit the right row indicator and shorten the stop pattern, for a narrower symbol
+
+    The parameters are validated and the size checked with :func:`pdf417_size`, raising a ValueError for symbols
+    the printer can't print.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if not data:
+        raise ValueError('PDF417 data is empty')
+    if columns < 0 or columns > 30:
+        raise ValueError('PDF417 columns outside allowed range 0 <= columns <= 30')
+    if rows != 0 and (rows < 3 or rows > 90):
+        raise ValueError('PDF417 rows must be 0 or in the range 3 <= rows <= 90')
+    if module_width < 2 or module_width > 8:
+        raise ValueError('PDF417 module width outside allowed range 2 <= module_width <= 8')
+    if row_height < 2 or row_height > 8:
+        raise ValueError('PDF417 row height outside allowed range 2 <= row_height <= 8')
+    if error_correction < 0 or error_correction > 8:
+        raise ValueError('PDF417 error correction level outside allowed range 0 <= error_correction <= 8')
+    pdf417_size(data, columns, rows, module_width, row_height, error_correction, paper_width)
+    return b''.join([
+        _symbol_command(_PDF417_COLUMNS, bytes([columns])),
+        _symbol_command(_PDF417_ROWS, bytes([rows])),
+        _symbol_command(_PDF417_MODULE_WIDTH, bytes([module_width])),
+        _symbol_command(_PDF417_ROW_HEIGHT, bytes([row_height])),
+        # 0x30: error correction given as level, 0x30 + level
+        _symbol_command(_PDF417_ERROR_CORRECTION, bytes([0x30, 0x30 + error_correction])),
+        _symbol_command(_PDF417_OPTIONS, b'\x01' if truncated else b'\x00'),
+        _symbol_command(_PDF417_STORE, b'\x30' + data),
+        _symbol_command(_PDF417_PRINT, b'\x30'),
+    ])
@@ -0,0 +1,101 @@
+#
+# Coalescing of many small commands into few device writes
+#
+
+
+class CommandBatch:
+    """
+    Collects the bytes of many commands in a preallocated buffer and sends them in as few writes as possible. Usually
+    obtained via :func:`~posprinter.suremark.SureMark.batch` rather than created directly.
+    The counters are kept after the batch has been sent, so they can be inspected after the ``with`` block.
+    """
+
+    def __init__(self, write, capacity=1024, max_write=None, metrics=None):
+        """
+        ``write`` is called with the collected data, at most ``max_write`` bytes at a time (None: everything in one
+        write). ``capacity`` is the initial size of the buffer, it grows if required. The commands are reported to
+        ``metrics`` (a :class:`~posprinter.suremark_metrics.Metrics` instance) once they have been sent.
+        """
+        if max_write is not None and max_write < 1:
+            raise ValueError('max_write must be at least 1')
+        self.__write = write
+        self.__buf = bytearray(max(capacity, 1))
+        self.__len = 0
+        self.__max_write = max_write
+        self.__metrics = metrics
+        # end offsets of the commands in the buffer, only kept for the metrics
+        self.__ends = []
+        #: Number of commands (calls to :func:`append`)
+        self.commands = 0
+        #: Number of bytes sent
+        self.bytes = 0
+        #: Number of device writes performed
+        self.writes = 0
+
+    def __len__(self):
+        """
+        Number of bytes waiting to be sent.
+        """
+        return self.__len
+
+    def writes_saved(self):
+        """
+        Number of device writes that were saved compared to writing every command on its own.
+        """
+        return self.commands - self.writes
+
+    def append(self, data):
+        """
+        Adds the bytes of a command to the batch.
+        """
+        end = self.__len + len(data)
+        if end > len(self.__buf):
+            # a bytearray can't be resized while a view of it is exported
+            buf = bytearray(max(end, 2 * len(self.__buf)))
+            buf[:self.__len] = self.__buf[:self.__len]
+            self.__buf = buf
+        self.__buf[self.__len:end] = data
+        self.__len = end
+        self.commands += 1
+        if self.__metrics is not None:
+            self.__ends.append(end)
+
+    def flush(self):
+        """
+        Sends everything collected so far. If a write raises, the data sent before stays sent and the next flush
+        continues with the rest.
+        """
+        length = self.__len
+        if length == 0:
+            return
+        view = memoryview(self.__buf)
+        step = self.__max_write or length
+        sent = 0
+        try:
+            while sent < length:
+                end = min(sent + step, length)
+                self.__write(view[sent:end])
+                sent = end
+                self.writes += 1
+        finally:
+            self.bytes += sent
+            if self.__metrics is not None:
+                start = 0
+                done = 0
+                for end in self.__ends:
+                    if end > sent:
+                        break
+                    self.__metrics.written(view[start:end])
+                    start = end
+                    done += 1
+                self.__ends[:] = [end - sent for end in self.__ends[done:]]
+            if sent < length:
+                self.__buf[:length - sent] = self.__buf[sent:length]
+            self.__len = length - sent
+
+    def discard(self):
+        """
+        Drops everything collected so far without sending it.
+        """
+        self.__len = 0
+        del self.__ends[:]
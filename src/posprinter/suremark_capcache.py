@@ -0,0 +1,141 @@
+#
+# Persistent cache of printer capabilities
+#
+
+import json
+import os
+
+from .suremark import printer_id
+from .suremark_status import PrinterID
+
+
+def port_identity(port):
+    """
+    Returns the serial number of the USB serial adapter behind "port" as reported by pyserial, or an empty string if
+    there is none (such as for built-in ports).
+    """
+    from serial.tools import list_ports
+    real = os.path.realpath(port)
+    for info in list_ports.comports():
+        if info.device in (port, real):
+            return info.serial_number or ''
+    return ''
+
+
+class Capabilities:
+    """
+    What is known about a printer: its :class:`~posprinter.suremark_status.PrinterID`, the EC level it was probed
+    at, the user flash size (None if the printer did not answer) and the results of custom probes in ``extra``.
+    """
+
+    def __init__(self, printer_id, ec_level, flash_size=None, extra=None):
+        self.printer_id = printer_id
+        self.ec_level = ec_level
+        self.flash_size = flash_size
+        self.extra = dict(extra or {})
+
+    def to_dict(self):
+        raw = self.printer_id.raw()
+        return {
+            'printer_id': raw.hex(),
+            # decoded for people reading the file, only "printer_id" is used when loading
+            'device_type': raw[0],
+            'device_id': raw[1],
+            'features': [raw[2], raw[3]],
+            'ec_level': self.ec_level,
+            'flash_size': self.flash_size,
+            'extra': self.extra,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(PrinterID(bytes.fromhex(d['printer_id'])), d['ec_level'], d.get('flash_size'), d.get('extra'))
+
+
+class CapabilityCache:
+    """
+    Stores the :class:`Capabilities` of printers in the JSON file ``path``, keyed by port and an identity of the
+    device on it (such as the serial number from :func:`port_identity`), so a process start doesn't need to probe
+    every printer again. A cached entry is only used while the EC level of the printer, which every status message
+    carries in byte 3, is the one it was probed at, and the printer ID is the same if the message is a printer ID
+    response. ``probe`` is called as ``probe(printer)`` for printers that are
+    not cached and returns a dict of extra JSON serializable facts::
+
+        cache = CapabilityCache('/var/cache/pos/printers.json')
+        caps = cache.get(p, '/dev/ttyUSB0', port_identity('/dev/ttyUSB0'))
+        if caps.printer_id.has_micr():
+            ...
+    """
+
+    def __init__(self, path, probe=None):
+        self.__path = path
+        self.__probe = probe
+        self.__entries = self.__load()
+        #: Number of lookups answered from the cache
+        self.hits = 0
+        #: Number of printers probed
+        self.misses = 0
+
+    def __load(self):
+        try:
+            with open(self.__path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __save(self):
+        # write a new file and rename it, so an interruption never leaves a broken cache
+        tmp = self.__path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.__entries, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.__path)
+
+    @staticmethod
+    def key(port, identity=''):
+        return '{}|{}'.format(port, identity)
+
+    def get(self, printer, port, identity='', message=None):
+        """
+        Returns the :class:`Capabilities` of "printer" on "port". ``message`` may be any message received from the
+        printer recently, otherwise the status is queried with the printer ID request (a single round trip). A cached
+        entry is used if the EC level of the message matches and, for a printer ID response, the printer ID too. The
+        printer is probed otherwise, which takes the flash size request and the custom probe.
+        """
+        if message is None:
+            message = printer.query_status()
+        ec_level = message.engineering_code_level()
+        pid = printer_id(message) if message.is_printer_id_response() else None
+        key = self.key(port, identity)
+        entry = self.__entries.get(key)
+        if entry is not None and entry.get('ec_level') == ec_level:
+            try:
+                caps = Capabilities.from_dict(entry)
+            except (KeyError, TypeError, ValueError):
+                pass
+            else:
+                if pid is None or caps.printer_id.raw() == pid.raw():
+                    self.hits += 1
+                    return caps
+
+        self.misses += 1
+        if pid is None:
+            pid = printer.identify()
+        try:
+            flash_size = printer.get_user_flash_storage_size()
+        except ValueError:
+            flash_size = None
+        extra = self.__probe(printer) if self.__probe is not None else None
+        caps = Capabilities(pid, ec_level, flash_size, extra)
+        self.__entries[key] = caps.to_dict()
+        self.__save()
+        return caps
+
+    def invalidate(self, port=None, identity=''):
+        """
+        Drops the entry for "port", or all entries if no port is given.
+        """
+        if port is None:
+            self.__entries = {}
+        else:
+            self.__entries.pop(self.key(port, identity), None)
+        self.__save()
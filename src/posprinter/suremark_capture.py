@@ -0,0 +1,243 @@
+#
+# Capture of the data exchanged with a printer, and offline replay
+#
+
+import argparse
+import collections
+import struct
+import sys
+import time
+
+from .suremark_decoder import ResponseDecoder
+from .suremark_status import PrinterMessage
+
+#: Record of data sent to the printer
+DIRECTION_WRITE = 1
+#: Record of data received from the printer
+DIRECTION_READ = 2
+
+# timestamp (seconds), direction, length of the data that follows
+_HEADER = struct.Struct('<dBI')
+_MAGIC = b'PPCAP1\n'
+
+CaptureRecord = collections.namedtuple('CaptureRecord', ['time', 'direction', 'data'])
+
+
+class CaptureDevice:
+    """
+    Wraps a serial device (or anything passed to :class:`~posprinter.suremark.SureMark` as device) and records every
+    write and read with a timestamp from ``clock``. Records are stored in a ring buffer of ``size`` bytes, once it is
+    full the oldest records are dropped, so a capture can run all the time in a store and be saved when a problem
+    shows up::
+
+        dev = CaptureDevice(ser)
+        p = SureMark(dev)
+        ...
+        dev.save('/tmp/printer.cap')
+
+    Each record takes 13 bytes plus its data, which is copied into the buffer with a single slice assignment. Data
+    larger than the buffer is truncated to its last bytes. All other attributes are passed to the wrapped device.
+    """
+
+    def __init__(self, device, size=256 * 1024, clock=time.monotonic):
+        if size < 4 * _HEADER.size:
+            raise ValueError('Capture buffer too small')
+        self.__device = device
+        self.__clock = clock
+        self.__size = size
+        self.__buf = bytearray(size)
+        self.__end = 0
+        # (offset, length) of the records in the buffer, oldest first
+        self.__records = collections.deque()
+        #: Number of records dropped to make room
+        self.dropped = 0
+        #: Number of records whose data was truncated
+        self.truncated = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__device, name)
+
+    def __len__(self):
+        """
+        Number of records in the buffer.
+        """
+        return len(self.__records)
+
+    def record(self, direction, data):
+        """
+        Adds a record, used by :func:`write` and :func:`read`.
+        """
+        now = self.__clock()
+        limit = self.__size - _HEADER.size
+        if len(data) > limit:
+            data = data[len(data) - limit:]
+            self.truncated += 1
+        need = _HEADER.size + len(data)
+        records = self.__records
+        end = self.__end
+        if end + need > self.__size:
+            # continue at the start, the records behind the writer are the oldest ones
+            while records and records[0][0] >= end:
+                records.popleft()
+                self.dropped += 1
+            end = 0
+        while records and end <= records[0][0] < end + need:
+            records.popleft()
+            self.dropped += 1
+        _HEADER.pack_into(self.__buf, end, now, direction, len(data))
+        self.__buf[end + _HEADER.size:end + need] = data
+        records.append((end, need))
+        self.__end = end + need
+
+    def write(self, data):
+        n = self.__device.write(data)
+        self.record(DIRECTION_WRITE, data)
+        return n
+
+    def read(self, size=1):
+        data = self.__device.read(size)
+        if data:
+            self.record(DIRECTION_READ, data)
+        return data
+
+    def readinto(self, b):
+        readinto = getattr(self.__device, 'readinto', None)
+        if readinto is None:
+            data = self.__device.read(len(b))
+            n = len(data)
+            b[:n] = data
+        else:
+            n = readinto(b) or 0
+        if n:
+            self.record(DIRECTION_READ, memoryview(b)[:n])
+        return n
+
+    def records(self):
+        """
+        Returns the records in the buffer as a list of :class:`CaptureRecord`, oldest first.
+        """
+        out = []
+        for offset, length in self.__records:
+            t, direction, n = _HEADER.unpack_from(self.__buf, offset)
+            start = offset + _HEADER.size
+            out.append(CaptureRecord(t, direction, bytes(self.__buf[start:start + n])))
+        return out
+
+    def clear(self):
+        self.__records.clear()
+        self.__end = 0
+
+    def save(self, path):
+        """
+        Writes the records to the file "path", to be read by :func:`load_capture`.
+        """
+        with open(path, 'wb') as f:
+            f.write(_MAGIC)
+            for offset, length in self.__records:
+                f.write(self.__buf[offset:offset + length])
+
+
+def load_capture(path):
+    """
+    Reads a file written by :func:`CaptureDevice.save` and returns the list of :class:`CaptureRecord`.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(_MAGIC):
+        raise ValueError('Not a capture file')
+    records = []
+    pos = len(_MAGIC)
+    while pos < len(data):
+        if len(data) - pos < _HEADER.size:
+            raise ValueError('Truncated capture file')
+        t, direction, n = _HEADER.unpack_from(data, pos)
+        pos += _HEADER.size
+        if len(data) - pos < n:
+            raise ValueError('Truncated capture file')
+        records.append(CaptureRecord(t, direction, data[pos:pos + n]))
+        pos += n
+    return records
+
+
+def replay_decode(records, debug=False):
+    """
+    Runs the data read in "records" through a :class:`~posprinter.suremark_decoder.ResponseDecoder` and yields the
+    writes as ``(time, DIRECTION_WRITE, data)`` and the decoded messages as ``(time, DIRECTION_READ, message)`` with
+    :class:`~posprinter.suremark_status.PrinterMessage` objects, in order. The time of a message is the time of the
+    read that completed it.
+    """
+    decoder = ResponseDecoder()
+    for record in records:
+        if record.direction == DIRECTION_WRITE:
+            yield record.time, DIRECTION_WRITE, record.data
+            continue
+        decoder.feed(record.data)
+        while True:
+            frame = decoder.next_frame()
+            if frame is None:
+                break
+            # the decoder reuses its buffer
+            yield record.time, DIRECTION_READ, PrinterMessage(bytes(frame), debug=debug)
+
+
+def replay_to_device(records, device, sleep=None, clock=None, step=0.001):
+    """
+    Sends the writes in "records" to "device" (such as a :class:`~posprinter.suremark_sim.SimulatedSureMark`) with
+    the captured timing, and returns the exchange as a list of :class:`CaptureRecord`, with the times shifted to the
+    capture. The device is polled for responses every ``step`` seconds, and until its read timeout after the last
+    write. ``clock`` and ``sleep`` default to the ones of the device, so a simulation keeps running on its virtual
+    clock.
+    """
+    clock = clock if clock is not None else getattr(device, 'clock', time.monotonic)
+    sleep = sleep if sleep is not None else getattr(device, 'sleep', time.sleep)
+    writes = [r for r in records if r.direction == DIRECTION_WRITE]
+    if not writes:
+        return []
+    capture = CaptureDevice(device, clock=clock)
+
+    def pump(until):
+        while True:
+            waiting = device.in_waiting
+            if waiting:
+                capture.read(waiting)
+            now = clock()
+            if now >= until:
+                return
+            sleep(min(step, until - now))
+
+    offset = clock() - writes[0].time
+    for record in writes:
+        pump(record.time + offset)
+        capture.write(record.data)
+    pump(clock() + (getattr(device, 'timeout', None) or 0.1))
+    return [CaptureRecord(r.time - offset, r.direction, r.data) for r in capture.records()]
+
+
+def _print_timeline(records, out):
+    start = records[0].time if records else 0.0
+    for t, direction, item in replay_decode(records):
+        if direction == DIRECTION_WRITE:
+            out.write('{:+11.6f} > {}\n'.format(t - start, item.hex()))
+        else:
+            out.write('{:+11.6f} < {} {}\n'.format(t - start, item, ', '.join(item.conditions())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m posprinter.suremark_capture',
+                                     description='Shows the exchange recorded in a capture file.')
+    parser.add_argument('capture', help='file written by CaptureDevice.save')
+    parser.add_argument('--sim', action='store_true',
+                        help='replay the writes against the simulated printer instead of the captured responses')
+    parser.add_argument('--baudrate', type=int, default=19200, help='baud rate of the simulation')
+    args = parser.parse_args(argv)
+
+    records = load_capture(args.capture)
+    if args.sim:
+        from .suremark_sim import SimulatedSureMark
+        records = replay_to_device(records, SimulatedSureMark(baudrate=args.baudrate))
+    _print_timeline(records, sys.stdout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -102,20 +102,70 @@ status_summary_bytes = [
     'Status byte 8: Thermal',
 ]
 
-def verbose_status_byte(c, bytenum):
+# Bytes that hold a number rather than flags
+status_numeric_bytes = (3, 5)
+
+
+def _build_status_tables():
+    conditions = []
+    active = []
+    for bytenum, bits in enumerate(status_summary_text):
+        conditions.append(tuple(tuple(bits[n][(c >> n) & 1] for n in range(8)) for c in range(256)))
+        if bytenum in status_numeric_bytes:
+            active.append(((),) * 256)
+            continue
+        # set bits, except for reserved ones
+        relevant = [n for n in range(8) if not bits[n][1].startswith('Reserved')]
+        active.append(tuple(tuple(bits[n][1] for n in relevant if c & (1 << n)) for c in range(256)))
+    return conditions, active
+
+
+# this module is only imported when texts are needed (see PrinterMessage.conditions), so the tables are built now
+#: status_conditions[bytenum][c] is the text for each bit (bit 0 first) of status byte "bytenum" having value "c"
+#: active_status_conditions[bytenum][c] only contains the texts of bits that are set, excluding reserved bits
+status_conditions, active_status_conditions = _build_status_tables()
+
+
+def status_tables():
     """
-    Detailed print of a single byte of the status message sent by the printer.
-    c is the byte in question, bytenum is used as an index in  "status_summary_text"
+    Returns the lookup tables ``(status_conditions, active_status_conditions)``.
+    """
+    return status_conditions, active_status_conditions
+
+
+def decode_status_byte(c, bytenum):
+    """
+    Returns the texts describing the 8 bits (bit 0 first) of the status byte "c" at index "bytenum".
+    """
+    return status_conditions[bytenum][c]
+
+
+def decode_status(data):
+    """
+    Decodes the 8 status bytes in "data" into a dict mapping the name of each byte to the texts of its bits.
+    """
+    return {status_summary_bytes[i]: status_conditions[i][data[i]] for i in range(8)}
+
+
+def active_conditions(data):
+    """
+    Returns a list of the conditions that are set in the 8 status bytes in "data", such as "Buffer empty" or
+    "Command rejected". Reserved bits, the EC level and the line count are left out.
     """
-    b0 = int(c & (1 << 0) != 0)
-    b1 = int(c & (1 << 1) != 0)
-    b2 = int(c & (1 << 2) != 0)
-    b3 = int(c & (1 << 3) != 0)
-    b4 = int(c & (1 << 4) != 0)
-    b5 = int(c & (1 << 5) != 0)
-    b6 = int(c & (1 << 6) != 0)
-    b7 = int(c & (1 << 7) != 0)
-    print('''Byte {17}: {18}
+    result = []
+    for i in range(8):
+        result.extend(active_status_conditions[i][data[i]])
+    return result
+
+
+def render_status_byte(c, bytenum):
+    """
+    Returns the detailed, human readable description of a single byte of the status message sent by the printer.
+    c is the byte in question, bytenum is used as an index in "status_summary_text"
+    """
+    texts = status_conditions[bytenum][c]
+    bits = [(c >> n) & 1 for n in range(8)]
+    return '''Byte {17}: {18}
 # 76543210
 0b{7}{6}{5}{4}{3}{2}{1}{0} = 0x{16:02X} = {16}
   ||||||||
@@ -127,20 +177,15 @@ def verbose_status_byte(c, bytenum):
   ||+------- {5} {13}
   |+-------- {6} {14}
   +--------- {7} {15}
-    '''.format(
-        b0, b1, b2, b3, b4, b5, b6, b7,
-        status_summary_text[bytenum][0][b0],
-        status_summary_text[bytenum][1][b1],
-        status_summary_text[bytenum][2][b2],
-        status_summary_text[bytenum][3][b3],
-        status_summary_text[bytenum][4][b4],
-        status_summary_text[bytenum][5][b5],
-        status_summary_text[bytenum][6][b6],
-        status_summary_text[bytenum][7][b7],
-        c,
-        bytenum,
-        status_summary_bytes[bytenum],
-    ))
+    '''.format(*(bits + list(texts) + [c, bytenum, status_summary_bytes[bytenum]]))
+
+
+def verbose_status_byte(c, bytenum):
+    """
+    Detailed print of a single byte of the status message sent by the printer.
+    c is the byte in question, bytenum is used as an index in  "status_summary_text"
+    """
+    print(render_status_byte(c, bytenum))
 
 # names of the bytes in the extended status response (printer id)
 extended_status_byte_name = [
@@ -151,20 +196,13 @@ extended_status_byte_name = [
     'EC level (of loaded code)',
 ]
 
-def verbose_extended_status(c, bytenum):
+def render_extended_status(c, bytenum):
     """
-    Verbosely prints a single byte of the extended status info (printer id)
+    Returns the bits of a single byte of the extended status info (printer id) in human readable form.
     c is the byte in question, bytenum is used as an index for "extended_status_byte_name"
     """
-    b0 = int(c & (1 << 0) != 0)
-    b1 = int(c & (1 << 1) != 0)
-    b2 = int(c & (1 << 2) != 0)
-    b3 = int(c & (1 << 3) != 0)
-    b4 = int(c & (1 << 4) != 0)
-    b5 = int(c & (1 << 5) != 0)
-    b6 = int(c & (1 << 6) != 0)
-    b7 = int(c & (1 << 7) != 0)
-    print('''Byte {9}: {10}
+    bits = [(c >> n) & 1 for n in range(8)]
+    return '''Byte {9}: {10}
 # 76543210
 0b{7}{6}{5}{4}{3}{2}{1}{0} = 0x{8:02X} = {8}
   ||||||||
@@ -176,12 +214,15 @@ def verbose_extended_status(c, bytenum):
   ||+------- {5}
   |+-------- {6}
   +--------- {7}
-    '''.format(
-        b0, b1, b2, b3, b4, b5, b6, b7,
-        c,
-        bytenum,
-        extended_status_byte_name[bytenum]
-    ))
+    '''.format(*(bits + [c, bytenum, extended_status_byte_name[bytenum]]))
+
+
+def verbose_extended_status(c, bytenum):
+    """
+    Verbosely prints a single byte of the extended status info (printer id)
+    c is the byte in question, bytenum is used as an index for "extended_status_byte_name"
+    """
+    print(render_extended_status(c, bytenum))
 
 def verbose_printer_id(response):
     """
@@ -0,0 +1,172 @@
+#
+# Incremental decoder for the responses sent by SureMark printers
+#
+
+from .suremark_status import PrinterMessage
+
+
+class ResponseDecoder:
+    """
+    Splits a stream of bytes from the printer into messages. Data can be added in chunks of any size using
+    :func:`feed` or read directly into the decoders buffer using :func:`readinto`. Complete messages are handed out as
+    memoryviews into the buffer, without copying. These views are only valid until the next call to :func:`feed` or
+    :func:`readinto`, copy them (``bytes(frame)``) to keep them longer.
+
+    Each message starts with its length as a two byte big endian number (which includes the two bytes), followed by
+    at least the eight status bytes. If the length is out of range or the reserved status bits have unexpected values,
+    the decoder assumes to be out of sync, drops a byte and tries again.
+    """
+
+    #: Smallest possible message: the length and the status bytes
+    MIN_LENGTH = 2 + 8
+
+    # (byte, mask, expected value) of reserved status bits
+    _RESERVED_BITS = [
+        (0, 1 << 4, 0),
+        (1, 1 << 3, 1 << 3),
+        (2, 1 << 4, 0),
+        (4, 1 << 5, 1 << 5),
+        (6, 1 << 5, 1 << 5),
+        (7, 1 << 4, 0),
+    ]
+
+    def __init__(self, size=1024, max_length=0xffff, check_reserved=True):
+        """
+        ``size`` is the initial buffer size, it grows if a message does not fit. Messages longer than ``max_length``
+        are treated as garbage. ``check_reserved`` enables the plausibility check of the reserved status bits.
+        """
+        if max_length < self.MIN_LENGTH:
+            raise ValueError('max_length must be at least {}'.format(self.MIN_LENGTH))
+        self.__buf = bytearray(max(size, self.MIN_LENGTH))
+        self.__view = memoryview(self.__buf)
+        self.__start = 0
+        self.__end = 0
+        self.__max_length = max_length
+        self.__check_reserved = check_reserved
+        #: Number of complete messages decoded
+        self.messages = 0
+        #: Number of bytes dropped while resynchronizing
+        self.discarded = 0
+
+    def __len__(self):
+        """
+        Number of bytes buffered but not yet handed out.
+        """
+        return self.__end - self.__start
+
+    def bytes_needed(self):
+        """
+        Minimum number of bytes required to complete the next message. Reading exactly this much from a blocking
+        device never waits for bytes that belong to a later message.
+        """
+        avail = self.__end - self.__start
+        if avail < self.MIN_LENGTH:
+            # every message is at least this long, and the status bytes tell if we're in sync
+            return self.MIN_LENGTH - avail
+        length = (self.__buf[self.__start] << 8) | self.__buf[self.__start + 1]
+        if length < self.MIN_LENGTH or length > self.__max_length:
+            return 1
+        return max(length - avail, 1)
+
+    def __reserve(self, n):
+        if len(self.__buf) - self.__end >= n:
+            return
+        avail = self.__end - self.__start
+        if len(self.__buf) - avail >= n:
+            # move the unread data to the front, this invalidates frames handed out before
+            self.__buf[0:avail] = self.__buf[self.__start:self.__end]
+        else:
+            # can't resize a bytearray with exported views, so replace it
+            buf = bytearray(max(avail + n, 2 * len(self.__buf)))
+            buf[0:avail] = self.__buf[self.__start:self.__end]
+            self.__buf = buf
+            self.__view = memoryview(buf)
+        self.__start = 0
+        self.__end = avail
+
+    def feed(self, data):
+        """
+        Appends data received from the printer.
+        """
+        n = len(data)
+        self.__reserve(n)
+        self.__buf[self.__end:self.__end + n] = data
+        self.__end += n
+
+    def readinto(self, device, n=None):
+        """
+        Reads up to ``n`` bytes (default: :func:`bytes_needed`) from ``device`` straight into the buffer and returns
+        the number of bytes read. Devices without ``readinto`` are read using ``read``.
+        """
+        if n is None:
+            n = self.bytes_needed()
+        self.__reserve(n)
+        target = self.__view[self.__end:self.__end + n]
+        readinto = getattr(device, 'readinto', None)
+        if readinto is not None:
+            count = readinto(target) or 0
+        else:
+            data = device.read(n)
+            count = len(data)
+            target[:count] = data
+        self.__end += count
+        return count
+
+    def __plausible(self, start):
+        for byte, mask, expected in self._RESERVED_BITS:
+            if self.__buf[start + byte] & mask != expected:
+                return False
+        return True
+
+    def next_frame(self):
+        """
+        Returns the next complete message without the length bytes (status bytes and payload) as a memoryview, or
+        None if more data is required.
+        """
+        while True:
+            avail = self.__end - self.__start
+            if avail < 2:
+                return None
+            length = (self.__buf[self.__start] << 8) | self.__buf[self.__start + 1]
+            if length < self.MIN_LENGTH or length > self.__max_length:
+                self.__start += 1
+                self.discarded += 1
+                continue
+            # check the status bytes as soon as they are there, garbage may claim to be a very long message
+            if avail >= self.MIN_LENGTH and self.__check_reserved and not self.__plausible(self.__start + 2):
+                self.__start += 1
+                self.discarded += 1
+                continue
+            if avail < length:
+                return None
+            frame = self.__view[self.__start + 2:self.__start + length]
+            self.__start += length
+            self.messages += 1
+            return frame
+
+    def next_message(self, debug=False):
+        """
+        Like :func:`next_frame`, but returns a :class:`~posprinter.suremark_status.PrinterMessage` backed by the
+        buffer.
+        """
+        frame = self.next_frame()
+        if frame is None:
+            return None
+        return PrinterMessage(frame, debug=debug)
+
+    def __iter__(self):
+        """
+        Yields all complete messages that are buffered.
+        """
+        while True:
+            m = self.next_message()
+            if m is None:
+                return
+            yield m
+
+    def reset(self):
+        """
+        Drops everything that is buffered.
+        """
+        self.__start = 0
+        self.__end = 0
@@ -0,0 +1,347 @@
+#
+# Crash safe spooling of jobs through an append only log
+#
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# crc32 of the rest of the record, data length, kind, job sequence number
+_RECORD = struct.Struct('<IIBQ')
+_KIND_JOB = 1
+_KIND_ACK = 2
+
+_log = logging.getLogger(__name__)
+
+
+def _fsync_dir(path):
+    # makes the directory entry of "path" durable, after it was created or renamed
+    fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DurableSpool:
+    """
+    Queue of print jobs that survives crashes of the process, kept in an append only log file at ``path``. Jobs are
+    written to the log before they are sent, and acknowledged in the log once the printer reported completion: a
+    status with "command complete" (byte 0 bit 0) set, "command not complete" (byte 2 bit 7) clear and an empty
+    buffer. When the spool is opened again, all jobs after the last acknowledged one are pending and printed by
+    :func:`print_pending`, so a receipt is never lost. A job that was printed but not acknowledged before the crash is
+    printed again::
+
+        spool = DurableSpool(p, '/var/spool/pos/receipts.log')
+        spool.print_pending()  # whatever was left over from the last run
+        spool.enqueue(receipt)
+        spool.print_pending()
+
+    The log is memory mapped, appending a job is a copy into the mapping. Making it durable takes a flush of the
+    mapping to disk, which is shared by all jobs appended in the meantime (group commit): :func:`enqueue` waits for a
+    flush by default, threads enqueueing at the same time share one. With ``wait=False`` it returns immediately and
+    the job is flushed together with others once ``commit_batch`` jobs are waiting, before anything is printed, or by
+    a background thread once the oldest of them waited ``commit_interval`` seconds. The log is started over when all
+    jobs are acknowledged and it grew beyond ``compact_size`` bytes.
+
+    Jobs are sent with ``spooler`` (a :class:`~posprinter.suremark_spooler.Spooler`) if given, otherwise in a
+    single batch.
+    """
+
+    #: Initial size of the log file
+    INITIAL_SIZE = 1024 * 1024
+    #: Seconds between polls while waiting for a job to complete
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, printer, path, spooler=None, commit_batch=64, commit_interval=0.05,
+                 compact_size=16 * 1024 * 1024, completion_timeout=60.0, poll_interval=POLL_INTERVAL,
+                 clock=time.monotonic, sleep=time.sleep):
+        if printer is None:
+            raise ValueError('Can\'t operate without a printer')
+        self.__printer = printer
+        self.__path = path
+        self.__spooler = spooler
+        self.__commit_batch = commit_batch
+        self.__commit_interval = commit_interval
+        self.__compact_size = compact_size
+        self.__completion_timeout = completion_timeout
+        self.__poll_interval = poll_interval
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__lock = threading.Lock()
+        self.__committed_cond = threading.Condition(self.__lock)
+        self.__committing = False
+        # incremented whenever the log is started over, offsets into an older log are meaningless
+        self.__generation = 0
+        self.__flush_cond = threading.Condition(self.__lock)
+        self.__flusher = None
+        self.__closed = False
+        #: Number of jobs appended to the log
+        self.enqueued = 0
+        #: Number of jobs acknowledged by the printer
+        self.acknowledged = 0
+        #: Number of flushes of the log to disk
+        self.commits = 0
+        #: Number of jobs found pending when the log was opened
+        self.recovered = 0
+        self.__open()
+        self.recovered = len(self.__pending)
+
+    def __open(self):
+        fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size == 0:
+                _fsync_dir(self.__path)
+            if size < self.INITIAL_SIZE:
+                os.ftruncate(fd, self.INITIAL_SIZE)
+                os.fsync(fd)
+                size = self.INITIAL_SIZE
+            self.__map = mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self.__fd = fd
+        # job sequence number -> (offset of the data, length), in order
+        self.__pending = {}
+        self.__next_seq = 1
+        self.__end = self.__scan()
+        self.__committed = self.__end
+        self.__uncommitted_jobs = 0
+        self.__first_uncommitted = None
+
+    def __scan(self):
+        # replays the log up to the first record that is incomplete or damaged (the end of the log, or a write that
+        # was interrupted by a crash)
+        m = self.__map
+        size = len(m)
+        offset = 0
+        while offset + _RECORD.size <= size:
+            crc, length, kind, seq = _RECORD.unpack_from(m, offset)
+            end = offset + _RECORD.size + length
+            if kind not in (_KIND_JOB, _KIND_ACK) or end > size:
+                break
+            if zlib.crc32(m[offset + 4:end]) != crc:
+                break
+            if kind == _KIND_JOB:
+                self.__pending[seq] = (offset + _RECORD.size, length)
+            else:
+                for done in [s for s in self.__pending if s <= seq]:
+                    del self.__pending[done]
+            self.__next_seq = max(self.__next_seq, seq + 1)
+            offset = end
+        return offset
+
+    def close(self):
+        """
+        Stops the background flush, flushes the log and closes it.
+        """
+        with self.__lock:
+            self.__closed = True
+            self.__flush_cond.notify_all()
+            flusher = self.__flusher
+        if flusher is not None:
+            flusher.join()
+        self.commit()
+        with self.__lock:
+            self.__map.close()
+            os.close(self.__fd)
+
+    def pending(self):
+        """
+        Returns the sequence numbers of the jobs that were not acknowledged yet, in order.
+        """
+        with self.__lock:
+            return sorted(self.__pending)
+
+    def job(self, seq):
+        """
+        Returns the data of the pending job "seq".
+        """
+        with self.__lock:
+            offset, length = self.__pending[seq]
+            return self.__map[offset:offset + length]
+
+    def __append(self, kind, seq, data):
+        # called with the lock held, returns the end offset of the record
+        need = _RECORD.size + len(data)
+        if self.__end + need > len(self.__map):
+            # the mapping is replaced, which must not happen during a flush
+            while self.__committing:
+                self.__committed_cond.wait()
+            self.__grow(self.__end + need)
+        offset = self.__end
+        m = self.__map
+        _RECORD.pack_into(m, offset, 0, len(data), kind, seq)
+        m[offset + _RECORD.size:offset + need] = data
+        struct.pack_into('<I', m, offset, zlib.crc32(m[offset + 4:offset + need]))
+        self.__end = offset + need
+        return self.__end
+
+    def __grow(self, need):
+        size = len(self.__map)
+        while size < need:
+            size *= 2
+        self.__map.flush()
+        self.__map.close()
+        os.ftruncate(self.__fd, size)
+        # the new size is metadata, which the flush of the mapping doesn't cover
+        os.fsync(self.__fd)
+        self.__map = mmap.mmap(self.__fd, size)
+
+    def enqueue(self, data, wait=True):
+        """
+        Appends the job "data" (bytes-like) to the log and returns its sequence number. With ``wait``, returns once
+        the job is on disk, otherwise it is flushed with the next group commit.
+        """
+        with self.__lock:
+            seq = self.__next_seq
+            self.__next_seq += 1
+            end = self.__append(_KIND_JOB, seq, data)
+            self.__pending[seq] = (end - len(data), len(data))
+            self.enqueued += 1
+            self.__uncommitted_jobs += 1
+            if self.__first_uncommitted is None:
+                self.__first_uncommitted = self.__clock()
+                self.__flush_cond.notify_all()
+            generation = self.__generation
+            due = self.__uncommitted_jobs >= self.__commit_batch
+            if self.__clock() - self.__first_uncommitted >= self.__commit_interval:
+                due = True
+            if not (wait or due) and self.__flusher is None:
+                self.__flusher = threading.Thread(target=self.__flush_loop, name='DurableSpool', daemon=True)
+                self.__flusher.start()
+        if wait or due:
+            self.__commit_to(end, generation)
+        return seq
+
+    def commit(self):
+        """
+        Flushes everything appended so far to disk.
+        """
+        with self.__lock:
+            end = self.__end
+            generation = self.__generation
+        self.__commit_to(end, generation)
+
+    def __commit_to(self, end, generation):
+        # returns once the log is flushed up to "end", or was started over since "end" was taken
+        with self.__lock:
+            while self.__generation == generation and self.__committed < end:
+                if self.__committing:
+                    # another thread is flushing, wait for it and check if it covered our record
+                    self.__committed_cond.wait()
+                    continue
+                self.__committing = True
+                start = self.__committed - self.__committed % mmap.PAGESIZE
+                target = self.__end
+                self.__uncommitted_jobs = 0
+                self.__first_uncommitted = None
+                self.__lock.release()
+                try:
+                    self.__map.flush(start, target - start)
+                finally:
+                    self.__lock.acquire()
+                    self.__committing = False
+                    self.__committed_cond.notify_all()
+                self.__committed = max(self.__committed, target)
+                self.commits += 1
+
+    def __flush_loop(self):
+        # flushes jobs enqueued without waiting once the oldest of them waited commit_interval seconds
+        with self.__lock:
+            while not self.__closed:
+                if self.__first_uncommitted is None:
+                    self.__flush_cond.wait()
+                    continue
+                remaining = self.__first_uncommitted + self.__commit_interval - self.__clock()
+                if remaining > 0:
+                    self.__flush_cond.wait(remaining)
+                    continue
+                end = self.__end
+                generation = self.__generation
+                self.__lock.release()
+                try:
+                    self.__commit_to(end, generation)
+                except Exception:
+                    _log.exception('Flushing the spool log failed')
+                finally:
+                    self.__lock.acquire()
+
+    def __wait_complete(self):
+        printer = self.__printer
+        deadline = self.__clock() + self.__completion_timeout
+        while True:
+            m = printer.query_status()
+            if m.command_complete() and not m.command_not_complete() and m.buffer_empty():
+                return
+            if self.__clock() > deadline:
+                raise TimeoutError('Printer did not complete the job within {}s'.format(self.__completion_timeout))
+            self.__sleep(self.__poll_interval)
+
+    def print_pending(self, max_jobs=None):
+        """
+        Prints the pending jobs in order, each is acknowledged once the printer completed it. Returns the number of
+        jobs printed.
+        """
+        self.commit()
+        printed = 0
+        for seq in self.pending():
+            if max_jobs is not None and printed >= max_jobs:
+                break
+            data = self.job(seq)
+            if self.__spooler is not None:
+                self.__spooler.print_job(data)
+            else:
+                with self.__printer.batch():
+                    self.__printer.write(data)
+            self.__wait_complete()
+            self.acknowledge(seq)
+            printed += 1
+        return printed
+
+    def acknowledge(self, seq):
+        """
+        Records that the job "seq" and all jobs before it were printed.
+        """
+        with self.__lock:
+            end = self.__append(_KIND_ACK, seq, b'')
+            generation = self.__generation
+            for done in [s for s in self.__pending if s <= seq]:
+                del self.__pending[done]
+            self.acknowledged += 1
+        self.__commit_to(end, generation)
+        with self.__lock:
+            compact = not self.__pending and self.__end > self.__compact_size
+        if compact:
+            self.__compact()
+
+    def __compact(self):
+        # start over with a log that only records the last sequence number, written aside and renamed so a crash
+        # leaves either the old or the new log
+        with self.__lock:
+            # the mapping is replaced, which must not happen during a flush
+            while self.__committing:
+                self.__committed_cond.wait()
+            if self.__pending:
+                return
+            last = self.__next_seq - 1
+            tmp = self.__path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.truncate(self.INITIAL_SIZE)
+                header = _RECORD.pack(0, 0, _KIND_ACK, last)
+                f.write(struct.pack('<I', zlib.crc32(header[4:])) + header[4:])
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.__path)
+            _fsync_dir(self.__path)
+            self.__map.close()
+            os.close(self.__fd)
+            self.__open()
+            self.__generation += 1
+            # waiters for the old log are done, everything in it was acknowledged
+            self.__committed_cond.notify_all()
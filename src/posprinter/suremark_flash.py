@@ -0,0 +1,166 @@
+#
+# Resumable dump of the user flash of SureMark printers
+#
+
+import json
+import mmap
+import os
+
+from .suremark import ReceiveTimeout, user_flash_data
+
+
+class FlashDumper:
+    """
+    Reads the user flash of a :class:`~posprinter.suremark.SureMark` printer into a file. The flash is read in
+    requests of ``chunk`` bytes (IBM recommends staying below 200 bytes). Up to ``window`` requests are sent at once
+    before reading their responses, the window starts at one request and grows while the responses arrive in time, a
+    timeout or a broken response shrinks it back to one.
+
+    The output file is created with the size of the flash and written through a memory map. Progress is stored in a
+    small JSON file next to it (``path + '.progress'`` unless ``checkpoint`` is given) every ``checkpoint_interval``
+    bytes. If that file exists and matches the flash size and chunk size, the dump continues where it stopped. It is
+    removed once the dump is complete.
+    """
+
+    #: Default number of bytes per read request
+    CHUNK_SIZE = 192
+    #: Default maximum number of requests in flight
+    WINDOW = 8
+    #: Default number of bytes between checkpoints
+    CHECKPOINT_INTERVAL = 16 * 1024
+
+    def __init__(self, printer, path, size=None, chunk=CHUNK_SIZE, window=WINDOW,
+                 checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL, retries=3):
+        """
+        ``size`` is the number of bytes to read, it is requested from the printer if not given. ``retries`` is the
+        number of failed windows (timeouts or broken responses) in a row after which the dump gives up.
+        """
+        if printer is None:
+            raise ValueError('Can\'t operate without a printer')
+        if chunk < 1 or chunk > 0xff:
+            raise ValueError('Chunk size must be between 1 and 255')
+        if window < 1:
+            raise ValueError('Window must be at least 1')
+        self.__printer = printer
+        self.__path = path
+        self.__size = size
+        self.__chunk = chunk
+        self.__max_window = window
+        self.__checkpoint = checkpoint if checkpoint is not None else path + '.progress'
+        self.__checkpoint_interval = checkpoint_interval
+        self.__retries = retries
+        self.__done = 0
+        #: Number of read requests sent
+        self.requests = 0
+        #: Number of bytes read in this run
+        self.bytes_read = 0
+        #: Number of timeouts that were retried
+        self.timeouts = 0
+        #: Number of broken responses (wrong type or length) that were retried
+        self.errors = 0
+        #: Offset the dump resumed from, 0 if it started over
+        self.resumed_from = 0
+
+    def __load_checkpoint(self, size):
+        try:
+            with open(self.__checkpoint, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if state.get('size') != size or state.get('chunk') != self.__chunk:
+            return 0
+        if not os.path.exists(self.__path) or os.path.getsize(self.__path) != size:
+            return 0
+        return min(int(state.get('done', 0)), size)
+
+    def __save_checkpoint(self, size, done):
+        # write a new file and rename it, so an interruption never leaves a broken checkpoint
+        tmp = self.__checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'size': size, 'chunk': self.__chunk, 'done': done}, f)
+        os.replace(tmp, self.__checkpoint)
+
+    def __drain(self):
+        # responses to a timed out window may still arrive, they must not be taken for the answers to the next one
+        while True:
+            try:
+                self.__printer.receive_message()
+            except ReceiveTimeout:
+                return
+            except ValueError:
+                continue
+
+    def __read_window(self, out, size, window):
+        requests = []
+        addr = self.__done
+        with self.__printer.batch():
+            while len(requests) < window and addr < size:
+                count = min(self.__chunk, size - addr)
+                self.__printer.request_flash_storage(count, addr)
+                requests.append((addr, count))
+                addr += count
+        self.requests += len(requests)
+        for addr, count in requests:
+            data = user_flash_data(self.__printer.receive_message())
+            if len(data) != count:
+                raise ValueError('Received {} bytes of flash data at 0x{:06X}, expected {}'.format(
+                    len(data), addr, count))
+            out[addr:addr + count] = data
+        # responses carry no address, if one got lost the following ones were shifted and the window times out at
+        # the end, so progress is only taken once the whole window arrived
+        self.bytes_read += addr + count - self.__done
+        self.__done = addr + count
+
+    def run(self):
+        """
+        Performs (or resumes) the dump and returns the number of bytes read in this run.
+        """
+        size = self.__size
+        if size is None:
+            size = self.__printer.get_user_flash_storage_size()
+        self.__done = self.__load_checkpoint(size)
+        self.resumed_from = self.__done
+
+        with open(self.__path, 'r+b' if self.__done > 0 else 'w+b') as f:
+            f.truncate(size)
+            if size == 0:
+                self.__remove_checkpoint()
+                return 0
+            with mmap.mmap(f.fileno(), size) as out:
+                window = 1
+                failures = 0
+                saved = self.__done
+                try:
+                    while self.__done < size:
+                        try:
+                            self.__read_window(out, size, window)
+                        except ValueError as e:
+                            failures += 1
+                            if failures > self.__retries:
+                                raise
+                            if isinstance(e, ReceiveTimeout):
+                                self.timeouts += 1
+                            else:
+                                self.errors += 1
+                            window = 1
+                            self.__drain()
+                            continue
+                        failures = 0
+                        window = min(self.__max_window, window + 1)
+                        if self.__done - saved >= self.__checkpoint_interval:
+                            out.flush()
+                            self.__save_checkpoint(size, self.__done)
+                            saved = self.__done
+                except BaseException:
+                    # keep what was read so far, the next run continues from here
+                    out.flush()
+                    self.__save_checkpoint(size, self.__done)
+                    raise
+                out.flush()
+
+        self.__remove_checkpoint()
+        return self.bytes_read
+
+    def __remove_checkpoint(self):
+        if os.path.exists(self.__checkpoint):
+            os.remove(self.__checkpoint)
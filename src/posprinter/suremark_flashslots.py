@@ -0,0 +1,174 @@
+#
+# Keeping logos and texts stored in the printers flash up to date
+#
+
+import hashlib
+import json
+import os
+import time
+
+from .suremark import printer_id
+
+
+class FlashSlots:
+    """
+    Manages content stored in the flash slots of a :class:`~posprinter.suremark.SureMark` printer, so receipts can
+    print it with a few bytes instead of sending it every time. Each asset is registered with the complete command
+    sequence that stores it on the printer, which is hashed (SHA-256). A JSON manifest at ``manifest`` remembers the
+    hash stored in every slot, per printer: the key is made of the port, an identity of the device on it (such as the
+    serial number from :func:`~posprinter.suremark_capcache.port_identity`), the printer ID and the EC level, so
+    identical printers on different ports have their own records and a different or reflashed printer starts with an
+    empty one. :func:`sync` only uploads assets whose hash differs, and records an upload once the printer reported
+    it complete::
+
+        slots = FlashSlots(p, '/var/lib/pos/flash.json', '/dev/ttyUSB0', port_identity('/dev/ttyUSB0'))
+        slots.add_logo(1, store_logo_command)
+        slots.sync()
+        ...
+        slots.print_logo(1)
+
+    The manifest can't notice content changed by other means (such as an operator programming the printer), call
+    :func:`forget` in that case.
+    """
+
+    #: Seconds between polls while waiting for an upload to complete
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, printer, manifest, port='', identity='', key=None, completion_timeout=30.0,
+                 poll_interval=POLL_INTERVAL, clock=time.monotonic, sleep=time.sleep):
+        """
+        ``key`` identifies the printer in the manifest, it is built from ``port``, ``identity`` and the printer ID
+        response if not given. ``completion_timeout`` limits the time (in seconds) an upload may take.
+        """
+        if printer is None:
+            raise ValueError('Can\'t operate without a printer')
+        self.__printer = printer
+        self.__manifest = manifest
+        self.__completion_timeout = completion_timeout
+        self.__poll_interval = poll_interval
+        self.__clock = clock
+        self.__sleep = sleep
+        if key is None:
+            m = printer.query_status()
+            key = '{}|{}|{}-{:02x}'.format(port, identity, printer_id(m).raw().hex(), m.engineering_code_level())
+        self.__key = key
+        self.__logos = {}
+        self.__texts = {}
+        self.__stored = self.__load().get(key, {})
+        #: Number of slots uploaded
+        self.uploads = 0
+        #: Number of bytes uploaded
+        self.bytes_uploaded = 0
+
+    def key(self):
+        return self.__key
+
+    def __load(self):
+        try:
+            with open(self.__manifest, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __save(self):
+        manifest = self.__load()
+        manifest[self.__key] = self.__stored
+        # write a new file and rename it, so an interruption never leaves a broken manifest
+        tmp = self.__manifest + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.__manifest)
+
+    @staticmethod
+    def __check_slot(slot):
+        if slot < 0 or slot > 255:
+            raise ValueError('Slot outside allowed range 0 <= slot <= 255')
+
+    def add_logo(self, slot, store):
+        """
+        Registers the logo for "slot", ``store`` being the command sequence that stores it on the printer.
+        """
+        self.__check_slot(slot)
+        self.__logos[slot] = bytes(store)
+
+    def add_text(self, slot, store, print_command):
+        """
+        Registers the text for "slot". ``store`` is the command sequence that stores it, ``print_command`` the one
+        that prints it, as these differ between models.
+        """
+        self.__check_slot(slot)
+        self.__texts[slot] = (bytes(store), bytes(print_command))
+
+    def __assets(self):
+        for slot, store in sorted(self.__logos.items()):
+            yield 'logo:{}'.format(slot), store
+        for slot, (store, _) in sorted(self.__texts.items()):
+            yield 'text:{}'.format(slot), store
+
+    def pending(self):
+        """
+        Returns the names ("logo:1", "text:2", ...) of the assets that differ from what is stored on the printer.
+        """
+        return [name for name, store in self.__assets()
+                if self.__stored.get(name) != hashlib.sha256(store).hexdigest()]
+
+    def sync(self):
+        """
+        Uploads the assets that changed and returns their names. The manifest is updated after every upload, so an
+        interrupted sync does not upload completed slots again. Raises a ValueError if the printer rejected an upload
+        and a TimeoutError if it did not complete in time, the slot is not recorded then.
+        """
+        uploaded = []
+        for name, store in self.__assets():
+            digest = hashlib.sha256(store).hexdigest()
+            if self.__stored.get(name) == digest:
+                continue
+            # forget the old content first, it's gone once the upload starts
+            if self.__stored.pop(name, None) is not None:
+                self.__save()
+            self.__printer.write(store)
+            self.__wait_stored(name)
+            self.__stored[name] = digest
+            self.__save()
+            self.uploads += 1
+            self.bytes_uploaded += len(store)
+            uploaded.append(name)
+        return uploaded
+
+    def __wait_stored(self, name):
+        deadline = self.__clock() + self.__completion_timeout
+        while True:
+            m = self.__printer.query_status()
+            if m.command_rejected():
+                raise ValueError('Printer rejected the upload of {}'.format(name))
+            if not m.command_not_complete():
+                return
+            if self.__clock() > deadline:
+                raise TimeoutError('Printer did not complete the upload of {} within {}s'.format(
+                    name, self.__completion_timeout))
+            self.__sleep(self.__poll_interval)
+
+    def forget(self):
+        """
+        Drops the record of what is stored on the printer, the next :func:`sync` uploads everything.
+        """
+        self.__stored = {}
+        self.__save()
+
+    def print_logo(self, slot):
+        """
+        Prints the logo in "slot", which must have been registered and synced.
+        """
+        if 'logo:{}'.format(slot) not in self.__stored:
+            raise ValueError('Logo slot {} has not been stored'.format(slot))
+        self.__printer.print_logo(slot)
+
+    def print_stored_text(self, slot):
+        """
+        Prints the text in "slot", which must have been registered (for the print command) and synced.
+        """
+        if slot not in self.__texts:
+            raise ValueError('Text slot {} has not been registered'.format(slot))
+        if 'text:{}'.format(slot) not in self.__stored:
+            raise ValueError('Text slot {} has not been stored'.format(slot))
+        self.__printer.write(self.__texts[slot][1])
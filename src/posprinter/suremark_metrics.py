@@ -0,0 +1,210 @@
+#
+# Instrumentation of the communication with SureMark printers
+#
+
+import bisect
+import collections
+import time
+
+from .suremark import SureMark
+from .suremark_status import PrinterMessage
+
+
+def _command_table():
+    # command bytes -> name, from the CMD_* constants and the commands that are named differently
+    table = {}
+    for name in dir(SureMark):
+        if name.startswith('CMD_'):
+            table[getattr(SureMark, name)] = name[4:].lower()
+    table[SureMark.ALIGN_POSITIONS] = 'align_positions'
+    table[SureMark.MAX_PRINT_SPEED] = 'max_print_speed'
+    return table
+
+
+class Histogram:
+    """
+    Histogram with fixed bucket bounds, using a constant amount of memory no matter how many values are observed.
+    """
+
+    def __init__(self, bounds):
+        #: Upper bounds of the buckets, an implicit last bucket takes everything above
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns (upper bound, number of values less or equal) pairs, the last bound being ``float('inf')``.
+        """
+        out = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+
+class Metrics:
+    """
+    Collects counters and latencies of a :class:`~posprinter.suremark.SureMark` printer, pass it as ``metrics`` when
+    creating the printer. Writes are counted per command, recognized by their leading command bytes (plain text
+    counts as "text"), once they were written to the device: commands in a batch when it is sent, a discarded batch
+    is not counted. For commands that make the printer respond, the time from the write until the response is read
+    is recorded in a histogram per command. Responses are checked for the conditions in :attr:`EVENTS`, which are counted.
+
+    :func:`export` renders everything in the Prometheus text format, ``labels`` are added to every sample (for
+    example ``{'printer': '/dev/ttyUSB0'}``). Without a ``Metrics`` instance, the printer only pays for a check of
+    ``None`` per write and message.
+    """
+
+    #: Default latency histogram bounds in seconds
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    #: Commands that make the printer respond
+    REQUESTS = ('retrieve_printer_id', 'retrieve_printer_usage_statistics', 'retrieve_user_flash',
+                'retrieve_user_flash_size')
+
+    #: Counted status conditions
+    EVENTS = (
+        ('command_rejected', PrinterMessage.STATUS_COMMAND_REJECTED),
+        ('cover_open', PrinterMessage.STATUS_COVER_OPEN),
+        ('print_error', PrinterMessage.STATUS_PRINT_ERROR),
+        ('buffer_full', PrinterMessage.STATUS_BUFFER_FULL),
+        ('home_error', PrinterMessage.STATUS_HOME_ERROR),
+        ('flash_error', PrinterMessage.STATUS_FLASH_ERROR),
+        ('firmware_error', PrinterMessage.STATUS_FIRMWARE_ERROR),
+        ('document_feed_error', PrinterMessage.STATUS_DOCUMENT_FEED_ERROR),
+        ('head_hot', PrinterMessage.STATUS_HEAD_HOT),
+    )
+
+    #: Maximum number of requests waiting for a response that are tracked
+    MAX_PENDING = 256
+
+    def __init__(self, labels=None, buckets=LATENCY_BUCKETS, clock=time.monotonic):
+        self.__labels = dict(labels or {})
+        self.__buckets = buckets
+        self.__clock = clock
+        self.__table = _command_table()
+        self.__lengths = sorted(set(len(k) for k in self.__table), reverse=True)
+        self.__requests = frozenset(self.REQUESTS)
+        self.__event_mask = 0
+        for _, bit in self.EVENTS:
+            self.__event_mask |= bit
+        self.__pending = collections.deque(maxlen=self.MAX_PENDING)
+        self.reset()
+
+    def reset(self):
+        #: Number of writes per command
+        self.commands = collections.Counter()
+        #: Bytes written per command
+        self.command_bytes = collections.Counter()
+        #: Latency histograms per request command
+        self.latency = {}
+        #: Total bytes written
+        self.bytes_written = 0
+        #: Total bytes of the messages received
+        self.bytes_read = 0
+        #: Number of messages received
+        self.messages = 0
+        #: Number of reads that timed out
+        self.timeouts = 0
+        #: Number of messages that had the condition set, by event name
+        self.events = collections.Counter()
+        self.__pending.clear()
+
+    def classify(self, data):
+        """
+        Returns the name of the command "data" starts with.
+        """
+        for n in self.__lengths:
+            name = self.__table.get(bytes(data[:n]))
+            if name is not None:
+                return name
+        return 'text'
+
+    def written(self, data):
+        """
+        Called for every command written to the device.
+        """
+        name = self.classify(data)
+        n = len(data)
+        self.commands[name] += 1
+        self.command_bytes[name] += n
+        self.bytes_written += n
+        if name in self.__requests:
+            self.__pending.append((name, self.__clock()))
+
+    def received(self, message, length):
+        """
+        Called for every message received, ``length`` being its size on the wire.
+        """
+        self.messages += 1
+        self.bytes_read += length
+        status = message.status()
+        if status & self.__event_mask:
+            for event, bit in self.EVENTS:
+                if status & bit:
+                    self.events[event] += 1
+        if self.__pending:
+            name, start = self.__pending.popleft()
+            hist = self.latency.get(name)
+            if hist is None:
+                hist = self.latency[name] = Histogram(self.__buckets)
+            hist.observe(self.__clock() - start)
+
+    def timed_out(self, forget=True):
+        """
+        Called when waiting for a message timed out. With ``forget``, the outstanding requests are no longer
+        expected to be answered.
+        """
+        self.timeouts += 1
+        if forget:
+            self.__pending.clear()
+
+    def __labels_text(self, extra=None):
+        labels = dict(self.__labels)
+        if extra:
+            labels.update(extra)
+        if not labels:
+            return ''
+        parts = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                 for k, v in sorted(labels.items())]
+        return '{' + ','.join(parts) + '}'
+
+    def export(self, prefix='posprinter'):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, kind, text, samples):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, text))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+            for suffix, labels, value in samples:
+                lines.append('{}_{}{}{} {}'.format(prefix, name, suffix, self.__labels_text(labels), value))
+
+        metric('commands_total', 'counter', 'Commands written, by command',
+               [('', {'command': c}, v) for c, v in sorted(self.commands.items())])
+        metric('command_bytes_total', 'counter', 'Bytes written, by command',
+               [('', {'command': c}, v) for c, v in sorted(self.command_bytes.items())])
+        metric('bytes_written_total', 'counter', 'Bytes written to the printer', [('', None, self.bytes_written)])
+        metric('bytes_read_total', 'counter', 'Bytes of messages read from the printer', [('', None, self.bytes_read)])
+        metric('messages_total', 'counter', 'Messages read from the printer', [('', None, self.messages)])
+        metric('timeouts_total', 'counter', 'Reads that timed out', [('', None, self.timeouts)])
+        metric('status_events_total', 'counter', 'Messages reporting a condition, by condition',
+               [('', {'event': e}, self.events[e]) for e, _ in self.EVENTS])
+        samples = []
+        for command, hist in sorted(self.latency.items()):
+            for bound, count in hist.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append(('_bucket', {'command': command, 'le': le}, count))
+            samples.append(('_sum', {'command': command}, hist.sum))
+            samples.append(('_count', {'command': command}, hist.count))
+        metric('request_latency_seconds', 'histogram', 'Time from a request until its response was read', samples)
+        return '\n'.join(lines) + '\n'
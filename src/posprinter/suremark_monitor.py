@@ -0,0 +1,196 @@
+#
+# Background status monitoring for SureMark printers
+#
+
+import contextlib
+import functools
+import logging
+import operator
+import threading
+
+from .suremark_status import PrinterMessage
+
+_log = logging.getLogger(__name__)
+
+
+class StatusMonitor:
+    """
+    Polls the status of a :class:`~posprinter.suremark.SureMark` printer in a background thread and reports
+    transitions of selected status bits to listeners, as the printer never sends messages on its own.
+
+    Polling is fast while a job is active (see :func:`job`), the print buffer is not empty or an error condition is
+    set. Once the printer is idle, the interval doubles with every poll until it reaches ``slow_interval``. Listeners
+    are called as ``listener(event, active, message)`` with one of the names in :attr:`EVENTS`, only when the bit
+    changed since the previous poll. Exceptions raised by listeners are logged and otherwise ignored. If polling
+    fails, the ``offline`` event is reported (with ``message`` None), and reported as inactive once the printer
+    answers again.
+
+    Polls and other use of the printer must not overlap, pass the lock that guards the printer as ``lock``.
+    """
+
+    #: Reported events and the status bits they follow
+    EVENTS = {
+        'cover_open': PrinterMessage.STATUS_COVER_OPEN,
+        'print_error': PrinterMessage.STATUS_PRINT_ERROR,
+        'command_rejected': PrinterMessage.STATUS_COMMAND_REJECTED,
+        'buffer_full': PrinterMessage.STATUS_BUFFER_FULL,
+        'home_error': PrinterMessage.STATUS_HOME_ERROR,
+        'document_error': PrinterMessage.STATUS_DOCUMENT_ERROR,
+        'flash_error': PrinterMessage.STATUS_FLASH_ERROR,
+        'firmware_error': PrinterMessage.STATUS_FIRMWARE_ERROR,
+        'print_key': PrinterMessage.STATUS_PRINT_KEY_PRESSED,
+        'document_feed_error': PrinterMessage.STATUS_DOCUMENT_FEED_ERROR,
+        'head_hot': PrinterMessage.STATUS_HEAD_HOT,
+    }
+
+    #: Status bits that keep polling fast while set
+    ATTENTION_BITS = functools.reduce(operator.or_, [
+        PrinterMessage.STATUS_COVER_OPEN, PrinterMessage.STATUS_PRINT_ERROR, PrinterMessage.STATUS_HOME_ERROR,
+        PrinterMessage.STATUS_DOCUMENT_ERROR, PrinterMessage.STATUS_FLASH_ERROR, PrinterMessage.STATUS_FIRMWARE_ERROR,
+        PrinterMessage.STATUS_DOCUMENT_FEED_ERROR, PrinterMessage.STATUS_HEAD_HOT,
+    ])
+
+    def __init__(self, printer, listener=None, fast_interval=0.2, slow_interval=5.0, lock=None):
+        if printer is None:
+            raise ValueError('Can\'t operate without a printer')
+        if fast_interval <= 0 or slow_interval < fast_interval:
+            raise ValueError('Intervals must satisfy 0 < fast_interval <= slow_interval')
+        self.__printer = printer
+        self.__listeners = [] if listener is None else [listener]
+        self.__fast = fast_interval
+        self.__slow = slow_interval
+        self.__interval = fast_interval
+        self.__lock = lock
+        self.__mask = 0
+        for bit in self.EVENTS.values():
+            self.__mask |= bit
+        self.__status = None
+        self.__offline = False
+        self.__jobs = 0
+        self.__jobs_lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__stopped = threading.Event()
+        self.__thread = None
+        #: Number of polls performed
+        self.polls = 0
+        #: Number of events reported
+        self.events = 0
+
+    def add_listener(self, listener):
+        self.__listeners.append(listener)
+
+    def last_status(self):
+        """
+        Returns the status of the last successful poll as an integer (see
+        :class:`~posprinter.suremark_status.PrinterMessage`), None before the first one.
+        """
+        return self.__status
+
+    def interval(self):
+        """
+        The current polling interval in seconds.
+        """
+        return self.__interval
+
+    def job_started(self):
+        """
+        Marks the start of a job, switching to fast polling right away.
+        """
+        with self.__jobs_lock:
+            self.__jobs += 1
+        self.__interval = self.__fast
+        self.__wakeup.set()
+
+    def job_finished(self):
+        with self.__jobs_lock:
+            self.__jobs = max(0, self.__jobs - 1)
+
+    @contextlib.contextmanager
+    def job(self):
+        """
+        Context manager wrapping :func:`job_started` and :func:`job_finished`.
+        """
+        self.job_started()
+        try:
+            yield
+        finally:
+            self.job_finished()
+
+    def __emit(self, event, active, message):
+        self.events += 1
+        for listener in self.__listeners:
+            # a failing listener must neither stop the polling nor keep the others from being notified
+            try:
+                listener(event, active, message)
+            except Exception:
+                _log.exception('Status listener %r failed on event "%s"', listener, event)
+
+    def poll(self):
+        """
+        Polls once, reports the transitions and adjusts the interval. Called by the thread, but can also be used
+        without starting it. Returns the message or None if the printer did not answer.
+        """
+        self.polls += 1
+        try:
+            if self.__lock is not None:
+                with self.__lock:
+                    m = self.__printer.query_status()
+            else:
+                m = self.__printer.query_status()
+        except (ValueError, OSError):
+            if not self.__offline:
+                self.__offline = True
+                self.__emit('offline', True, None)
+            self.__interval = self.__fast
+            return None
+        if self.__offline:
+            self.__offline = False
+            self.__emit('offline', False, m)
+
+        status = m.status()
+        changed = status if self.__status is None else status ^ self.__status
+        self.__status = status
+        if changed & self.__mask:
+            for event, bit in self.EVENTS.items():
+                if changed & bit:
+                    self.__emit(event, status & bit != 0, m)
+
+        if self.__jobs > 0 or not m.buffer_empty() or status & self.ATTENTION_BITS:
+            self.__interval = self.__fast
+        else:
+            self.__interval = min(self.__slow, self.__interval * 2)
+        return m
+
+    def start(self):
+        """
+        Starts polling in a background thread.
+        """
+        if self.__thread is not None:
+            raise ValueError('Monitor already running')
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, name='StatusMonitor', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread and waits for it to end.
+        """
+        if self.__thread is None:
+            return
+        self.__stopped.set()
+        self.__wakeup.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            self.poll()
+            self.__wakeup.wait(self.__interval)
+            self.__wakeup.clear()
@@ -0,0 +1,176 @@
+#
+# Pool of SureMark printers with a job dispatcher
+#
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+from .suremark import SureMark
+
+
+class PooledPrinter:
+    """
+    A printer managed by a :class:`PrinterPool`, along with its queue and counters.
+    """
+
+    def __init__(self, name, printer, printer_id=None):
+        #: Name given to the pool, usually the serial port
+        self.name = name
+        #: The :class:`~posprinter.suremark.SureMark` instance
+        self.printer = printer
+        #: :class:`~posprinter.suremark_status.PrinterID` used for capability checks, None if not identified
+        self.printer_id = printer_id
+        #: Number of jobs completed (successfully or not)
+        self.jobs_done = 0
+        #: Number of jobs that raised an exception
+        self.jobs_failed = 0
+        #: Seconds spent running jobs
+        self.busy_time = 0.0
+        self._jobs = collections.deque()
+        self._running = False
+
+    def queue_depth(self):
+        """
+        Number of jobs waiting or running on this printer.
+        """
+        return len(self._jobs) + (1 if self._running else 0)
+
+    def throughput(self):
+        """
+        Jobs per second of busy time.
+        """
+        if self.busy_time <= 0:
+            return 0.0
+        return self.jobs_done / self.busy_time
+
+
+class PrinterPool:
+    """
+    Owns one :class:`~posprinter.suremark.SureMark` per serial device and runs jobs on them. A job is a callable that
+    takes the ``SureMark`` instance. Jobs for the same printer run one after another, different printers run in
+    parallel on a thread pool. :func:`submit` picks the printer with the shortest queue among those whose
+    :class:`~posprinter.suremark_status.PrinterID` satisfies the ``requires`` predicate, for example to route cheque
+    jobs to printers with a MICR reader::
+
+        with PrinterPool({'/dev/ttyUSB0': ser0, '/dev/ttyUSB1': ser1}) as pool:
+            f = pool.submit(print_cheque, requires=lambda pid: pid.has_micr())
+            f.result()
+
+    The printer ID doesn't tell the exact model (``is_Tx2`` can't distinguish a Tx2 from a Tx1, see
+    :class:`~posprinter.suremark_status.PrinterID`), so predicates should test the features it reports, such as
+    ``has_micr``, ``has_check_flipper`` or ``is_58mm``.
+    """
+
+    def __init__(self, devices, identify=True, printer_ids=None, max_workers=None, clock=time.monotonic,
+                 capability_cache=None, identities=None, **kwargs):
+        """
+        ``devices`` maps names to open serial devices. If ``identify`` is set, each printer is asked for its printer
+        ID (except those listed in ``printer_ids``, which maps names to already known IDs). With a
+        :class:`~posprinter.suremark_capcache.CapabilityCache` as ``capability_cache``, the IDs are taken from the
+        cache (the names being the ports), ``identities`` maps names to the identity of the device on the port (see
+        :func:`~posprinter.suremark_capcache.port_identity`). Remaining keyword arguments are passed to ``SureMark``.
+        """
+        if not devices:
+            raise ValueError('Can\'t operate without devices')
+        printer_ids = printer_ids or {}
+        identities = identities or {}
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self.__printers = collections.OrderedDict()
+        for name in sorted(devices):
+            printer = SureMark(devices[name], **kwargs)
+            pid = printer_ids.get(name)
+            if pid is None and identify:
+                if capability_cache is not None:
+                    pid = capability_cache.get(printer, name, identities.get(name, '')).printer_id
+                else:
+                    pid = printer.identify()
+            self.__printers[name] = PooledPrinter(name, printer, pid)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(self.__printers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def printers(self):
+        """
+        Returns the :class:`PooledPrinter` objects.
+        """
+        return list(self.__printers.values())
+
+    def submit(self, job, requires=None, printer=None):
+        """
+        Queues "job" and returns a ``concurrent.futures.Future`` for its result. ``requires`` is a predicate on the
+        :class:`~posprinter.suremark_status.PrinterID`, ``printer`` forces a printer by name.
+        """
+        future = concurrent.futures.Future()
+        with self.__lock:
+            if self.__closed:
+                raise ValueError('Pool is shut down')
+            if printer is not None:
+                target = self.__printers[printer]
+            else:
+                candidates = [p for p in self.__printers.values()
+                              if requires is None or (p.printer_id is not None and requires(p.printer_id))]
+                if not candidates:
+                    raise ValueError('No printer in the pool satisfies the requirements')
+                target = min(candidates, key=lambda p: (p.queue_depth(), p.busy_time))
+            target._jobs.append((job, future))
+            if not target._running:
+                target._running = True
+                self.__executor.submit(self.__drain, target)
+        return future
+
+    def __drain(self, target):
+        # runs on a worker thread, at most one per printer, which serializes access to the port
+        while True:
+            with self.__lock:
+                if not target._jobs:
+                    target._running = False
+                    return
+                job, future = target._jobs.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = self.__clock()
+            try:
+                result = job(target.printer)
+            except Exception as e:
+                self.__finished(target, start, failed=True)
+                future.set_exception(e)
+            else:
+                self.__finished(target, start)
+                future.set_result(result)
+
+    def __finished(self, target, start, failed=False):
+        # the counters are read under the lock by submit and stats
+        with self.__lock:
+            target.busy_time += self.__clock() - start
+            target.jobs_done += 1
+            if failed:
+                target.jobs_failed += 1
+
+    def stats(self):
+        """
+        Returns per printer statistics as a dict of dicts, keyed by name.
+        """
+        with self.__lock:
+            return {p.name: {
+                'queue_depth': p.queue_depth(),
+                'jobs_done': p.jobs_done,
+                'jobs_failed': p.jobs_failed,
+                'busy_time': p.busy_time,
+                'throughput': p.throughput(),
+            } for p in self.__printers.values()}
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting jobs, waiting for queued ones to finish if ``wait`` is set.
+        """
+        with self.__lock:
+            self.__closed = True
+        self.__executor.shutdown(wait=wait)
@@ -0,0 +1,177 @@
+#
+# Conversion of images to raster graphics commands
+#
+
+import collections
+import hashlib
+
+#: Print raster image (``GS v 0``), requires parameters (mode, width in bytes, height in dots) and the image data
+CMD_PRINT_RASTER_IMAGE = b'\x1d\x76\x30'
+#: Normal (not scaled) raster mode
+RASTER_MODE_NORMAL = 0
+#: Dots per line on 80mm paper
+PAPER_80MM_DOTS = 576
+#: Dots per line on 58mm paper
+PAPER_58MM_DOTS = 384
+
+# 4x4 Bayer matrix, scaled to thresholds in the range 0..255
+_BAYER_4 = [
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+]
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('Raster images require numpy, install posprinter[raster]')
+    return numpy
+
+
+def paper_width(pid):
+    """
+    Returns the number of dots per line for the printer with the :class:`~posprinter.suremark_status.PrinterID`
+    "pid".
+    """
+    return PAPER_58MM_DOTS if pid.is_58mm() else PAPER_80MM_DOTS
+
+
+def to_monochrome(image, threshold=128, dither=False):
+    """
+    Converts "image" to a two dimensional boolean array (True for black dots). The image can be anything
+    ``numpy.asarray`` accepts with 8 bit gray values, or an object with a ``convert`` method such as a Pillow image.
+    Without ``dither``, pixels darker than ``threshold`` are black. With ``dither``, an ordered (Bayer) dither is
+    applied, which keeps shades of gray visible.
+    """
+    np = _numpy()
+    if hasattr(image, 'convert'):
+        image = image.convert('L')
+    pixels = np.asarray(image)
+    if pixels.ndim == 3:
+        # average the color channels
+        pixels = pixels[:, :, :3].mean(axis=2)
+    if pixels.ndim != 2:
+        raise ValueError('Expected a two dimensional image')
+    if pixels.dtype == np.bool_:
+        return pixels.copy()
+    if not dither:
+        return pixels < threshold
+    bayer = (np.array(_BAYER_4, dtype=np.float32) + 0.5) * (256 / 16)
+    height, width = pixels.shape
+    thresholds = np.tile(bayer, ((height + 3) // 4, (width + 3) // 4))[:height, :width]
+    return pixels < thresholds
+
+
+def fit_width(mono, width, align='center'):
+    """
+    Returns the boolean image "mono" sized to ``width`` dots: wider images are scaled down (nearest neighbour,
+    keeping the aspect ratio), narrower ones padded according to ``align`` ('left', 'center' or 'right').
+    """
+    np = _numpy()
+    height, current = mono.shape
+    if current > width:
+        rows = (np.arange(max(1, height * width // current)) * current // width)
+        cols = (np.arange(width) * current // width)
+        return mono[rows[:, None], cols]
+    if current == width:
+        return mono
+    if align == 'left':
+        left = 0
+    elif align == 'center':
+        left = (width - current) // 2
+    elif align == 'right':
+        left = width - current
+    else:
+        raise ValueError('Invalid alignment')
+    out = np.zeros((height, width), dtype=np.bool_)
+    out[:, left:left + current] = mono
+    return out
+
+
+def raster_commands(mono, band_height=24):
+    """
+    Packs the boolean image "mono" into raster image commands of at most ``band_height`` lines each and returns them
+    as bytes. Printing in bands lets the printer start before the whole image is transferred.
+    """
+    np = _numpy()
+    if band_height < 1 or band_height > 0xffff:
+        raise ValueError('Band height outside allowed range 1 <= h <= 65535')
+    packed = np.packbits(mono, axis=1)
+    height, width_bytes = packed.shape
+    out = bytearray()
+    for top in range(0, height, band_height):
+        band = packed[top:top + band_height]
+        out += CMD_PRINT_RASTER_IMAGE
+        out += bytes([RASTER_MODE_NORMAL])
+        out += width_bytes.to_bytes(2, 'little')
+        out += len(band).to_bytes(2, 'little')
+        out += band.tobytes()
+    return bytes(out)
+
+
+class RasterConverter:
+    """
+    Converts images to raster commands for a given paper width and keeps the results of the last ``maxsize``
+    conversions, keyed by a hash of the image content, so images printed over and over (such as coupons) are
+    converted once::
+
+        conv = RasterConverter(printer_id=p.identify(), dither=True)
+        p.write(conv.convert(image))
+
+    The width is taken from ``width`` or, if not given, from the paper width reported in ``printer_id``.
+    """
+
+    def __init__(self, width=None, printer_id=None, threshold=128, dither=False, align='center', band_height=24,
+                 maxsize=16):
+        if width is None:
+            width = paper_width(printer_id) if printer_id is not None else PAPER_80MM_DOTS
+        if width < 8 or width % 8 != 0:
+            raise ValueError('Width must be a positive multiple of 8')
+        self.__width = width
+        self.__threshold = threshold
+        self.__dither = dither
+        self.__align = align
+        self.__band_height = band_height
+        self.__maxsize = maxsize
+        self.__cache = collections.OrderedDict()
+        #: Number of conversions answered from the cache
+        self.hits = 0
+        #: Number of conversions performed
+        self.misses = 0
+
+    def width(self):
+        return self.__width
+
+    def __key(self, image):
+        np = _numpy()
+        if hasattr(image, 'convert'):
+            image = image.convert('L')
+        pixels = np.ascontiguousarray(image)
+        h = hashlib.sha256(pixels.tobytes())
+        h.update(repr((pixels.shape, pixels.dtype.str)).encode())
+        return h.digest(), pixels
+
+    def convert(self, image):
+        """
+        Returns the raster commands for "image" as bytes.
+        """
+        key, pixels = self.__key(image)
+        data = self.__cache.get(key)
+        if data is not None:
+            self.hits += 1
+            self.__cache.move_to_end(key)
+            return data
+        self.misses += 1
+        mono = to_monochrome(pixels, threshold=self.__threshold, dither=self.__dither)
+        mono = fit_width(mono, self.__width, align=self.__align)
+        data = raster_commands(mono, band_height=self.__band_height)
+        self.__cache[key] = data
+        if len(self.__cache) > self.__maxsize:
+            self.__cache.popitem(last=False)
+        return data
+
+    def clear(self):
+        self.__cache.clear()
@@ -0,0 +1,320 @@
+#
+# Priority scheduling of jobs on a SureMark printer
+#
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+from .suremark import SureMark
+from .suremark_metrics import Histogram
+from .suremark_template import CommandRecorder
+
+#: A priority class: lower ``priority`` values run first, ``slo`` is the target in seconds from submitting a job of
+#: the class until it is printed
+PriorityClass = collections.namedtuple('PriorityClass', ['name', 'priority', 'slo'])
+
+#: Default classes, customer receipts before kitchen tickets before reports
+DEFAULT_CLASSES = (
+    PriorityClass('receipt', 0, 5.0),
+    PriorityClass('kitchen', 1, 30.0),
+    PriorityClass('report', 2, 600.0),
+)
+
+
+class SegmentRecorder(SureMark):
+    """
+    Records the output of ``SureMark`` methods, split into segments after every cut (:func:`print_form_feed_cut`),
+    the points where a job can be interrupted without mixing another job into a receipt. Within
+    :func:`~posprinter.suremark.SureMark.batch`, a cut ends the segment with the commands collected so far.
+    """
+
+    def __init__(self):
+        self.__recorder = CommandRecorder()
+        super().__init__(self.__recorder)
+        #: The segments recorded so far
+        self.segments = []
+
+    def print_form_feed_cut(self):
+        with self.batch() as batch:
+            super().print_form_feed_cut()
+            batch.flush()
+        self.segments.append(self.__recorder.take())
+
+    def take(self):
+        """
+        Returns the recorded segments, including the data after the last cut, and clears the recording.
+        """
+        segments = self.segments
+        rest = self.__recorder.take()
+        if rest:
+            segments.append(rest)
+        self.segments = []
+        return segments
+
+
+class _Job:
+
+    def __init__(self, cls, segments, future, submitted):
+        self.cls = cls
+        self.segments = collections.deque(segments)
+        self.future = future
+        self.submitted = submitted
+        self.started = None
+        self.promoted = False
+
+
+class ClassStats:
+    """
+    Counters of a priority class.
+    """
+
+    #: Bounds of the wait time histograms in seconds
+    WAIT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+    def __init__(self, cls):
+        #: The :data:`PriorityClass`
+        self.cls = cls
+        #: Number of jobs submitted
+        self.submitted = 0
+        #: Number of jobs printed
+        self.completed = 0
+        #: Number of jobs that raised an exception
+        self.failed = 0
+        #: Number of times a job of the class was interrupted at a cut for a job of a higher class
+        self.preemptions = 0
+        #: Number of jobs of the class that were promoted ahead of higher classes because they waited too long
+        self.promotions = 0
+        #: Number of jobs that took longer than the SLO
+        self.slo_misses = 0
+        #: :class:`~posprinter.suremark_metrics.Histogram` of the seconds from submitting until printing started
+        self.wait = Histogram(self.WAIT_BUCKETS)
+        #: Longest wait in seconds
+        self.max_wait = 0.0
+        #: :class:`~posprinter.suremark_metrics.Histogram` of the seconds from submitting until the job was printed
+        self.latency = Histogram(self.WAIT_BUCKETS)
+
+    def mean_wait(self):
+        if self.wait.count == 0:
+            return 0.0
+        return self.wait.sum / self.wait.count
+
+    def slo_attainment(self):
+        """
+        Share of the completed jobs that were printed within the SLO.
+        """
+        if self.completed == 0:
+            return 1.0
+        return 1.0 - self.slo_misses / self.completed
+
+
+class JobScheduler:
+    """
+    Runs jobs of different priority classes on one :class:`~posprinter.suremark.SureMark` printer, on a background
+    thread. A job is bytes, a list of segments (bytes) or a callable that builds it on a :class:`SegmentRecorder`,
+    which splits it after every cut. Between segments, the scheduler picks the next segment from the highest class
+    with waiting jobs, so a customer receipt is printed after the current page of a long report instead of after the
+    whole report::
+
+        with JobScheduler(p) as scheduler:
+            scheduler.submit(print_inventory, 'report')
+            scheduler.submit(lambda r: print_receipt(r, sale), 'receipt').result()
+
+    Within a class, jobs run in the order they were submitted. So that a steady stream of receipts can't starve the
+    lower classes, a job that waited longer than ``aging`` times the SLO of its class is promoted: it runs before the
+    jobs of higher classes that didn't wait that long (None: strict priority). :func:`stats` reports the wait times
+    per class and how often the SLO of the class was met. Segments are sent with ``spooler`` (a
+    :class:`~posprinter.suremark_spooler.Spooler`) if given, otherwise with a single write.
+    """
+
+    #: Share of the SLO of its class a job waits at most before it is promoted ahead of higher classes
+    AGING = 0.5
+
+    def __init__(self, printer, classes=DEFAULT_CLASSES, spooler=None, aging=AGING, clock=time.monotonic):
+        if printer is None:
+            raise ValueError('Can\'t operate without a printer')
+        if not classes:
+            raise ValueError('At least one priority class is required')
+        if aging is not None and aging <= 0:
+            raise ValueError('aging must be positive or None')
+        self.__printer = printer
+        self.__spooler = spooler
+        self.__aging = aging
+        self.__clock = clock
+        self.__classes = sorted(classes, key=lambda c: c.priority)
+        self.__queues = collections.OrderedDict((c.name, collections.deque()) for c in self.__classes)
+        self.__stats = collections.OrderedDict((c.name, ClassStats(c)) for c in self.__classes)
+        self.__cond = threading.Condition()
+        self.__current = None
+        self.__stopping = False
+        self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def start(self):
+        """
+        Starts the background thread that prints the jobs.
+        """
+        if self.__thread is not None:
+            raise ValueError('Scheduler already running')
+        self.__stopping = False
+        self.__thread = threading.Thread(target=self.__run, name='JobScheduler', daemon=True)
+        self.__thread.start()
+
+    def shutdown(self, wait=True):
+        """
+        Stops the background thread. With ``wait``, the queued jobs are printed first, otherwise only the jobs that
+        already started printing are finished and the others are cancelled.
+        """
+        if self.__thread is None:
+            return
+        with self.__cond:
+            self.__stopping = True
+            if not wait:
+                for queue in self.__queues.values():
+                    for job in list(queue):
+                        if job.started is None:
+                            job.future.cancel()
+                            queue.remove(job)
+            self.__cond.notify_all()
+        self.__thread.join()
+        self.__thread = None
+
+    def submit(self, job, cls):
+        """
+        Queues "job" in the class named "cls" and returns a ``concurrent.futures.Future`` that completes when it is
+        printed.
+        """
+        queue = self.__queues.get(cls)
+        if queue is None:
+            raise ValueError('Unknown priority class "{}"'.format(cls))
+        if callable(job):
+            recorder = SegmentRecorder()
+            job(recorder)
+            segments = recorder.take()
+        elif isinstance(job, (bytes, bytearray, memoryview)):
+            segments = [job]
+        else:
+            segments = list(job)
+        segments = [segment for segment in segments if len(segment)]
+        if not segments:
+            raise ValueError('Job is empty')
+        future = concurrent.futures.Future()
+        with self.__cond:
+            if self.__stopping:
+                raise ValueError('Scheduler is shutting down')
+            queue.append(_Job(cls, segments, future, self.__clock()))
+            self.__stats[cls].submitted += 1
+            self.__cond.notify_all()
+        return future
+
+    def queue_depth(self, cls=None):
+        """
+        Number of jobs waiting or being printed, in the class "cls" or in total.
+        """
+        with self.__cond:
+            if cls is not None:
+                return len(self.__queues[cls])
+            return sum(len(q) for q in self.__queues.values())
+
+    def __next_job(self):
+        # called with the lock held: the first job of the highest class that has one, unless the first job of a lower
+        # class waited longer than its share of the SLO
+        now = self.__clock()
+        first = None
+        for name, queue in self.__queues.items():
+            while queue and queue[0].future.cancelled():
+                queue.popleft()
+            if not queue:
+                continue
+            job = queue[0]
+            if first is None:
+                first = job
+                if self.__aging is None:
+                    break
+            if now - job.submitted > self.__aging * self.__stats[name].cls.slo:
+                if job is not first and not job.promoted:
+                    job.promoted = True
+                    self.__stats[name].promotions += 1
+                return job
+        return first
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                job = self.__next_job()
+                while job is None:
+                    if self.__stopping:
+                        return
+                    self.__cond.wait()
+                    job = self.__next_job()
+                current = self.__current
+                if current is not None and current is not job and current.segments and current.started is not None:
+                    self.__stats[current.cls].preemptions += 1
+                self.__current = job
+                segment = job.segments.popleft()
+                now = self.__clock()
+                if job.started is None:
+                    job.started = now
+                    if not job.future.set_running_or_notify_cancel():
+                        self.__queues[job.cls].popleft()
+                        continue
+                    wait = now - job.submitted
+                    stats = self.__stats[job.cls]
+                    stats.wait.observe(wait)
+                    stats.max_wait = max(stats.max_wait, wait)
+            try:
+                if self.__spooler is not None:
+                    self.__spooler.print_job(segment)
+                else:
+                    self.__printer.write(segment)
+            except Exception as e:
+                with self.__cond:
+                    self.__queues[job.cls].remove(job)
+                    self.__stats[job.cls].failed += 1
+                    self.__current = None
+                job.future.set_exception(e)
+                continue
+            if job.segments:
+                continue
+            with self.__cond:
+                self.__queues[job.cls].remove(job)
+                self.__current = None
+                stats = self.__stats[job.cls]
+                latency = self.__clock() - job.submitted
+                stats.latency.observe(latency)
+                stats.completed += 1
+                if latency > stats.cls.slo:
+                    stats.slo_misses += 1
+            job.future.set_result(None)
+
+    def class_stats(self, cls):
+        """
+        Returns the :class:`ClassStats` of the class named "cls".
+        """
+        return self.__stats[cls]
+
+    def stats(self):
+        """
+        Returns per class statistics as a dict of dicts, keyed by class name.
+        """
+        with self.__cond:
+            return {name: {
+                'queue_depth': len(self.__queues[name]),
+                'submitted': s.submitted,
+                'completed': s.completed,
+                'failed': s.failed,
+                'preemptions': s.preemptions,
+                'promotions': s.promotions,
+                'mean_wait': s.mean_wait(),
+                'max_wait': s.max_wait,
+                'slo': s.cls.slo,
+                'slo_misses': s.slo_misses,
+                'slo_attainment': s.slo_attainment(),
+            } for name, s in self.__stats.items()}
@@ -0,0 +1,379 @@
+#
+# Simulated SureMark printer for testing without hardware
+#
+
+import collections
+import os
+import select
+import threading
+
+from .suremark_status import PrinterMessage
+
+
+class VirtualClock:
+    """
+    A clock that only advances when slept on, so simulations run as fast as the host allows while the timing stays
+    the same as with real hardware. Instances are callable like ``time.monotonic``.
+    """
+
+    def __init__(self, start=0.0):
+        self.__now = start
+
+    def __call__(self):
+        return self.__now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.__now += seconds
+
+
+class SimulatedSureMark:
+    """
+    Behaves like an open ``serial.Serial`` connected to a SureMark printer, to be passed to
+    :class:`~posprinter.suremark.SureMark`. It models:
+
+    * The transmission time of every byte at ``baudrate`` (10 bits per byte), a write returns once the data is sent.
+    * A print buffer of ``buffer_size`` bytes that drains at ``drain_rate`` bytes per second. Data that does not fit is
+      lost and counted in :attr:`overflows`.
+    * Heating of the print head: printing heats it, it cools at a constant rate. Once hot, the "head hot" bit is set
+      and the buffer drains at ``drain_rate * hot_factor`` until it cooled down to 80% of the limit.
+    * Responses with the 8 status bytes to the printer ID request, usage statistics requests (MCT counters taken from
+      :attr:`counters`) and user flash reads (from :attr:`flash`).
+
+    Everything that is not a request is treated as print data, requests are recognized by their command bytes only.
+    By default the simulation runs on a :class:`VirtualClock`, reads that have to wait advance it instead of
+    sleeping. Pass ``clock=time.monotonic, sleep=time.sleep`` to run in real time, as required by :func:`serve_pty`.
+
+    Faults are injected with :func:`inject`, they apply to the following responses or to a period of time.
+    """
+
+    #: Printer ID payload of a Tx6 (0x03) with 80mm paper
+    PRINTER_ID = b'\x30\x03\x08\x00\x00'
+    #: Engineering code level reported in status byte 3
+    EC_LEVEL = 0x44
+    #: Size of the print buffer in bytes
+    BUFFER_SIZE = 4096
+    #: Free space below which the buffer full bit is set
+    BUFFER_FULL_MARK = 1024
+    #: Bytes per second the printer prints when cool
+    DRAIN_RATE = 2000.0
+    #: Seconds between receiving a request and starting to send the response
+    LATENCY = 0.002
+
+    # (command prefix, total length) of commands that are answered
+    _REQUESTS = (
+        (b'\x1d\x49\x01', 3),
+        (b'\x1b\x51', 3),
+        (b'\x1b\x34', 6),
+    )
+
+    #: Faults that can be injected
+    FAULTS = ('drop_response', 'corrupt_response', 'delay_response', 'reject', 'cover_open', 'head_hot')
+
+    def __init__(self, baudrate=19200, buffer_size=BUFFER_SIZE, drain_rate=DRAIN_RATE, hot_factor=0.5,
+                 heat_limit=20000.0, cooling_rate=1500.0, printer_id=PRINTER_ID, ec_level=EC_LEVEL, counters=None,
+                 flash=b'', timeout=1.0, clock=None, sleep=None):
+        """
+        ``heat_limit`` is the amount of printed bytes (minus cooling) at which the head gets hot, ``cooling_rate`` is
+        the number of bytes worth of heat lost per second. ``timeout`` is the read timeout like for ``serial.Serial``.
+        """
+        if clock is None:
+            vclock = VirtualClock()
+            clock, sleep = vclock, vclock.sleep
+        elif sleep is None:
+            raise ValueError('A custom clock requires a sleep function')
+        self.clock = clock
+        self.sleep = sleep
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.__buffer_size = buffer_size
+        self.__drain_rate = drain_rate
+        self.__hot_factor = hot_factor
+        self.__heat_limit = heat_limit
+        self.__cooling_rate = cooling_rate
+        self.__printer_id = bytes(printer_id)
+        self.__ec_level = ec_level
+        #: Usage counters, keyed by the statistics byte, either as the ``STATS_RAW_*`` constant or as int
+        self.counters = dict(counters or {})
+        #: Content of the user flash
+        self.flash = bytearray(flash)
+
+        self.__lock = threading.RLock()
+        self.__pending = bytearray()
+        self.__level = 0.0
+        self.__heat = 0.0
+        self.__hot = False
+        self.__last = clock()
+        self.__tx_free = self.__last
+        # (time the message has arrived completely, message bytes)
+        self.__responses = collections.deque()
+        self.__rx = bytearray()
+        self.__faults = collections.deque()
+        self.__periods = []
+        self.__closed = False
+
+        #: Bytes received from the host
+        self.bytes_received = 0
+        #: Bytes printed (fractional, as the buffer drains continuously)
+        self.bytes_printed = 0.0
+        #: Bytes lost because the buffer was full
+        self.overflows = 0
+        #: Requests answered
+        self.requests = 0
+        #: Seconds the head was hot
+        self.hot_time = 0.0
+
+    # serial.Serial compatibility
+
+    @property
+    def in_waiting(self):
+        with self.__lock:
+            now = self.clock()
+            self.__deliver(now)
+            return len(self.__rx)
+
+    def close(self):
+        self.__closed = True
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self.__lock:
+            self.__responses.clear()
+            self.__rx.clear()
+
+    # fault injection
+
+    def inject(self, fault, count=1, duration=0.0, delay=0.0):
+        """
+        Injects a fault. Response faults ('drop_response', 'corrupt_response', 'delay_response' by ``delay`` seconds
+        and 'reject', which sets the command rejected bit) apply to the next ``count`` responses. 'cover_open' (the
+        printer stops printing) and 'head_hot' apply for ``duration`` seconds starting now.
+        """
+        if fault not in self.FAULTS:
+            raise ValueError('Unknown fault {}'.format(fault))
+        with self.__lock:
+            if fault in ('cover_open', 'head_hot'):
+                now = self.clock()
+                self.__periods.append((fault, now, now + duration))
+            else:
+                for _ in range(count):
+                    self.__faults.append((fault, delay))
+
+    def __active(self, fault, now):
+        return any(f == fault and start <= now < end for f, start, end in self.__periods)
+
+    # printer model
+
+    def __advance(self, now):
+        dt = now - self.__last
+        if dt <= 0:
+            return
+        self.__last = now
+        self.__periods = [p for p in self.__periods if p[2] > now]
+        if self.__hot:
+            self.hot_time += dt
+        rate = 0.0
+        if not self.__active('cover_open', now):
+            rate = self.__drain_rate * (self.__hot_factor if self.__is_hot(now) else 1.0)
+        printed = min(self.__level, rate * dt)
+        self.__level -= printed
+        self.bytes_printed += printed
+        self.__heat = max(0.0, self.__heat + printed - self.__cooling_rate * dt)
+        if self.__heat >= self.__heat_limit:
+            self.__hot = True
+        elif self.__heat < 0.8 * self.__heat_limit:
+            self.__hot = False
+
+    def __is_hot(self, now):
+        return self.__hot or self.__active('head_hot', now)
+
+    def __status(self, now, response_bit=0):
+        status = PrinterMessage.STATUS_COMMAND_COMPLETE | response_bit | (self.__ec_level << 24)
+        # right home position, reserved bits and document sensors as reported by a Tx6
+        status |= (0x08 << 0) | (0x0f << 8) | (0x20 << 32) | (0x20 << 48)
+        free = self.__buffer_size - self.__level
+        if self.__level < 1:
+            status |= PrinterMessage.STATUS_BUFFER_EMPTY
+        if free < self.BUFFER_FULL_MARK:
+            status |= PrinterMessage.STATUS_BUFFER_FULL
+        if self.__is_hot(now):
+            status |= PrinterMessage.STATUS_HEAD_HOT
+        if self.__active('cover_open', now):
+            status |= PrinterMessage.STATUS_COVER_OPEN
+        return status
+
+    def __respond(self, now, response_bit, payload=b''):
+        self.requests += 1
+        status = self.__status(now, response_bit)
+        delay = 0.0
+        if self.__faults:
+            fault, fault_delay = self.__faults.popleft()
+            if fault == 'drop_response':
+                return
+            if fault == 'reject':
+                status |= PrinterMessage.STATUS_COMMAND_REJECTED
+            elif fault == 'delay_response':
+                delay = fault_delay
+            elif fault == 'corrupt_response':
+                # breaks the reserved bits, the length stays intact
+                status ^= 0xff << 8
+        message = status.to_bytes(8, 'little') + payload
+        message = (len(message) + 2).to_bytes(2, 'big') + message
+        start = max(now + self.LATENCY + delay, self.__responses[-1][0] if self.__responses else 0.0)
+        self.__responses.append((start + len(message) * 10 / self.baudrate, message))
+
+    def __request(self, now, cmd):
+        if cmd[0:2] == b'\x1d\x49':
+            self.__respond(now, PrinterMessage.STATUS_PRINTER_ID_RESPONSE, self.__printer_id)
+        elif cmd[0:2] == b'\x1b\x51':
+            value = self.counters.get(cmd[2], self.counters.get(cmd[2:3], 0)) & 0xffff
+            self.__respond(now, PrinterMessage.STATUS_MCT_RESPONSE, value.to_bytes(2, 'big'))
+        else:
+            count = cmd[2]
+            addr = int.from_bytes(cmd[3:6], 'big')
+            if addr == 0xffffff:
+                payload = '{:08d}'.format(len(self.flash)).encode('ascii')
+            else:
+                payload = bytes(self.flash[addr:addr + count])
+            self.__respond(now, PrinterMessage.STATUS_USER_FLASH_READ_RESPONSE, payload)
+
+    def __print(self, data):
+        free = self.__buffer_size - self.__level
+        accepted = min(len(data), int(free))
+        self.__level += accepted
+        self.overflows += len(data) - accepted
+
+    def __parse(self, now):
+        buf = self.__pending
+        pos = 0
+        while True:
+            found = -1
+            length = 0
+            for prefix, size in self._REQUESTS:
+                i = buf.find(prefix, pos)
+                if i != -1 and (found == -1 or i < found):
+                    found, length = i, size
+            if found == -1:
+                # keep a trailing escape, it may start a request completed by the next write
+                end = len(buf)
+                if end > pos and buf[end - 1] in (0x1b, 0x1d):
+                    end -= 1
+                self.__print(buf[pos:end])
+                del buf[:end]
+                return
+            self.__print(buf[pos:found])
+            if len(buf) - found < length:
+                del buf[:found]
+                return
+            self.__request(now, bytes(buf[found:found + length]))
+            pos = found + length
+
+    def write(self, data):
+        """
+        Sends data to the printer, blocks for the transmission time.
+        """
+        if self.__closed:
+            raise OSError('Port is closed')
+        n = len(data)
+        with self.__lock:
+            now = self.clock()
+            start = max(now, self.__tx_free)
+            self.__tx_free = start + n * 10 / self.baudrate
+            done = self.__tx_free
+        # the printer processes the data as it arrives, so model it as arriving at the end
+        self.sleep(done - now)
+        with self.__lock:
+            now = self.clock()
+            self.__advance(now)
+            self.bytes_received += n
+            self.__pending += data
+            self.__parse(now)
+        return n
+
+    def __deliver(self, now):
+        while self.__responses and self.__responses[0][0] <= now:
+            self.__rx += self.__responses.popleft()[1]
+
+    def read(self, size=1):
+        """
+        Reads up to ``size`` bytes, waiting up to :attr:`timeout` seconds for them.
+        """
+        if self.__closed:
+            raise OSError('Port is closed')
+        deadline = None if self.timeout is None else self.clock() + self.timeout
+        while True:
+            with self.__lock:
+                now = self.clock()
+                self.__advance(now)
+                self.__deliver(now)
+                if len(self.__rx) >= size or (deadline is not None and now >= deadline):
+                    data = bytes(self.__rx[:size])
+                    del self.__rx[:size]
+                    return data
+                wait = None
+                if self.__responses:
+                    wait = self.__responses[0][0] - now
+                if deadline is not None:
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+            if wait is None:
+                # no timeout and nothing will ever arrive
+                wait = 0.01
+            self.sleep(wait)
+
+    def buffer_level(self):
+        """
+        Number of bytes in the print buffer.
+        """
+        with self.__lock:
+            self.__advance(self.clock())
+            return int(self.__level)
+
+    def head_hot(self):
+        with self.__lock:
+            now = self.clock()
+            self.__advance(now)
+            return self.__is_hot(now)
+
+    # pty mode
+
+    def serve_pty(self):
+        """
+        Opens a pseudo terminal and serves it from a background thread, returning the path of the slave side that
+        can be opened with ``serial.Serial``. Requires a real time clock. Stop it with :func:`close`.
+        """
+        if isinstance(self.clock, VirtualClock):
+            raise ValueError('pty mode requires a real time clock')
+        import tty
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        name = os.ttyname(slave)
+        thread = threading.Thread(target=self.__serve, args=(master, slave), name='SimulatedSureMark', daemon=True)
+        thread.start()
+        return name
+
+    def __serve(self, master, slave):
+        try:
+            while not self.__closed:
+                with self.__lock:
+                    now = self.clock()
+                    self.__advance(now)
+                    self.__deliver(now)
+                    out = bytes(self.__rx)
+                    self.__rx.clear()
+                    nxt = self.__responses[0][0] - now if self.__responses else 0.1
+                if out:
+                    os.write(master, out)
+                readable, _, _ = select.select([master], [], [], max(0.0, min(nxt, 0.1)))
+                if readable:
+                    data = os.read(master, 4096)
+                    with self.__lock:
+                        now = self.clock()
+                        self.__advance(now)
+                        self.bytes_received += len(data)
+                        self.__pending += data
+                        self.__parse(now)
+        finally:
+            os.close(master)
+            os.close(slave)
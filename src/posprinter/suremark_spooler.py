@@ -0,0 +1,138 @@
+#
+# Flow controlled spooling of large jobs to SureMark printers
+#
+
+import time
+
+
+class Spooler:
+    """
+    Feeds (large) jobs to a :class:`~posprinter.suremark.SureMark` printer in chunks, paced by the buffer bits in status
+    byte 2. The printer only reports two watermarks: "buffer empty" (low) and "buffer full", which is set when less
+    than 1k of buffer space is left (high). The spooler polls the status before every burst of chunks and never sends
+    more than ``headroom`` bytes after seeing a "not full" status, so it can not overflow the buffer. When the buffer is
+    full, it waits for the printer to drain instead of blocking in a write. Seeing the buffer run empty in the middle of
+    a job means the printer idled, so the burst size is increased, when it is full the burst size is reduced.
+
+    A :class:`~posprinter.suremark_throttle.ThermalThrottle` passed as ``throttle`` paces the chunks while the print
+    head is hot, instead of running into the buffer full watermark over and over.
+
+    The job data must not contain commands that make the printer respond, as the status messages are read in between.
+    """
+
+    #: Default size of a single chunk in bytes.
+    CHUNK_SIZE = 256
+    #: Amount of data that may be sent after a "not full" status, the printer guarantees at least 1k free buffer.
+    HEADROOM = 1024
+    #: Seconds to wait before polling again while the buffer is full.
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, printer, chunk_size=CHUNK_SIZE, headroom=HEADROOM, poll_interval=POLL_INTERVAL,
+                 stall_timeout=None, throttle=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Takes a :class:`~posprinter.suremark.SureMark` instance. ``stall_timeout`` limits the time (in seconds) a
+        single job may wait for the buffer to drain (for example if the cover is open), None waits forever.
+        ``clock`` and ``sleep`` can be replaced for simulations.
+        """
+        if printer is None:
+            raise ValueError('Can\'t operate without a printer')
+        if chunk_size < 1:
+            raise ValueError('Chunk size must be at least 1')
+        if headroom < chunk_size:
+            raise ValueError('Headroom must be at least one chunk')
+        self.__printer = printer
+        self.__chunk_size = chunk_size
+        self.__max_burst = headroom // chunk_size
+        self.__burst = 1
+        self.__poll_interval = poll_interval
+        self.__stall_timeout = stall_timeout
+        self.__throttle = throttle
+        self.__clock = clock
+        self.__sleep = sleep
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Resets all counters.
+        """
+        #: Number of bytes sent to the printer
+        self.bytes_sent = 0
+        #: Number of chunks written
+        self.chunks_sent = 0
+        #: Number of status polls
+        self.polls = 0
+        #: Number of times the buffer was found full
+        self.stalls = 0
+        #: Seconds spent waiting for the buffer to drain
+        self.stall_time = 0.0
+        #: Number of times the buffer ran empty in the middle of a job
+        self.underruns = 0
+        #: Seconds spent in :func:`print_job`
+        self.busy_time = 0.0
+        #: Seconds the throttle delayed chunks
+        self.throttle_time = 0.0
+
+    def bytes_per_second(self):
+        """
+        Sustained throughput over all jobs since the last reset.
+        """
+        if self.busy_time <= 0:
+            return 0.0
+        return self.bytes_sent / self.busy_time
+
+    def print_job(self, data):
+        """
+        Sends the job ``data`` (bytes-like) to the printer and returns once everything has been handed to the device.
+        """
+        view = memoryview(data)
+        total = len(view)
+        offset = 0
+        start = self.__clock()
+        stall_start = None
+        throttle = self.__throttle
+        if throttle is not None:
+            throttle.job_started(self.__printer, total)
+        try:
+            while offset < total:
+                m = self.__printer.query_status()
+                self.polls += 1
+                if throttle is not None:
+                    throttle.observe(m, self.__clock())
+
+                if m.buffer_full():
+                    now = self.__clock()
+                    if stall_start is None:
+                        stall_start = now
+                        self.stalls += 1
+                        self.__burst = max(1, self.__burst // 2)
+                    elif self.__stall_timeout is not None and now - stall_start > self.__stall_timeout:
+                        raise TimeoutError('Print buffer did not drain within {}s'.format(self.__stall_timeout))
+                    self.__sleep(self.__poll_interval)
+                    self.stall_time += self.__clock() - now
+                    continue
+                stall_start = None
+
+                if m.buffer_empty() and offset > 0:
+                    # the printer idled, we did not send enough
+                    self.underruns += 1
+                    self.__burst = min(self.__max_burst, self.__burst * 2)
+                elif self.__burst < self.__max_burst:
+                    self.__burst += 1
+
+                for _ in range(self.__burst):
+                    if offset >= total:
+                        break
+                    chunk = view[offset:offset + self.__chunk_size]
+                    if throttle is not None:
+                        delay = throttle.delay(len(chunk), self.__clock())
+                        if delay > 0:
+                            self.__sleep(delay)
+                            self.throttle_time += delay
+                    self.__printer.write(chunk)
+                    offset += len(chunk)
+                    self.bytes_sent += len(chunk)
+                    self.chunks_sent += 1
+        finally:
+            if throttle is not None:
+                throttle.job_finished(self.__printer)
+            self.busy_time += self.__clock() - start
@@ -1,5 +1,6 @@
 
-from .suremark_debug import verbose_status_byte, verbose_extended_status
+import collections
+
 
 class PrinterMessage:
     """
@@ -26,101 +27,210 @@ class PrinterMessage:
     Also note that IBMs documentation indexes the response bytes beginning with 1 in the tabular documentation.
     """
 
+    __slots__ = ('_status', '_payload')
+
+    # Bits of the status as returned by status() and diff(): bit n of byte b is 1 << (8 * b + n)
+    #: Byte 0 bit 0
+    STATUS_COMMAND_COMPLETE = 1 << 0
+    #: Byte 0 bit 5
+    STATUS_COVER_OPEN = 1 << 5
+    #: Byte 0 bit 6
+    STATUS_PRINT_ERROR = 1 << 6
+    #: Byte 0 bit 7
+    STATUS_COMMAND_REJECTED = 1 << 7
+    #: Byte 1 bit 6
+    STATUS_BUFFER_EMPTY = 1 << (8 + 6)
+    #: Byte 1 bit 7
+    STATUS_BUFFER_FULL = 1 << (8 + 7)
+    #: Byte 2 bit 1
+    STATUS_HOME_ERROR = 1 << (16 + 1)
+    #: Byte 2 bit 2
+    STATUS_DOCUMENT_ERROR = 1 << (16 + 2)
+    #: Byte 2 bit 3
+    STATUS_FLASH_ERROR = 1 << (16 + 3)
+    #: Byte 2 bit 6
+    STATUS_FIRMWARE_ERROR = 1 << (16 + 6)
+    #: Byte 2 bit 7
+    STATUS_COMMAND_NOT_COMPLETE = 1 << (16 + 7)
+    #: Byte 3
+    STATUS_EC_LEVEL = 0xff << 24
+    #: Byte 4 bit 0
+    STATUS_PRINTER_ID_RESPONSE = 1 << (32 + 0)
+    #: Byte 4 bit 1
+    STATUS_EC_LEVEL_RESPONSE = 1 << (32 + 1)
+    #: Byte 4 bit 2
+    STATUS_MICR_RESPONSE = 1 << (32 + 2)
+    #: Byte 4 bit 3
+    STATUS_MCT_RESPONSE = 1 << (32 + 3)
+    #: Byte 4 bit 4
+    STATUS_USER_FLASH_READ_RESPONSE = 1 << (32 + 4)
+    #: Byte 4 bit 6
+    STATUS_SCAN_SUCCESS = 1 << (32 + 6)
+    #: Byte 4 bit 7
+    STATUS_RETRIEVE_SCANNED_IMAGE_RESPONSE = 1 << (32 + 7)
+    #: Byte 5
+    STATUS_LINE_COUNT = 0xff << 40
+    #: Byte 6 bit 4
+    STATUS_PRINT_KEY_PRESSED = 1 << (48 + 4)
+    #: Byte 6 bit 7
+    STATUS_DOCUMENT_FEED_ERROR = 1 << (48 + 7)
+    #: Byte 7 bit 7
+    STATUS_HEAD_HOT = 1 << (56 + 7)
+
     def __init__(self, data, debug=False):
+        """
+        "data" can be any bytes-like object, the payload is a view of it and not copied.
+        """
         if len(data) < 8:
             raise ValueError('Length of data less than minimum message length (8)')
-        self._data = data
-        self._debug = debug
+        # decode the status once, accessors only mask
+        self._status = int.from_bytes(data[:8], 'little')
+        self._payload = memoryview(data)[8:]
 
         if debug:
-            verbose_status_byte(data[0], 0)
-            verbose_status_byte(data[1], 1)
-            verbose_status_byte(data[2], 2)
-            verbose_status_byte(data[3], 3)
-            verbose_status_byte(data[4], 4)
-            verbose_status_byte(data[5], 5)
-            verbose_status_byte(data[6], 6)
-            verbose_status_byte(data[7], 7)
+            print('Status: {}'.format(', '.join(self.conditions())))
+
+    def __eq__(self, other):
+        if not isinstance(other, PrinterMessage):
+            return NotImplemented
+        return self._status == other._status and self._payload == other._payload
+
+    def __hash__(self):
+        return hash((self._status, self._payload.tobytes()))
+
+    def __repr__(self):
+        return 'PrinterMessage(status=0x{:016x}, payload={} bytes)'.format(self._status, len(self._payload))
+
+    def status(self):
+        """
+        Returns the 8 status bytes as a single integer, see the STATUS_* constants.
+        """
+        return self._status
+
+    def diff(self, other):
+        """
+        Returns the status bits that differ between this message and "other" (a message or a status integer).
+        """
+        if isinstance(other, PrinterMessage):
+            other = other._status
+        return self._status ^ other
+
+    def conditions(self):
+        """
+        Returns the list of conditions set in the status, such as "Buffer empty", using the tables in
+        :mod:`~posprinter.suremark_debug`.
+        """
+        # the text tables are only needed for debugging, don't load them with this module
+        from .suremark_debug import active_conditions
+        return active_conditions(self._status.to_bytes(8, 'little'))
+
+    def decode(self):
+        """
+        Returns the texts for all status bits as a dict, see :func:`~posprinter.suremark_debug.decode_status`.
+        Use :func:`~posprinter.suremark_debug.verbose_status_byte` for the detailed output.
+        """
+        from .suremark_debug import decode_status
+        return decode_status(self._status.to_bytes(8, 'little'))
 
     def has_payload(self):
-        return len(self._data) > 8
+        return len(self._payload) > 0
 
     def payload_length(self):
-        return len(self._data) - 8
+        return len(self._payload)
+
+    def payload(self):
+        """
+        Returns the payload as a memoryview, without copying.
+        """
+        return self._payload
 
     def raw_payload(self):
+        """
+        Returns a copy of the payload, or None if there is none. Use :func:`payload` to avoid the copy.
+        """
         if not self.has_payload():
             return None
-        return self._data[8:]
+        return self._payload.tobytes()
 
     # ########
     # Byte 0 #
     # ########
     def command_complete(self):
         # byte 0 bit 0
-        return self._data[0] & (1 << 0) != 0
+        return self._status & self.STATUS_COMMAND_COMPLETE != 0
 
     def command_rejected(self):
         # byte 0 bit 7
-        return self._data[0] & (1 << 7) != 0
+        return self._status & self.STATUS_COMMAND_REJECTED != 0
 
     # ########
     # Byte 1 #
     # ########
+    def buffer_empty(self):
+        # byte 1 bit 6
+        return self._status & self.STATUS_BUFFER_EMPTY != 0
+
+    def buffer_full(self):
+        """
+        Less than 1k of space is left in the print buffer.
+        """
+        # byte 1 bit 7
+        return self._status & self.STATUS_BUFFER_FULL != 0
+
     # ########
     # Byte 2 #
     # ########
+    def command_not_complete(self):
+        # byte 2 bit 7
+        return self._status & self.STATUS_COMMAND_NOT_COMPLETE != 0
+
     # ########
     # Byte 3 #
     # ########
     def engineering_code_level(self):
         # byte 3
-        return self._data[3]
+        return (self._status >> 24) & 0xff
 
     # ########
     # Byte 4 #
     # ########
     def is_printer_id_response(self):
         # byte 4 bit 0
-        return self._data[4] & (1 << 0) != 0
+        return self._status & self.STATUS_PRINTER_ID_RESPONSE != 0
 
     def is_ec_level_response(self):
         # byte 4 bit 1
-        return self._data[4] & (1 << 1) != 0
+        return self._status & self.STATUS_EC_LEVEL_RESPONSE != 0
 
     def is_micr_response(self):
         # byte 4 bit 2
-        return self._data[4] & (1 << 2) != 0
+        return self._status & self.STATUS_MICR_RESPONSE != 0
 
     def is_mct_response(self):
         """
         Things like statistics counters etc.
         """
         # byte 4 bit 3
-        return self._data[4] & (1 << 3) != 0
+        return self._status & self.STATUS_MCT_RESPONSE != 0
 
     def is_user_flash_read_response(self):
         # byte 4 bit 4
-        return self._data[4] & (1 << 4) != 0
+        return self._status & self.STATUS_USER_FLASH_READ_RESPONSE != 0
 
     def scan_success(self):
         # byte 4 bit 6
-        return self._data[4] & (1 << 6) != 0
+        return self._status & self.STATUS_SCAN_SUCCESS != 0
 
     def is_retrieve_scanned_image_response(self):
         # byte 4 bit 7
-        return self._data[4] & (1 << 7) != 0
-
-    #def user_flash_size(self):
-    #    if not self.is_user_flash_
+        return self._status & self.STATUS_RETRIEVE_SCANNED_IMAGE_RESPONSE != 0
 
     # ########
     # Byte 5 #
     # ########
     def current_line_count(self):
         # byte 5
-        return self._data[5]
-
+        return (self._status >> 40) & 0xff
 
     # ########
     # Byte 6 #
@@ -128,8 +238,13 @@ class PrinterMessage:
     # ########
     # Byte 7 #
     # ########
+    def head_hot(self):
+        """
+        The print head or motor is almost too hot, the printer slows down.
+        """
+        # byte 7 bit 7
+        return self._status & self.STATUS_HEAD_HOT != 0
 
-    # payload handling
 
 class PrinterID:
     """
@@ -168,3 +283,34 @@ class PrinterID:
 
     def is_Tx8(self):
         return False
+
+    def raw(self):
+        """
+        Returns the raw printer ID bytes.
+        """
+        return bytes(self.__data)
+
+    def has_micr(self):
+        # only defined for device type 0x30, reserved otherwise
+        return self.__data[0] == 0x30 and self.__data[2] & (1 << 0) != 0
+
+    def has_check_flipper(self):
+        return self.__data[0] == 0x30 and self.__data[2] & (1 << 1) != 0
+
+    def is_58mm(self):
+        """
+        The printer is set up for 58mm paper (80mm otherwise).
+        """
+        return self.__data[3] & (1 << 0) != 0
+
+
+class UsageSnapshot(collections.namedtuple('UsageSnapshot', [
+        'manufacture_week', 'paper_cuts', 'failed_paper_cuts', 'thermal_motor_steps', 'printed_characters_thermal',
+        'thermal_cover_opened', 'barcodes_printed', 'tone_sounds', 'counters'])):
+    """
+    Immutable set of usage statistics, as returned by :func:`~posprinter.suremark.SureMark.get_usage_snapshot`.
+    Counters that are kept as a flash part and a remainder are already combined. Counters the printer did not answer
+    with an MCT response (such as tone sounds on models without a beeper) are None. ``counters`` holds the raw value
+    of every MCT counter, keyed by its ``STATS_RAW_*`` request byte.
+    """
+    __slots__ = ()
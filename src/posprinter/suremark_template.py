@@ -0,0 +1,330 @@
+#
+# Precompiled receipt templates
+#
+
+import collections
+import decimal
+
+from .suremark import SureMark
+from .suremark_text import TextEncoder
+
+
+class CommandRecorder:
+    """
+    Device stand-in that records everything written to it, used to capture the output of
+    :class:`~posprinter.suremark.SureMark` methods without talking to a printer.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+    def take(self):
+        """
+        Returns the recorded bytes and clears the recording.
+        """
+        data = bytes(self.data)
+        self.data = bytearray()
+        return data
+
+
+class Slot:
+    """
+    Placeholder in a template, filled in when rendering. Subclasses implement :func:`encode`, which validates a value
+    and returns its bytes. If ``width`` is set, the value is padded to exactly that many characters and rejected if it
+    is longer.
+    """
+
+    def __init__(self, name, width=None):
+        if not name:
+            raise ValueError('Slot name missing')
+        if width is not None and width < 1:
+            raise ValueError('Slot width must be at least 1')
+        self.name = name
+        self.width = width
+
+    def _fit(self, text, right=False):
+        if self.width is None:
+            return text
+        if len(text) > self.width:
+            raise ValueError('Value for slot "{}" longer than {} characters'.format(self.name, self.width))
+        return text.rjust(self.width) if right else text.ljust(self.width)
+
+    def encode(self, value):
+        raise NotImplementedError()
+
+
+class TextSlot(Slot):
+    """
+    A line of text (item names etc.), encoded by a :class:`~posprinter.suremark_text.TextEncoder` like
+    :func:`~posprinter.suremark.SureMark.text`. Control characters are rejected so a value can't inject commands.
+    """
+
+    def __init__(self, name, width=None):
+        super().__init__(name, width)
+        self.__encoder = None
+
+    def encode(self, value, page=None, encoder=None):
+        """
+        Returns the bytes for "value". ``page`` is the code page active at the slot (None if unknown), text that
+        needs another page selects it and switches back to ``page`` afterwards. ``encoder`` is the
+        :class:`~posprinter.suremark_text.TextEncoder` to use, a default one if None.
+        """
+        if not isinstance(value, str):
+            raise TypeError('invalid type for slot "{}": {}'.format(self.name, type(value)))
+        text = self._fit(value)
+        if any(c < ' ' or c == '\x7f' for c in text):
+            raise ValueError('Value for slot "{}" contains control characters'.format(self.name))
+        if encoder is None:
+            if self.__encoder is None:
+                self.__encoder = TextEncoder()
+            encoder = self.__encoder
+        encoder.reset(page)
+        data = encoder.encode(text)
+        if page is not None and encoder.page != page:
+            data += SureMark.CMD_SET_CODE_PAGE + bytes([page])
+        return data
+
+
+class AmountSlot(Slot):
+    """
+    A price or other amount. Takes an integer in minor units (cents) or a :class:`decimal.Decimal`, printed with
+    ``decimals`` places and right aligned if ``width`` is set.
+    """
+
+    def __init__(self, name, width=None, decimals=2):
+        super().__init__(name, width)
+        if decimals < 0:
+            raise ValueError('Negative number of decimals')
+        self.decimals = decimals
+
+    def encode(self, value):
+        if isinstance(value, bool) or not isinstance(value, (int, decimal.Decimal)):
+            raise TypeError('invalid type for slot "{}": {}'.format(self.name, type(value)))
+        if isinstance(value, int):
+            value = decimal.Decimal(value).scaleb(-self.decimals)
+        if not value.is_finite():
+            raise ValueError('Value for slot "{}" is not a finite number'.format(self.name))
+        text = '{:.{}f}'.format(value, self.decimals)
+        return self._fit(text, right=True).encode('ascii')
+
+
+class DigitsSlot(Slot):
+    """
+    A string of decimal digits, for example barcode data. If ``length`` is set, exactly this many digits are required.
+    """
+
+    def __init__(self, name, length=None):
+        super().__init__(name)
+        self.length = length
+
+    def encode(self, value):
+        if not isinstance(value, str):
+            raise TypeError('invalid type for slot "{}": {}'.format(self.name, type(value)))
+        if not value or any(c not in '0123456789' for c in value):
+            raise ValueError('Value for slot "{}" must only contain digits'.format(self.name))
+        if self.length is not None and len(value) != self.length:
+            raise ValueError('Value for slot "{}" must have {} digits'.format(self.name, self.length))
+        return value.encode('ascii')
+
+
+class _TextAt:
+    # a text slot at a position of the template where the code page "page" is active
+
+    def __init__(self, slot, page, encoder):
+        self.name = slot.name
+        self.__slot = slot
+        self.__page = page
+        self.__encoder = encoder
+
+    def encode(self, value):
+        return self.__slot.encode(value, self.__page, self.__encoder)
+
+
+class _BarcodeAt:
+    # a slot holding the data of a barcode of type "type", the command is built like SureMark.barcode does
+
+    def __init__(self, slot, type, barcodes):
+        self.name = slot.name
+        self.__slot = slot
+        self.__type = type
+        self.__barcodes = barcodes
+
+    def encode(self, value):
+        return self.__barcodes.command(self.__slot.encode(value), self.__type)
+
+
+class ReceiptTemplate:
+    """
+    A compiled template: static byte segments with slots in between. Created by :func:`compile_template`.
+    """
+
+    def __init__(self, segments, slots):
+        if len(segments) != len(slots) + 1:
+            raise ValueError('Expected one more segment than slots')
+        self.__segments = [memoryview(bytes(s)) for s in segments]
+        self.__slots = list(slots)
+
+    def slot_names(self):
+        """
+        Returns the set of names that need a value when rendering.
+        """
+        return set(s.name for s in self.__slots)
+
+    def static_size(self):
+        """
+        Number of bytes that are the same for every rendering.
+        """
+        return sum(len(s) for s in self.__segments)
+
+    def render(self, **values):
+        """
+        Validates the values for all slots and returns the complete command stream.
+        """
+        missing = self.slot_names() - set(values)
+        if missing:
+            raise ValueError('Missing values for slots: {}'.format(', '.join(sorted(missing))))
+        unknown = set(values) - self.slot_names()
+        if unknown:
+            raise ValueError('Unknown slots: {}'.format(', '.join(sorted(unknown))))
+        parts = [None] * (2 * len(self.__slots) + 1)
+        parts[0::2] = self.__segments
+        parts[1::2] = [s.encode(values[s.name]) for s in self.__slots]
+        return b''.join(parts)
+
+
+class TemplateBuilder:
+    """
+    Passed to the function given to :func:`compile_template`. The :class:`~posprinter.suremark.SureMark` methods in
+    :attr:`COMMANDS`, which only send data, can be called on it, their output becomes part of the static segments.
+    :func:`text` and :func:`barcode` accept a :class:`Slot` in place of the data. The constants of ``SureMark`` are
+    available as well, everything else (such as methods that read from the printer) raises an AttributeError.
+
+    Text is encoded by a :class:`~posprinter.suremark_text.TextEncoder`, starting from the code page ``page`` the
+    printer uses when the template is printed (None if unknown). Barcodes are validated and completed by a
+    :class:`~posprinter.suremark_barcode.BarcodeBuilder`, for slots when the template is rendered.
+    """
+
+    #: ``SureMark`` methods that can be used in a template
+    COMMANDS = frozenset([
+        'write', 'beep', 'print_line_feed', 'print_line_feed_alt', 'print_form_feed_cut', 'cut', 'print_logo',
+        'set_code_page', 'pdf417', 'barcode_set_horizontal_size', 'barcode_set_height', 'barcode_set_hri_position',
+        'barcode_set_hri_font', 'align_positions', 'select_maximum_print_speed',
+    ])
+
+    def __init__(self, page=None):
+        self.__recorder = CommandRecorder()
+        self.__encoder = TextEncoder(page=page)
+        self.__printer = SureMark(self.__recorder, text_encoder=self.__encoder)
+        self.__barcodes = None
+        self.__segments = []
+        self.__slots = []
+
+    def __getattr__(self, name):
+        if name in self.COMMANDS or name.isupper():
+            return getattr(self.__printer, name)
+        raise AttributeError('{} can\'t be used in a template, it is not a command'.format(name))
+
+    def slot(self, slot):
+        """
+        Inserts a placeholder at the current position.
+        """
+        self.__segments.append(self.__recorder.take())
+        self.__slots.append(slot)
+
+    def text(self, value):
+        """
+        Adds text, either a literal string or a slot.
+        """
+        if isinstance(value, TextSlot):
+            self.slot(_TextAt(value, self.__encoder.page, self.__encoder))
+        elif isinstance(value, Slot):
+            self.slot(value)
+        else:
+            self.__printer.text(value)
+
+    def barcode(self, data, type=SureMark.BARCODE_EAN13):
+        """
+        Adds a barcode, either with literal data or a slot. A :class:`DigitsSlot` with a ``length`` the barcode type
+        can't take raises a ValueError.
+        """
+        if not isinstance(data, Slot):
+            self.__printer.barcode(data, type=type)
+            return
+        if self.__barcodes is None:
+            from .suremark_barcode import BarcodeBuilder
+            self.__barcodes = BarcodeBuilder()
+        if isinstance(data, DigitsSlot) and data.length is not None:
+            try:
+                self.__barcodes.command('0' * data.length, type)
+            except ValueError as e:
+                raise ValueError('Slot "{}" with {} digits doesn\'t fit the barcode: {}'.format(
+                    data.name, data.length, e))
+        self.slot(_BarcodeAt(data, type, self.__barcodes))
+
+    def build(self):
+        return ReceiptTemplate(self.__segments + [self.__recorder.take()], self.__slots)
+
+
+def compile_template(build, page=None):
+    """
+    Compiles a template. ``build`` is called once with a :class:`TemplateBuilder`::
+
+        def receipt(t):
+            t.align_positions(SureMark.ALIGN_POSITIONS_CENTER)
+            t.text(TextSlot('item', width=24))
+            t.text(AmountSlot('price', width=8))
+            t.print_line_feed()
+            t.barcode(DigitsSlot('sku', length=12), type=SureMark.BARCODE_EAN13)
+            t.cut()
+
+        template = compile_template(receipt)
+        p.write(template.render(item='Coffee', price=250, sku='400638133393'))
+
+    ``page`` is the code page the printer uses when the template is printed, None if it is unknown, then the first
+    non ASCII text selects one. As the template may select another code page, call
+    :func:`~posprinter.suremark_text.TextEncoder.reset` on the encoder of the printer if it is used afterwards.
+    """
+    builder = TemplateBuilder(page)
+    build(builder)
+    return builder.build()
+
+
+class TemplateCache:
+    """
+    Keeps up to ``maxsize`` compiled templates, dropping the least recently used one when full.
+    """
+
+    def __init__(self, maxsize=32):
+        if maxsize < 1:
+            raise ValueError('Cache size must be at least 1')
+        self.__maxsize = maxsize
+        self.__templates = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__templates)
+
+    def get(self, key, build):
+        """
+        Returns the template stored under ``key``, compiling it with ``build`` if it is not cached.
+        """
+        try:
+            template = self.__templates[key]
+        except KeyError:
+            self.misses += 1
+            template = compile_template(build)
+            self.__templates[key] = template
+            if len(self.__templates) > self.__maxsize:
+                self.__templates.popitem(last=False)
+            return template
+        self.hits += 1
+        self.__templates.move_to_end(key)
+        return template
+
+    def clear(self):
+        self.__templates.clear()
@@ -0,0 +1,192 @@
+#
+# Encoding of text into the printer's code pages
+#
+
+import codecs
+import collections
+
+#: Code pages as (number for the set code page command, Python codec) pairs. The numbering is the common ESC/POS
+#: one, pass your own list to :class:`TextEncoder` if the printer's configuration differs. Earlier entries are
+#: preferred when several pages are equally good.
+CODE_PAGES = (
+    (0, 'cp437'),
+    (2, 'cp850'),
+    (19, 'cp858'),
+    (3, 'cp860'),
+    (4, 'cp863'),
+    (5, 'cp865'),
+    (16, 'cp1252'),
+    (17, 'cp866'),
+)
+
+_SET_CODE_PAGE = b'\x1b\x74'
+
+
+class TextEncoder:
+    """
+    Encodes text for the printer and keeps track of the active code page, so the set code page command is only sent
+    when the text needs another page. When text mixes characters that exist in different pages, the pages are chosen
+    so the number of switches is minimal. ASCII is the same in every page and never causes a switch::
+
+        enc = TextEncoder()
+        p.write(enc.encode('Crème brûlée     4.50\\n'))  # selects cp437
+        p.write(enc.encode('Café au lait     2.80\\n'))  # no switch
+        p.write(enc.encode('Smørbrød         3.20\\n'))  # cp437 has no "ø", selects cp850
+
+    The translation tables are built once from ``pages`` (see :data:`CODE_PAGES`). The results for the last
+    ``cache_size`` distinct texts are kept, so repeated item names and footers are only encoded once. ``page`` is
+    the code page the printer is known to use, or None if it is unknown, which makes the first non ASCII text select
+    a page. Characters that exist in no page are printed as "?", or raise a ValueError if ``errors`` is "strict".
+    """
+
+    def __init__(self, pages=CODE_PAGES, page=None, cache_size=256, errors='replace'):
+        if errors not in ('replace', 'strict'):
+            raise ValueError('Unknown error handling "{}"'.format(errors))
+        self.__numbers = [number for number, _ in pages]
+        self.__index = dict((number, i) for i, number in enumerate(self.__numbers))
+        # per page: ordinal -> byte, for str.translate; per character: bit mask of the pages that have it
+        self.__tables = []
+        self.__masks = {}
+        for i, (_, codec) in enumerate(pages):
+            decode = codecs.getdecoder(codec)
+            table = {}
+            for b in range(0x80, 0x100):
+                try:
+                    c = decode(bytes([b]))[0]
+                except UnicodeDecodeError:
+                    continue
+                if len(c) != 1 or ord(c) < 0x80 or ord(c) in table:
+                    continue
+                table[ord(c)] = b
+                self.__masks[c] = self.__masks.get(c, 0) | (1 << i)
+            self.__tables.append(table)
+        self.__errors = errors
+        self.__cache_size = cache_size
+        self.__cache = collections.OrderedDict()
+        self.page = page
+        #: Number of texts answered from the cache
+        self.hits = 0
+        #: Number of texts encoded
+        self.misses = 0
+        #: Number of code page switches in the encoded output
+        self.switches = 0
+
+    def reset(self, page=None):
+        """
+        Sets the code page the printer uses (None if unknown), such as after it was reset or the page was selected
+        by other means.
+        """
+        self.page = page
+
+    def encodable(self, text):
+        """
+        Returns True if every character of "text" exists in one of the pages.
+        """
+        masks = self.__masks
+        return all(c < '\x80' or c in masks for c in text)
+
+    def encode(self, text):
+        """
+        Returns the bytes for "text", including the set code page commands it needs, and makes the page the text
+        ends with the active one.
+        """
+        key = (self.page, text)
+        entry = self.__cache.get(key)
+        if entry is not None:
+            self.__cache.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = self.__encode(text)
+            self.__cache[key] = entry
+            if len(self.__cache) > self.__cache_size:
+                self.__cache.popitem(last=False)
+        data, page, switches = entry
+        self.page = page
+        self.switches += switches
+        return data
+
+    def __groups(self, text):
+        # [mask, start] of the runs of non ASCII characters that fit the same pages, ASCII in between fits any
+        masks = self.__masks
+        groups = []
+        for i, c in enumerate(text):
+            if c < '\x80':
+                continue
+            mask = masks[c]
+            if not groups or groups[-1][0] != mask:
+                groups.append([mask, i])
+        return groups
+
+    def __replace(self, text):
+        # characters of no page become "?"
+        masks = self.__masks
+        if self.__errors == 'strict':
+            for c in text:
+                if c >= '\x80' and c not in masks:
+                    raise ValueError('Character {!r} exists in no code page'.format(c))
+            return text
+        return ''.join(c if c < '\x80' or c in masks else '?' for c in text)
+
+    def __plan(self, groups, start):
+        # fewest switches: cost[p] is the minimum number of switches to print up to a group in page p
+        n = len(self.__numbers)
+        infinite = len(groups) + 2
+        cost = [0 if p == start else 1 for p in range(n)]
+        back = []
+        for mask, _ in groups:
+            best = min(range(n), key=cost.__getitem__)
+            new = []
+            prev = []
+            for p in range(n):
+                if not mask & (1 << p):
+                    new.append(infinite)
+                    prev.append(p)
+                elif cost[p] <= cost[best] + 1:
+                    new.append(cost[p])
+                    prev.append(p)
+                else:
+                    new.append(cost[best] + 1)
+                    prev.append(best)
+            cost = new
+            back.append(prev)
+        # stay in the start page if it is as good as any
+        end = min(range(n), key=lambda p: (cost[p], p != start, p))
+        plan = [end]
+        for prev in reversed(back[1:]):
+            plan.append(prev[plan[-1]])
+        plan.reverse()
+        return plan
+
+    def __encode(self, text):
+        try:
+            return text.encode('ascii'), self.page, 0
+        except UnicodeEncodeError:
+            pass
+        text = self.__replace(text)
+        groups = self.__groups(text)
+        if not groups:
+            return text.encode('ascii'), self.page, 0
+        start = self.__index.get(self.page)
+        plan = self.__plan(groups, start)
+        out = []
+        switches = 0
+        current = start
+        pos = 0
+        for (_, index), page in zip(groups, plan):
+            if page == current:
+                continue
+            if index > pos:
+                out.append(self.__translate(text[pos:index], current))
+            out.append(_SET_CODE_PAGE + bytes([self.__numbers[page]]))
+            switches += 1
+            current = page
+            pos = index
+        out.append(self.__translate(text[pos:], current))
+        return b''.join(out), self.__numbers[current], switches
+
+    def __translate(self, text, page):
+        if page is None:
+            return text.encode('ascii')
+        # the plan only puts characters of the page into its segments, so all of them are in the table
+        return text.translate(self.__tables[page]).encode('latin-1')
@@ -0,0 +1,152 @@
+#
+# Thermal aware send rate limiting
+#
+
+
+class ThermalThrottle:
+    """
+    Limits the send rate of a :class:`~posprinter.suremark_spooler.Spooler` while the printer reports that its head
+    or motor is almost too hot (status byte 8, bit 7). The printer slows down in this state, sending at full speed
+    only fills the buffer and stalls the host.
+
+    The rate at which the printer prints is estimated from the buffer full watermark: between two polls that see
+    the buffer fill up past it without running empty in between, the buffer level is about the same, so the printer
+    printed what was sent in the meantime. When the head gets hot, sending is paced to that rate, or
+    to ``HOT_FRACTION`` of ``line_rate`` (bytes per second the port can send, for example baud rate / 10) before the
+    first estimate, then adjusted: reduced whenever the buffer fills up, raised when it runs empty. Once the head
+    has cooled down, the rate is no longer limited.
+
+    Optionally, jobs of at least ``long_job`` bytes are printed with the maximum print speed set to ``speed`` (one of
+    the ``MAX_PRINT_SPEED_*`` values of :class:`~posprinter.suremark.SureMark`), which heats the head less and may
+    give a better sustained throughput than alternating between full speed and thermal slowdown. ``restore_speed`` is
+    selected after the job.
+    """
+
+    #: Weight of a new sample for the measured drain rate
+    SMOOTHING = 0.3
+    #: Factor applied to the rate when the buffer is full
+    DECREASE = 0.75
+    #: Factor applied to the rate when the buffer ran empty
+    INCREASE = 1.25
+    #: Lowest rate (bytes per second) that is ever used
+    MIN_RATE = 64.0
+    #: Share of the line rate used while hot until the drain rate was estimated
+    HOT_FRACTION = 0.5
+
+    def __init__(self, long_job=None, speed=None, restore_speed=None, line_rate=None):
+        if (long_job is None) != (speed is None):
+            raise ValueError('long_job and speed need to be given together')
+        if line_rate is not None and line_rate <= 0:
+            raise ValueError('line_rate must be positive')
+        self.__line_rate = line_rate
+        self.__long_job = long_job
+        self.__speed = speed
+        self.__restore_speed = restore_speed
+        self.__speed_selected = False
+        self.__hot = False
+        self.__hot_since = None
+        self.__rate = None
+        self.__next_send = None
+        self.__last_poll = None
+        self.__last_full = None
+        # time the buffer last filled up past the full watermark, None if it ran empty since
+        self.__mark = None
+        self.__sent = 0
+        self.__slowdown_time = 0.0
+        #: Estimated rate (bytes per second) at which the printer prints, None until estimated
+        self.drain_rate = None
+        #: Number of thermal slowdowns seen
+        self.slowdowns = 0
+
+    @property
+    def slowdown_time(self):
+        """
+        Seconds the printer spent in thermal slowdowns, including the current one up to the last poll.
+        """
+        if self.__hot:
+            return self.__slowdown_time + self.__last_poll - self.__hot_since
+        return self.__slowdown_time
+
+    def hot(self):
+        return self.__hot
+
+    def rate(self):
+        """
+        Current send rate limit in bytes per second, None if not limited.
+        """
+        return self.__rate if self.__hot else None
+
+    def job_started(self, printer, size):
+        """
+        Called by the spooler before sending a job of "size" bytes.
+        """
+        if self.__long_job is not None and size >= self.__long_job:
+            printer.select_maximum_print_speed(self.__speed)
+            self.__speed_selected = True
+
+    def job_finished(self, printer):
+        if self.__speed_selected:
+            self.__speed_selected = False
+            if self.__restore_speed is not None:
+                printer.select_maximum_print_speed(self.__restore_speed)
+
+    def observe(self, message, now):
+        """
+        Called with every status message polled by the spooler.
+        """
+        full = message.buffer_full()
+        if message.buffer_empty():
+            # the printer may have idled, which tells nothing about its speed
+            self.__mark = None
+        elif full and self.__last_full is False:
+            if self.__mark is not None and now > self.__mark:
+                sample = self.__sent / (now - self.__mark)
+                if self.drain_rate is None:
+                    self.drain_rate = sample
+                else:
+                    self.drain_rate += self.SMOOTHING * (sample - self.drain_rate)
+            self.__mark = now
+            self.__sent = 0
+        if self.__mark is None:
+            self.__sent = 0
+        self.__last_poll = now
+        self.__last_full = full
+
+        if message.head_hot():
+            if not self.__hot:
+                self.__hot = True
+                self.__hot_since = now
+                self.slowdowns += 1
+                self.__rate = self.__initial_rate()
+            elif self.__rate is None:
+                self.__rate = self.__initial_rate()
+            if self.__rate is not None:
+                if full:
+                    self.__rate *= self.DECREASE
+                elif message.buffer_empty():
+                    self.__rate *= self.INCREASE
+                self.__rate = max(self.__rate, self.MIN_RATE)
+        elif self.__hot:
+            self.__hot = False
+            self.__slowdown_time += now - self.__hot_since
+            self.__rate = None
+            self.__next_send = None
+
+    def __initial_rate(self):
+        if self.drain_rate is not None:
+            return self.drain_rate
+        if self.__line_rate is not None:
+            return self.__line_rate * self.HOT_FRACTION
+        return None
+
+    def delay(self, size, now):
+        """
+        Returns the number of seconds to wait before sending "size" bytes.
+        """
+        self.__sent += size
+        rate = self.rate()
+        if rate is None:
+            return 0.0
+        start = now if self.__next_send is None else max(self.__next_send, now)
+        self.__next_send = start + size / rate
+        return start - now
@@ -0,0 +1,47 @@
+import importlib.util
+import os
+
+import pytest
+
+BENCH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'bench_suremark.py')
+
+
+@pytest.fixture(scope='module')
+def bench():
+    spec = importlib.util.spec_from_file_location('bench_suremark', BENCH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def results(**values):
+    return {'results': {name: {'value': value, 'higher_is_better': name.endswith('rate'),
+                               'kind': 'host' if name.startswith('host') else 'device'}
+                        for name, value in values.items()}}
+
+
+def test_device_results_are_reproducible(bench):
+    assert bench.bench_receipts(2) == bench.bench_receipts(2)
+    assert bench.bench_usage_stats() == bench.bench_usage_stats()
+
+
+def test_line_efficiency(bench):
+    efficiency = bench.bench_line_rate(19200, 4096)
+    assert 0.5 < efficiency <= 1.0
+
+
+def test_compare(bench):
+    baseline = results(device_rate=100.0, device_latency=10.0, host_rate=100.0, zero_rate=0.0)
+    current = results(device_rate=97.0, device_latency=10.1, host_rate=60.0, zero_rate=1.0)
+    regressions = bench.compare(current, baseline, tolerance=0.02, host_tolerance=0.5)
+    assert [r[0] for r in regressions] == ['device_rate']
+    current = results(device_rate=100.0, device_latency=10.5, host_rate=40.0)
+    regressions = bench.compare(current, baseline, tolerance=0.02, host_tolerance=0.5)
+    assert [r[0] for r in regressions] == ['device_latency', 'host_rate']
+
+
+def test_compare_needs_a_baseline(bench, tmp_path, monkeypatch, capsys):
+    missing = str(tmp_path / 'baseline.json')
+    monkeypatch.setattr(bench.sys, 'argv', ['bench_suremark.py', '--compare', '--baseline', missing])
+    assert bench.main() == 2
+    assert '--save-baseline' in capsys.readouterr().err
@@ -0,0 +1,34 @@
+import importlib.util
+import os
+
+import pytest
+
+BENCH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'bench_suremark.py')
+
+# the budget is for a quiet machine, test runs can be much slower
+MARGIN = 10
+
+
+@pytest.fixture(scope='module')
+def bench():
+    spec = importlib.util.spec_from_file_location('bench_suremark', BENCH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_core_import_is_lightweight(bench):
+    # the same probe and module list as the benchmark
+    import_time, loaded = bench.bench_import(repeat=3)
+    assert loaded == []
+    assert import_time < bench.IMPORT_BUDGET * MARGIN
+
+
+def test_debug_tables_are_loaded_on_use():
+    from posprinter import suremark_debug
+    from posprinter.suremark import PrinterMessage
+    m = PrinterMessage(PrinterMessage.STATUS_COMMAND_COMPLETE.to_bytes(8, 'little'))
+    assert m.conditions() == ['Command complete']
+    assert suremark_debug.status_tables() == (suremark_debug.status_conditions,
+                                              suremark_debug.active_status_conditions)
+    assert suremark_debug.active_status_conditions[0][1] == ('Command complete',)
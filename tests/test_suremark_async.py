@@ -0,0 +1,183 @@
+import asyncio
+
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_async import AsyncSureMark
+from posprinter.suremark_sim import SimulatedSureMark
+
+
+class Writer:
+    """
+    Stream writer that hands the data to a simulated printer and feeds its responses to the reader.
+    """
+
+    def __init__(self, sim, reader):
+        self.sim = sim
+        self.reader = reader
+        self.closed = False
+
+    def write(self, data):
+        self.sim.write(data)
+        # let the responses arrive
+        self.sim.sleep(0.1)
+        waiting = self.sim.in_waiting
+        if waiting:
+            self.reader.feed_data(self.sim.read(waiting))
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def run(coro_factory, sim=None):
+    sim = sim or SimulatedSureMark()
+
+    async def main():
+        reader = asyncio.StreamReader()
+        writer = Writer(sim, reader)
+        p = AsyncSureMark(reader, writer)
+        try:
+            return await coro_factory(p)
+        finally:
+            await p.close()
+
+    return asyncio.run(main())
+
+
+def test_query_status():
+    m = run(lambda p: p.query_status(timeout=1))
+    assert m.is_printer_id_response()
+    assert m.command_complete()
+
+
+def test_concurrent_requests_are_answered_in_order():
+    sim = SimulatedSureMark(counters={SureMark.STATS_RAW_NUMBER_CUTS_FAILED[0]: 7})
+
+    async def requests(p):
+        return await asyncio.gather(p.identify(timeout=1), p.get_printer_usage_stat_number_failed_paper_cuts(timeout=1),
+                                    p.query_status(timeout=1))
+
+    printer_id, failed_cuts, status = run(requests, sim)
+    assert printer_id.raw() == SimulatedSureMark.PRINTER_ID
+    assert failed_cuts == 7
+    assert status.is_printer_id_response()
+
+
+def test_commands_are_sent_without_blocking():
+    sim = SimulatedSureMark()
+
+    async def commands(p):
+        p.beep()
+        with p.batch():
+            p.write(b'hello\n')
+            p.cut()
+        await p.drain()
+
+    run(commands, sim)
+    assert sim.bytes_received > len(b'hello\n')
+
+
+def test_timeout_without_response():
+    class Silent(Writer):
+        def write(self, data):
+            pass
+
+    async def main():
+        reader = asyncio.StreamReader()
+        p = AsyncSureMark(reader, Silent(None, reader))
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await p.query_status(timeout=0.01)
+        finally:
+            await p.close()
+
+    asyncio.run(main())
+
+
+def test_close_fails_pending_requests():
+    class Silent(Writer):
+        def write(self, data):
+            pass
+
+    async def main():
+        reader = asyncio.StreamReader()
+        writer = Silent(None, reader)
+        p = AsyncSureMark(reader, writer)
+        request = asyncio.ensure_future(p.query_status(timeout=None))
+        await asyncio.sleep(0)
+        await p.close()
+        with pytest.raises(ConnectionError):
+            await request
+        assert writer.closed
+
+    asyncio.run(main())
+
+
+def test_dropped_response_doesnt_shift_the_responses():
+    sim = SimulatedSureMark(counters={SureMark.STATS_RAW_NUMBER_CUTS_FAILED[0]: 7,
+                                      SureMark.STATS_RAW_NUMBER_CUST_RECEIPT_COVER_OPENED[0]: 3})
+
+    async def requests(p):
+        sim.inject('drop_response')
+        with pytest.raises(asyncio.TimeoutError):
+            await p.get_printer_usage_stat_number_failed_paper_cuts(timeout=0.05)
+        return await asyncio.gather(p.get_printer_usage_stat_number_failed_paper_cuts(timeout=1),
+                                    p.get_printer_usage_stats_thermal_cover_opened(timeout=1),
+                                    p.identify(timeout=1))
+
+    failed_cuts, cover_opened, printer_id = run(requests, sim)
+    assert (failed_cuts, cover_opened) == (7, 3)
+    assert printer_id.raw() == SimulatedSureMark.PRINTER_ID
+
+
+def test_timeout_fails_the_other_requests():
+    sim = SimulatedSureMark()
+
+    async def requests(p):
+        sim.inject('drop_response', count=2)
+        first = asyncio.ensure_future(p.query_status(timeout=0.05))
+        second = asyncio.ensure_future(p.query_status(timeout=None))
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        with pytest.raises(asyncio.TimeoutError):
+            await second
+        return await p.query_status(timeout=1)
+
+    assert run(requests, sim).is_printer_id_response()
+
+
+def test_late_response_of_another_type_is_dropped():
+    sim = SimulatedSureMark(counters={SureMark.STATS_RAW_NUMBER_CUTS_FAILED[0]: 7})
+
+    async def requests(p):
+        sim.inject('delay_response', delay=0.15)
+        with pytest.raises(asyncio.TimeoutError):
+            await p.get_printer_usage_stat_number_failed_paper_cuts(timeout=0.05)
+        # the late counter arrives together with the printer ID
+        return await p.identify(timeout=1)
+
+    assert run(requests, sim).raw() == SimulatedSureMark.PRINTER_ID
+
+
+def test_read_flash():
+    sim = SimulatedSureMark(flash=bytes(range(200)))
+
+    async def read(p):
+        assert await p.get_user_flash_storage_size(timeout=1) == 200
+        return await p.retrieve_flash_storage(10, 100, timeout=1)
+
+    assert run(read, sim) == bytes(range(100, 110))
+
+
+def test_only_commands_are_forwarded():
+    async def check(p):
+        assert p.CMD_PRINT_LINE_FEED == SureMark.CMD_PRINT_LINE_FEED
+        p.print_line_feed()
+        for name in ('dump_flash', 'request_flash_storage', 'get_printer_usage_stats_raw_sync'):
+            with pytest.raises(AttributeError):
+                getattr(p, name)
+
+    run(check)
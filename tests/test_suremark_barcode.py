@@ -0,0 +1,209 @@
+import os
+import re
+import textwrap
+
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_barcode import (CODE128_A, CODE128_C, BarcodeBuilder, code128_segments, code128_subset,
+                                         code128_width, gs1_check_digit, pdf417_commands, pdf417_size, upc_e_to_upc_a,
+                                         validate)
+from posprinter.suremark_raster import PAPER_80MM_DOTS
+from posprinter.suremark_sim import SimulatedSureMark
+
+README = os.path.join(os.path.dirname(__file__), os.pardir, 'README.rst')
+
+
+def test_check_digit():
+    assert gs1_check_digit('400638133393') == '1'
+    assert gs1_check_digit('03600029145') == '2'
+    assert upc_e_to_upc_a('0123453') == '01230000045'
+    assert upc_e_to_upc_a('0123457') == '01234500007'
+
+
+@pytest.mark.parametrize('type,data,expected', [
+    (SureMark.BARCODE_EAN13, '400638133393', '4006381333931'),
+    (SureMark.BARCODE_EAN13, '4006381333931', '4006381333931'),
+    (SureMark.BARCODE_UPC_A, '03600029145', '036000291452'),
+    (SureMark.BARCODE_EAN8, '9638507', '96385074'),
+    (SureMark.BARCODE_UPC_E, '123453', '01234531'),
+    (SureMark.BARCODE_ITF, '1234567890123', '12345678901231'),
+    (SureMark.BARCODE_ITF, '1234', '1234'),
+    (SureMark.BARCODE_CODE_39, 'ABC-12', 'ABC-12'),
+])
+def test_validate(type, data, expected):
+    assert validate(data, type) == expected
+
+
+@pytest.mark.parametrize('type,data', [
+    (SureMark.BARCODE_EAN13, '4006381333932'),  # wrong check digit
+    (SureMark.BARCODE_EAN13, '40063813339'),  # too short
+    (SureMark.BARCODE_UPC_A, '1234567890'),
+    (SureMark.BARCODE_UPC_A, '036000291453'),
+    (SureMark.BARCODE_EAN8, '963850'),
+    (SureMark.BARCODE_UPC_E, '21234531'),  # number system 2
+    (SureMark.BARCODE_UPC_E, '01234530'),
+    (SureMark.BARCODE_ITF, '12A4'),
+    (SureMark.BARCODE_CODE_39, 'abc'),
+    (SureMark.BARCODE_CODABAR, ''),
+    (SureMark.BARCODE_CODE_128A, 'caf\xe9'),
+    (b'\x99', '123'),
+])
+def test_validate_rejects(type, data):
+    with pytest.raises(ValueError):
+        validate(data, type)
+
+
+def test_code128_segments():
+    assert code128_segments('123456') == [(CODE128_C, '123456')]
+    assert code128_segments('AB123456') == [(CODE128_A, 'AB'), (CODE128_C, '123456')]
+    # a single digit pair isn't worth two switches
+    assert code128_segments('A12B') == [(CODE128_A, 'A12B')]
+    assert code128_width('123456') < code128_width('ABCDEF')
+
+
+def test_code128_width_is_the_printed_width():
+    assert code128_subset('123456') == CODE128_C
+    assert code128_subset('12345') == CODE128_A
+    # the plan would switch to C for the digits, but the symbol is sent in A as a whole
+    assert code128_segments('ABC123456789')[-1] == (CODE128_C, '23456789')
+    assert code128_subset('ABC123456789') == CODE128_A
+    assert code128_width('ABC123456789') == (1 + 12 + 1) * 11 + 13
+    assert code128_width('123456') == (1 + 3 + 1) * 11 + 13
+
+
+def test_code128c_is_chosen_for_digit_pairs():
+    builder = BarcodeBuilder()
+    assert builder.command('1234', SureMark.BARCODE_CODE_128A) == \
+        SureMark.CMD_BARCODE_PRINT + SureMark.BARCODE_CODE_128C + b'1234\x00'
+    assert builder.command('A123', SureMark.BARCODE_CODE_128A) == \
+        SureMark.CMD_BARCODE_PRINT + SureMark.BARCODE_CODE_128A + b'A123\x00'
+    with pytest.raises(ValueError):
+        builder.command('123', SureMark.BARCODE_CODE_128C)
+
+
+def test_builder_cache():
+    builder = BarcodeBuilder(cache_size=1)
+    command = builder.command('400638133393')
+    assert command == SureMark.CMD_BARCODE_PRINT + SureMark.BARCODE_EAN13 + b'4006381333931\x00'
+    assert builder.command(b'400638133393') == command
+    assert builder.command(bytearray(b'400638133393')) == command
+    assert builder.command(bytearray(b'400638133393')) == command
+    assert (builder.hits, builder.misses) == (2, 2)
+    builder.command('96385074', SureMark.BARCODE_EAN8)
+    builder.command('400638133393')
+    assert builder.misses == 4
+    with pytest.raises(ValueError):
+        builder.command(b'\xff')
+
+
+def test_bad_data_isnt_sent():
+    sim = SimulatedSureMark()
+    p = SureMark(sim)
+    with pytest.raises(ValueError):
+        p.barcode('1234567890', type=SureMark.BARCODE_UPC_A)
+    assert sim.bytes_received == 0
+
+
+class _Serial:
+    # stands in for serial.Serial, running the example against the simulator
+    def __init__(self, port, baudrate, timeout=None):
+        self.sim = SimulatedSureMark(baudrate=baudrate)
+
+    def __enter__(self):
+        return self.sim
+
+    def __exit__(self, *exc):
+        self.sim.close()
+
+
+class _SerialModule:
+    Serial = _Serial
+
+
+def test_readme_example(capsys):
+    with open(README) as f:
+        text = f.read()
+    block = re.search(r'\.\. code-block:: python\n\n((?:    .*\n|\s*\n)+)', text).group(1)
+    code = textwrap.dedent(block).replace('import serial\n', '')
+    exec(code, {'serial': _SerialModule})
+    assert 'Paper cuts:' in capsys.readouterr().out
+
+
+def test_batch_docstring_example(capsys):
+    example = SureMark.batch.__doc__.split('::\n', 1)[1]
+    sim = SimulatedSureMark()
+    exec(textwrap.dedent(example), {'SureMark': SureMark, 'p': SureMark(sim)})
+    assert capsys.readouterr().out == '2 writes saved\n'
+    assert sim.requests == 0
+
+
+def test_pdf417_commands():
+    data = pdf417_commands('RCPT-0042', columns=4, error_correction=3, truncated=True)
+    commands = data.split(SureMark.CMD_2D_SYMBOL)[1:]
+    assert [c[3:4] for c in commands] == [b'\x41', b'\x42', b'\x43', b'\x44', b'\x45', b'\x46', b'\x50', b'\x51']
+    assert commands[0] == b'\x03\x00' + SureMark.SYMBOL_PDF417 + b'\x41\x04'
+    assert commands[4].endswith(b'\x30\x33')
+    assert commands[5].endswith(b'\x01')
+    assert commands[6] == bytes([12, 0]) + SureMark.SYMBOL_PDF417 + b'\x50\x30RCPT-0042'
+
+
+def test_pdf417_sends_only_the_data():
+    sim = SimulatedSureMark()
+    SureMark(sim).pdf417(b'\x00\xff' * 100)
+    # eight commands of 7 bytes and their parameters
+    assert sim.bytes_received == 200 + 8 * 7 + 9
+
+
+@pytest.mark.parametrize('data,values', [
+    (b'ABC DEF', 7),
+    (b'abc', 4),  # latch to lower case
+    (b'aBc', 5),  # shift for a single upper case character
+    (b'aBCd', 8),  # latch to upper case and back
+    (b'A;B', 4),  # shift to punctuation
+    (b'A;;B', 7),  # latch to punctuation and back
+    (b'RCPT-0042|12.50', 18),
+])
+def test_pdf417_text_counts_latches_and_shifts(data, values):
+    assert pdf417_size(data, error_correction=0).codewords == 1 + (values + 1) // 2 + 2
+
+
+def test_pdf417_codewords_per_mode():
+    assert pdf417_size('1' * 44, error_correction=0).codewords == 2 + 15 + 2
+    assert pdf417_size(b'\x00' * 12, error_correction=0).codewords == 2 + 10 + 2
+    assert pdf417_size(b'X', error_correction=2).codewords == 1 + 1 + 8
+
+
+def test_pdf417_size():
+    size = pdf417_size('RCPT-0042|2026-10-17|12.50', columns=3, module_width=2)
+    assert size.columns == 3
+    assert size.rows == max(3, -(-size.codewords // 3))
+    assert size.width == (17 * 3 + 69) * 2
+    assert size.height == size.rows * 3 * 2
+    # as many columns as fit on the paper
+    size = pdf417_size('X')
+    assert size.columns == 7
+    assert size.width <= PAPER_80MM_DOTS
+    with pytest.raises(ValueError):
+        pdf417_size('X', columns=8)
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(data=''),
+    dict(columns=31),
+    dict(rows=2),
+    dict(rows=91),
+    dict(module_width=1),
+    dict(row_height=9),
+    dict(error_correction=9),
+    dict(data=b'\x00' * 1200),  # too many codewords
+    dict(data=b'\x00' * 600, columns=1),  # too many rows
+    dict(data=b'\x00' * 600, columns=4, rows=10),
+    dict(columns=30, module_width=4),  # wider than the paper
+])
+def test_pdf417_invalid(kwargs):
+    kwargs.setdefault('data', 'RCPT-0042')
+    sim = SimulatedSureMark()
+    with pytest.raises(ValueError):
+        SureMark(sim).pdf417(**kwargs)
+    assert sim.bytes_received == 0
@@ -0,0 +1,125 @@
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_batch import CommandBatch
+
+
+class Device:
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return len(data)
+
+
+def test_flush_sends_everything_in_one_write():
+    dev = Device()
+    batch = CommandBatch(dev.write)
+    batch.append(b'\x1b\x21\x00')
+    batch.append(b'hello\n')
+    batch.append(b'\x0c')
+    assert len(batch) == 10
+    batch.flush()
+    assert dev.writes == [b'\x1b\x21\x00hello\n\x0c']
+    assert len(batch) == 0
+    assert batch.commands == 3
+    assert batch.writes == 1
+    assert batch.bytes == 10
+    assert batch.writes_saved() == 2
+
+
+def test_flush_splits_at_max_write():
+    dev = Device()
+    batch = CommandBatch(dev.write, max_write=4)
+    batch.append(b'0123456789')
+    batch.flush()
+    assert dev.writes == [b'0123', b'4567', b'89']
+
+
+def test_buffer_grows_beyond_capacity():
+    dev = Device()
+    batch = CommandBatch(dev.write, capacity=2)
+    for i in range(100):
+        batch.append(bytes([i]))
+    batch.flush()
+    assert dev.writes == [bytes(range(100))]
+
+
+def test_empty_flush_writes_nothing():
+    dev = Device()
+    batch = CommandBatch(dev.write)
+    batch.flush()
+    assert dev.writes == []
+
+
+def test_discard():
+    dev = Device()
+    batch = CommandBatch(dev.write)
+    batch.append(b'abc')
+    batch.discard()
+    batch.flush()
+    assert dev.writes == []
+
+
+def test_invalid_max_write():
+    with pytest.raises(ValueError):
+        CommandBatch(Device().write, max_write=0)
+
+
+def test_printer_batch_coalesces_writes():
+    dev = Device()
+    p = SureMark(dev)
+    with p.batch() as b:
+        p.write(b'one\n')
+        p.write(b'two\n')
+        p.cut()
+    assert dev.writes == [b'one\ntwo\n\x0c']
+    assert b.writes_saved() == 2
+
+
+def test_printer_batch_is_dropped_on_exception():
+    dev = Device()
+    p = SureMark(dev)
+    with pytest.raises(RuntimeError):
+        with p.batch():
+            p.write(b'one\n')
+            raise RuntimeError()
+    assert dev.writes == []
+    # later writes go straight to the device again
+    p.write(b'two\n')
+    assert dev.writes == [b'two\n']
+
+
+def test_nested_batches_join_the_outer_one():
+    dev = Device()
+    p = SureMark(dev)
+    with p.batch():
+        p.write(b'a')
+        with p.batch():
+            p.write(b'b')
+        assert dev.writes == []
+    assert dev.writes == [b'ab']
+
+
+def test_failed_write_keeps_only_the_rest():
+    dev = Device()
+
+    def write(data):
+        if len(dev.writes) == 1 and not failed:
+            failed.append(True)
+            raise OSError('write timeout')
+        return dev.write(data)
+
+    failed = []
+    batch = CommandBatch(write, max_write=4)
+    batch.append(b'0123456789')
+    with pytest.raises(OSError):
+        batch.flush()
+    assert len(batch) == 6
+    assert batch.bytes == 4
+    batch.flush()
+    assert dev.writes == [b'0123', b'4567', b'89']
+    assert len(batch) == 0
+    assert batch.bytes == 10
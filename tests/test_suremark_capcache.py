@@ -0,0 +1,72 @@
+from posprinter.suremark import SureMark
+from posprinter.suremark_capcache import CapabilityCache
+from posprinter.suremark_pool import PrinterPool
+from posprinter.suremark_sim import SimulatedSureMark
+
+FLASH = b'\x00' * 1000
+
+
+def test_probes_once(tmp_path):
+    path = str(tmp_path / 'printers.json')
+    probes = []
+    sim = SimulatedSureMark(flash=FLASH)
+    p = SureMark(sim)
+    caps = CapabilityCache(path, probe=lambda printer: probes.append(printer) or {'cheque': False}).get(p, 'ttyS0')
+    assert caps.printer_id.raw() == SimulatedSureMark.PRINTER_ID
+    assert caps.flash_size == len(FLASH)
+    assert caps.extra == {'cheque': False}
+    # a new process only needs the status query
+    cache = CapabilityCache(path, probe=lambda printer: probes.append(printer))
+    before = sim.requests
+    caps = cache.get(p, 'ttyS0')
+    assert sim.requests == before + 1
+    assert caps.flash_size == len(FLASH)
+    assert cache.hits == 1 and cache.misses == 0
+    assert len(probes) == 1
+
+
+def test_message_avoids_the_query(tmp_path):
+    path = str(tmp_path / 'printers.json')
+    sim = SimulatedSureMark()
+    p = SureMark(sim)
+    cache = CapabilityCache(path)
+    cache.get(p, 'ttyS0')
+    m = p.get_printer_usage_stats_raw(SureMark.STATS_RAW_NUMBER_PAPER_CUTS)
+    before = sim.requests
+    cache.get(p, 'ttyS0', message=m)
+    assert sim.requests == before
+    assert cache.hits == 1
+
+
+def test_revalidated_on_ec_level_or_printer_id(tmp_path):
+    path = str(tmp_path / 'printers.json')
+    cache = CapabilityCache(path)
+    cache.get(SureMark(SimulatedSureMark()), 'ttyS0')
+    caps = cache.get(SureMark(SimulatedSureMark(ec_level=0x45)), 'ttyS0')
+    assert caps.ec_level == 0x45
+    # another model with the same EC level plugged into the port
+    caps = cache.get(SureMark(SimulatedSureMark(ec_level=0x45, printer_id=b'\x30\x01\x03\x00\x00')), 'ttyS0')
+    assert caps.printer_id.raw() == b'\x30\x01\x03\x00\x00'
+    assert cache.misses == 3
+    assert cache.hits == 0
+
+
+def test_keyed_by_identity(tmp_path):
+    path = str(tmp_path / 'printers.json')
+    cache = CapabilityCache(path)
+    cache.get(SureMark(SimulatedSureMark()), 'ttyUSB0', 'A')
+    cache.get(SureMark(SimulatedSureMark()), 'ttyUSB0', 'B')
+    assert cache.misses == 2
+    cache.invalidate('ttyUSB0', 'A')
+    cache.get(SureMark(SimulatedSureMark()), 'ttyUSB0', 'B')
+    assert cache.hits == 1
+
+
+def test_pool_uses_identities(tmp_path):
+    path = str(tmp_path / 'printers.json')
+    cache = CapabilityCache(path)
+    devices = {'ttyUSB0': SimulatedSureMark(), 'ttyUSB1': SimulatedSureMark()}
+    PrinterPool(devices, capability_cache=cache, identities={'ttyUSB0': 'A', 'ttyUSB1': 'B'}).shutdown()
+    with open(path) as f:
+        text = f.read()
+    assert 'ttyUSB0|A' in text and 'ttyUSB1|B' in text
@@ -0,0 +1,73 @@
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_capture import (DIRECTION_READ, DIRECTION_WRITE, CaptureDevice, load_capture,
+                                         replay_decode, replay_to_device)
+from posprinter.suremark_sim import SimulatedSureMark
+
+
+def capture_session():
+    sim = SimulatedSureMark()
+    dev = CaptureDevice(sim, clock=sim.clock)
+    p = SureMark(dev)
+    p.write(b'hello\n')
+    p.query_status()
+    return sim, dev
+
+
+def test_records_writes_and_reads():
+    _, dev = capture_session()
+    records = dev.records()
+    assert records[0].direction == DIRECTION_WRITE
+    assert records[0].data == b'hello\n'
+    assert any(r.direction == DIRECTION_READ for r in records)
+    assert [r.time for r in records] == sorted(r.time for r in records)
+
+
+def test_save_and_load(tmp_path):
+    _, dev = capture_session()
+    path = str(tmp_path / 'printer.cap')
+    dev.save(path)
+    assert load_capture(path) == dev.records()
+    with open(path, 'r+b') as f:
+        f.truncate(20)
+    with pytest.raises(ValueError):
+        load_capture(path)
+    with open(path, 'wb') as f:
+        f.write(b'garbage')
+    with pytest.raises(ValueError):
+        load_capture(path)
+
+
+def test_replay_decode():
+    _, dev = capture_session()
+    items = list(replay_decode(dev.records()))
+    messages = [item for _, direction, item in items if direction == DIRECTION_READ]
+    assert len(messages) == 1
+    assert messages[0].is_printer_id_response()
+
+
+def test_replay_to_device():
+    _, dev = capture_session()
+    replayed = replay_to_device(dev.records(), SimulatedSureMark())
+    assert b''.join(r.data for r in replayed if r.direction == DIRECTION_WRITE) == \
+        b''.join(r.data for r in dev.records() if r.direction == DIRECTION_WRITE)
+    assert [m for _, d, m in replay_decode(replayed) if d == DIRECTION_READ] == \
+        [m for _, d, m in replay_decode(dev.records()) if d == DIRECTION_READ]
+
+
+def test_ring_buffer_drops_oldest():
+    dev = CaptureDevice(SimulatedSureMark(), size=200)
+    for i in range(20):
+        dev.write(bytes([i]) * 20)
+    records = dev.records()
+    assert dev.dropped == 20 - len(records)
+    assert records[-1].data == bytes([19]) * 20
+    assert [r.data[0] for r in records] == list(range(20 - len(records), 20))
+
+
+def test_large_data_is_truncated():
+    dev = CaptureDevice(SimulatedSureMark(), size=100)
+    dev.write(bytes(range(200)))
+    assert dev.truncated == 1
+    assert dev.records()[0].data == bytes(range(200))[-(100 - 13):]
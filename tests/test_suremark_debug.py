@@ -0,0 +1,18 @@
+from posprinter import suremark_debug
+
+
+def test_debug_tables():
+    conditions, active = suremark_debug.status_tables()
+    assert len(conditions) == len(active) == 8
+    assert all(len(table) == 256 for table in conditions)
+    assert suremark_debug.decode_status_byte(0x81, 0)[0] == 'Command complete'
+    assert suremark_debug.decode_status_byte(0x81, 0)[7] == 'Command rejected'
+    assert active[0][0x81] == ('Command complete', 'Command rejected')
+    # reserved bits never show up as conditions
+    assert active[0][1 << 4] == ()
+
+
+def test_render_status_byte():
+    text = suremark_debug.render_status_byte(0x01, 0)
+    assert 'Command complete' in text
+    assert '0x01' in text
@@ -0,0 +1,101 @@
+import io
+
+import pytest
+
+from posprinter.suremark_decoder import ResponseDecoder
+from posprinter.suremark_status import PrinterMessage
+
+
+def message(payload=b''):
+    # command complete, with the reserved bits as reported by a Tx6
+    status = PrinterMessage.STATUS_COMMAND_COMPLETE | 0x08 | (0x0f << 8) | (0x20 << 32) | (0x20 << 48)
+    body = status.to_bytes(8, 'little') + payload
+    return (len(body) + 2).to_bytes(2, 'big') + body
+
+
+def test_single_message():
+    d = ResponseDecoder()
+    d.feed(message(b'\x01\x02'))
+    frame = d.next_frame()
+    assert bytes(frame) == message(b'\x01\x02')[2:]
+    assert d.next_frame() is None
+    assert d.messages == 1
+    assert len(d) == 0
+
+
+def test_split_feeds():
+    data = message(b'abc') + message()
+    d = ResponseDecoder()
+    frames = []
+    for i in range(len(data)):
+        d.feed(data[i:i + 1])
+        frame = d.next_frame()
+        if frame is not None:
+            frames.append(bytes(frame))
+    assert frames == [message(b'abc')[2:], message()[2:]]
+
+
+def test_resync_on_garbage():
+    d = ResponseDecoder()
+    d.feed(b'\x00\x01\xff' + message(b'x'))
+    m = d.next_message()
+    assert m is not None
+    assert bytes(m.payload()) == b'x'
+    assert d.discarded == 3
+
+
+def test_implausible_status_is_skipped():
+    bad = bytearray(message())
+    # clear a reserved bit that must be set
+    bad[2 + 1] &= ~(1 << 3)
+    d = ResponseDecoder()
+    d.feed(bytes(bad) + message(b'ok'))
+    frames = [bytes(m.payload()) for m in d]
+    assert frames == [b'ok']
+    assert d.discarded > 0
+
+
+def test_bytes_needed():
+    data = message(b'12345')
+    d = ResponseDecoder()
+    assert d.bytes_needed() == ResponseDecoder.MIN_LENGTH
+    d.feed(data[:4])
+    assert d.bytes_needed() == ResponseDecoder.MIN_LENGTH - 4
+    d.feed(data[4:10])
+    assert d.bytes_needed() == len(data) - 10
+    d.feed(data[10:])
+    assert d.bytes_needed() == 1
+    assert d.next_frame() is not None
+
+
+def test_readinto_reads_exactly_one_message():
+    data = message(b'first') + message(b'second')
+    device = io.BytesIO(data)
+    d = ResponseDecoder(size=4)
+    while d.next_frame() is None:
+        assert d.readinto(device) > 0
+    assert device.tell() == len(message(b'first'))
+
+
+def test_buffer_grows_for_long_messages():
+    payload = bytes(range(256)) * 8
+    d = ResponseDecoder(size=16)
+    d.feed(message(payload))
+    assert bytes(d.next_message().payload()) == payload
+
+
+def test_max_length():
+    with pytest.raises(ValueError):
+        ResponseDecoder(max_length=4)
+    d = ResponseDecoder(max_length=12)
+    d.feed(message(b'long payload') + message())
+    assert [m.payload_length() for m in d] == [0]
+
+
+def test_reset():
+    d = ResponseDecoder()
+    d.feed(message()[:5])
+    d.reset()
+    assert len(d) == 0
+    d.feed(message())
+    assert d.next_frame() is not None
@@ -0,0 +1,160 @@
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from posprinter import suremark_durable
+from posprinter.suremark import SureMark
+from posprinter.suremark_durable import DurableSpool
+from posprinter.suremark_sim import SimulatedSureMark
+
+
+def make(tmp_path, sim=None, **kwargs):
+    sim = sim or SimulatedSureMark()
+    spool = DurableSpool(SureMark(sim), str(tmp_path / 'spool.log'), clock=sim.clock, sleep=sim.sleep, **kwargs)
+    return sim, spool
+
+
+def test_prints_and_acknowledges(tmp_path):
+    sim, spool = make(tmp_path)
+    spool.enqueue(b'receipt 1\n')
+    spool.enqueue(b'receipt 2\n')
+    assert spool.print_pending() == 2
+    assert spool.pending() == []
+    assert sim.bytes_printed == len(b'receipt 1\nreceipt 2\n')
+    spool.close()
+    _, spool = make(tmp_path, sim)
+    assert spool.recovered == 0
+    assert spool.print_pending() == 0
+
+
+def test_recovers_pending_jobs(tmp_path):
+    sim, spool = make(tmp_path)
+    for i in range(3):
+        spool.enqueue('receipt {}\n'.format(i).encode())
+    assert spool.print_pending(max_jobs=1) == 1
+    # crash: the log isn't closed
+    _, spool = make(tmp_path, sim)
+    assert spool.recovered == 2
+    assert [spool.job(seq) for seq in spool.pending()] == [b'receipt 1\n', b'receipt 2\n']
+    # sequence numbers continue
+    assert spool.enqueue(b'receipt 3\n') == 4
+    assert spool.print_pending() == 3
+
+
+def test_damaged_record_ends_the_log(tmp_path):
+    sim, spool = make(tmp_path)
+    spool.enqueue(b'first')
+    spool.enqueue(b'second')
+    spool.close()
+    path = str(tmp_path / 'spool.log')
+    with open(path, 'r+b') as f:
+        data = f.read()
+        # a write of the second record interrupted by the crash
+        f.seek(data.index(b'second'))
+        f.write(b'sec\x00\x00\x00')
+    _, spool = make(tmp_path, sim)
+    assert spool.recovered == 1
+    assert spool.job(spool.pending()[0]) == b'first'
+    # the damaged record is overwritten
+    spool.enqueue(b'third')
+    _, spool = make(tmp_path, sim)
+    assert [spool.job(seq) for seq in spool.pending()] == [b'first', b'third']
+
+
+def test_group_commit(tmp_path):
+    _, spool = make(tmp_path, commit_batch=3, commit_interval=60.0)
+    spool.enqueue(b'a', wait=False)
+    spool.enqueue(b'b', wait=False)
+    assert spool.commits == 0
+    spool.enqueue(b'c', wait=False)
+    assert spool.commits == 1
+    spool.close()
+
+
+def test_flushes_after_the_commit_interval(tmp_path):
+    spool = DurableSpool(SureMark(SimulatedSureMark()), str(tmp_path / 'spool.log'), commit_interval=0.01)
+    spool.enqueue(b'a', wait=False)
+    deadline = time.monotonic() + 5.0
+    while spool.commits == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert spool.commits == 1
+    spool.close()
+
+
+def test_grows_the_log(tmp_path):
+    sim, spool = make(tmp_path)
+    job = b'x' * 1000
+    for _ in range(DurableSpool.INITIAL_SIZE // len(job) + 10):
+        spool.enqueue(job, wait=False)
+    spool.close()
+    assert os.path.getsize(str(tmp_path / 'spool.log')) > DurableSpool.INITIAL_SIZE
+    _, spool = make(tmp_path, sim)
+    assert spool.recovered == DurableSpool.INITIAL_SIZE // len(job) + 10
+
+
+def test_compaction_syncs_the_directory(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def record(fd):
+        synced.append(stat.S_ISDIR(os.fstat(fd).st_mode))
+        fsync(fd)
+
+    monkeypatch.setattr(suremark_durable.os, 'fsync', record)
+    sim, spool = make(tmp_path, compact_size=100)
+    # creating the log syncs the directory
+    assert synced[0]
+    for i in range(5):
+        spool.enqueue(b'x' * 50)
+    del synced[:]
+    spool.print_pending()
+    assert synced[-1]
+    assert os.path.getsize(str(tmp_path / 'spool.log')) == DurableSpool.INITIAL_SIZE
+    assert not os.path.exists(str(tmp_path / 'spool.log.tmp'))
+    # the compacted log keeps the sequence numbers
+    _, spool = make(tmp_path, sim)
+    assert spool.recovered == 0
+    assert spool.enqueue(b'y') == 6
+
+
+def test_compaction_with_concurrent_commits(tmp_path):
+    # commits from other threads race with the compaction after every job, none must hang or touch a closed log
+    sim = SimulatedSureMark()
+    spool = DurableSpool(SureMark(sim), str(tmp_path / 'spool.log'), commit_interval=0.0001, compact_size=0,
+                         sleep=sim.sleep)
+    errors = []
+    done = threading.Event()
+
+    def commit():
+        while not done.is_set():
+            try:
+                spool.commit()
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=commit, daemon=True) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for i in range(30):
+        spool.enqueue('job {}'.format(i).encode(), wait=i % 2 == 0)
+        assert spool.print_pending() == 1
+    done.set()
+    for t in threads:
+        t.join(5.0)
+        assert not t.is_alive()
+    spool.close()
+    assert errors == []
+    assert os.path.getsize(str(tmp_path / 'spool.log')) == DurableSpool.INITIAL_SIZE
+
+
+def test_completion_timeout(tmp_path):
+    sim, spool = make(tmp_path, completion_timeout=1.0)
+    spool.enqueue(b'x')
+    sim.inject('cover_open', duration=10.0)
+    with pytest.raises(TimeoutError):
+        spool.print_pending()
+    assert spool.pending() == [1]
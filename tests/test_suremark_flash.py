@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_flash import FlashDumper
+from posprinter.suremark_sim import SimulatedSureMark
+
+FLASH = bytes(range(256)) * 20 + b'end'
+
+
+def test_retrieve_flash_storage():
+    p = SureMark(SimulatedSureMark(flash=FLASH))
+    assert p.get_user_flash_storage_size() == len(FLASH)
+    assert p.retrieve_flash_storage(10, 250) == FLASH[250:260]
+
+
+def test_flash_address_range():
+    p = SureMark(SimulatedSureMark())
+    with pytest.raises(ValueError):
+        p.request_flash_storage(0, 0)
+    with pytest.raises(ValueError):
+        p.request_flash_storage(256, 0)
+    with pytest.raises(ValueError):
+        p.request_flash_storage(1, -1)
+    with pytest.raises(ValueError):
+        p.request_flash_storage(3, 0xfffffe)
+    # the address of the size request
+    with pytest.raises(ValueError):
+        p.request_flash_storage(1, 0xffffff)
+    # the last readable byte
+    p.request_flash_storage(2, 0xfffffe)
+    p.request_flash_storage(0xff, 0x1000000 - 0xff)
+
+
+def test_dump_flash(tmp_path):
+    sim = SimulatedSureMark(flash=FLASH)
+    path = str(tmp_path / 'flash.bin')
+    assert SureMark(sim).dump_flash(path, chunk=100) == len(FLASH)
+    with open(path, 'rb') as f:
+        assert f.read() == FLASH
+    assert not os.path.exists(path + '.progress')
+
+
+class FailingSureMark(SureMark):
+    """
+    Loses the connection after a number of flash requests.
+    """
+
+    def __init__(self, device, requests):
+        super().__init__(device)
+        self.requests = requests
+
+    def request_flash_storage(self, count, addr):
+        if self.requests == 0:
+            raise OSError('Port is gone')
+        self.requests -= 1
+        super().request_flash_storage(count, addr)
+
+
+def test_dump_flash_resumes(tmp_path):
+    path = str(tmp_path / 'flash.bin')
+    dumper = FlashDumper(FailingSureMark(SimulatedSureMark(flash=FLASH), 10), path, chunk=100)
+    with pytest.raises(OSError):
+        dumper.run()
+    assert os.path.exists(path + '.progress')
+    dumper = FlashDumper(SureMark(SimulatedSureMark(flash=FLASH)), path, chunk=100)
+    dumper.run()
+    # windows of 1, 2, 3 and 4 requests completed before the failure
+    assert dumper.resumed_from == 1000
+    assert dumper.bytes_read == len(FLASH) - 1000
+    with open(path, 'rb') as f:
+        assert f.read() == FLASH
+
+
+class WrongResponseSureMark(SureMark):
+    """
+    Sends a printer ID request instead of the first flash request.
+    """
+
+    def __init__(self, device):
+        super().__init__(device)
+        self.wrong = True
+
+    def request_flash_storage(self, count, addr):
+        if self.wrong:
+            self.wrong = False
+            self.write(SureMark.CMD_RETRIEVE_PRINTER_ID)
+            return
+        super().request_flash_storage(count, addr)
+
+
+def test_dump_flash_counts_timeouts_and_errors(tmp_path):
+    sim = SimulatedSureMark(flash=FLASH)
+    dumper = FlashDumper(WrongResponseSureMark(sim), str(tmp_path / 'flash.bin'), chunk=100)
+    assert dumper.run() == len(FLASH)
+    assert dumper.errors == 1
+    assert dumper.timeouts == 0
+
+    sim = SimulatedSureMark(flash=FLASH)
+    dumper = FlashDumper(SureMark(sim), str(tmp_path / 'flash.bin'), size=len(FLASH), chunk=100)
+    sim.inject('drop_response')
+    assert dumper.run() == len(FLASH)
+    assert (dumper.timeouts, dumper.errors) == (1, 0)
+    with open(str(tmp_path / 'flash.bin'), 'rb') as f:
+        assert f.read() == FLASH
+
+
+def test_dump_empty_flash_removes_the_checkpoint(tmp_path):
+    path = str(tmp_path / 'flash.bin')
+    with open(path + '.progress', 'w') as f:
+        f.write('{"size": 100, "chunk": 100, "done": 50}')
+    assert SureMark(SimulatedSureMark()).dump_flash(path) == 0
+    assert os.path.getsize(path) == 0
+    assert not os.path.exists(path + '.progress')
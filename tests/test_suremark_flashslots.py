@@ -0,0 +1,65 @@
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_flashslots import FlashSlots
+from posprinter.suremark_sim import SimulatedSureMark
+
+LOGO = b'\x1d\x2a' + bytes(64)
+
+
+def make(tmp_path, port='/dev/ttyUSB0', sim=None):
+    sim = sim or SimulatedSureMark()
+    slots = FlashSlots(SureMark(sim), str(tmp_path / 'flash.json'), port, 'A1B2', clock=sim.clock, sleep=sim.sleep)
+    slots.add_logo(1, LOGO)
+    return sim, slots
+
+
+def test_sync_uploads_changes_only(tmp_path):
+    sim, slots = make(tmp_path)
+    assert slots.pending() == ['logo:1']
+    assert slots.sync() == ['logo:1']
+    assert slots.sync() == []
+    assert slots.uploads == 1
+    assert slots.bytes_uploaded == len(LOGO)
+    # the manifest remembers it
+    sim, slots = make(tmp_path, sim=sim)
+    assert slots.pending() == []
+    slots.add_logo(1, LOGO + b'\x00')
+    assert slots.sync() == ['logo:1']
+
+
+def test_key_includes_the_port(tmp_path):
+    _, a = make(tmp_path, '/dev/ttyUSB0')
+    a.sync()
+    _, b = make(tmp_path, '/dev/ttyUSB1')
+    assert a.key() != b.key()
+    assert '/dev/ttyUSB1' in b.key()
+    assert 'A1B2' in b.key()
+    assert b.pending() == ['logo:1']
+
+
+def test_rejected_upload_is_not_recorded(tmp_path):
+    sim, slots = make(tmp_path)
+    sim.inject('reject')
+    with pytest.raises(ValueError):
+        slots.sync()
+    assert slots.pending() == ['logo:1']
+    with pytest.raises(ValueError):
+        slots.print_logo(1)
+    assert slots.sync() == ['logo:1']
+    slots.print_logo(1)
+
+
+def test_forget(tmp_path):
+    _, slots = make(tmp_path)
+    slots.sync()
+    slots.forget()
+    assert slots.pending() == ['logo:1']
+
+
+def test_invalid_slot(tmp_path):
+    _, slots = make(tmp_path)
+    with pytest.raises(ValueError):
+        slots.add_logo(256, LOGO)
+    with pytest.raises(ValueError):
+        slots.print_stored_text(1)
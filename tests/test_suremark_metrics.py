@@ -0,0 +1,83 @@
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_metrics import Histogram, Metrics
+from posprinter.suremark_sim import SimulatedSureMark
+
+
+def make():
+    sim = SimulatedSureMark()
+    metrics = Metrics(labels={'printer': 'sim'}, clock=sim.clock)
+    return sim, SureMark(sim, metrics=metrics), metrics
+
+
+def test_counts_commands():
+    sim, p, metrics = make()
+    p.write(b'hello')
+    p.cut()
+    p.query_status()
+    assert metrics.commands['text'] == 1
+    assert metrics.command_bytes['text'] == 5
+    assert metrics.commands['retrieve_printer_id'] == 1
+    assert metrics.bytes_written == sim.bytes_received
+    assert metrics.messages == 1
+
+
+def test_batch_is_counted_when_sent():
+    sim, p, metrics = make()
+    with p.batch():
+        p.write(b'hello')
+        p.cut()
+        assert metrics.bytes_written == 0
+    assert metrics.commands['text'] == 1
+    assert metrics.bytes_written == sim.bytes_received
+
+
+def test_discarded_batch_is_not_counted():
+    sim, p, metrics = make()
+    with pytest.raises(RuntimeError):
+        with p.batch():
+            p.write(b'hello')
+            raise RuntimeError()
+    assert metrics.bytes_written == 0
+    assert sum(metrics.commands.values()) == 0
+
+
+def test_latency_starts_at_the_write():
+    sim, p, metrics = make()
+    with p.batch():
+        p.write(SureMark.CMD_RETRIEVE_PRINTER_ID)
+        # time passing before the batch is sent is not part of the latency
+        sim.sleep(10.0)
+    p.receive_message()
+    hist = metrics.latency['retrieve_printer_id']
+    assert hist.count == 1
+    assert hist.sum < 0.1
+
+
+def test_events_and_timeouts():
+    sim, p, metrics = make()
+    sim.inject('reject')
+    p.query_status()
+    sim.inject('drop_response')
+    with pytest.raises(ValueError):
+        p.query_status()
+    assert metrics.events['command_rejected'] == 1
+    assert metrics.timeouts == 1
+
+
+def test_export():
+    sim, p, metrics = make()
+    p.query_status()
+    text = metrics.export()
+    assert 'posprinter_commands_total{command="retrieve_printer_id",printer="sim"} 1' in text
+    assert 'posprinter_request_latency_seconds_count{command="retrieve_printer_id",printer="sim"} 1' in text
+    assert text.endswith('\n')
+
+
+def test_histogram():
+    hist = Histogram((1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        hist.observe(value)
+    assert hist.cumulative() == [(1, 2), (2, 3), (float('inf'), 4)]
+    assert hist.sum == 6.0
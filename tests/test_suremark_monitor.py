@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_monitor import StatusMonitor
+from posprinter.suremark_sim import SimulatedSureMark
+
+
+def make_monitor(**kwargs):
+    sim = SimulatedSureMark()
+    events = []
+    monitor = StatusMonitor(SureMark(sim), lambda event, active, m: events.append((event, active)), **kwargs)
+    return sim, monitor, events
+
+
+def test_reports_transitions_only():
+    sim, monitor, events = make_monitor()
+    monitor.poll()
+    assert events == []
+    sim.inject('cover_open', duration=1.0)
+    monitor.poll()
+    monitor.poll()
+    assert events == [('cover_open', True)]
+    sim.sleep(2.0)
+    monitor.poll()
+    assert events == [('cover_open', True), ('cover_open', False)]
+
+
+def test_offline():
+    sim, monitor, events = make_monitor()
+    sim.inject('drop_response')
+    assert monitor.poll() is None
+    assert events == [('offline', True)]
+    assert monitor.poll() is not None
+    assert events == [('offline', True), ('offline', False)]
+
+
+def test_interval_backs_off_when_idle():
+    sim, monitor, events = make_monitor(fast_interval=0.2, slow_interval=1.0)
+    intervals = []
+    for _ in range(5):
+        monitor.poll()
+        intervals.append(monitor.interval())
+    assert intervals == [0.4, 0.8, 1.0, 1.0, 1.0]
+    with monitor.job():
+        assert monitor.interval() == 0.2
+        monitor.poll()
+        assert monitor.interval() == 0.2
+
+
+def test_failing_listener_is_logged(caplog):
+    sim, monitor, events = make_monitor()
+
+    def broken(event, active, m):
+        raise RuntimeError('listener bug')
+
+    monitor.add_listener(broken)
+    monitor.add_listener(lambda event, active, m: events.append(('second', event)))
+    sim.inject('cover_open', duration=1.0)
+    with caplog.at_level(logging.ERROR, logger='posprinter.suremark_monitor'):
+        monitor.poll()
+    assert ('cover_open', True) in events
+    assert ('second', 'cover_open') in events
+    assert 'listener bug' in caplog.text
+    assert monitor.events == 1
+
+
+def test_invalid_intervals():
+    with pytest.raises(ValueError):
+        StatusMonitor(SureMark(SimulatedSureMark()), fast_interval=1.0, slow_interval=0.5)
@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from posprinter.suremark_pool import PrinterPool
+from posprinter.suremark_sim import SimulatedSureMark
+
+
+def make_pool(**kwargs):
+    devices = {
+        'a': SimulatedSureMark(printer_id=b'\x30\x03\x08\x00\x00'),
+        'b': SimulatedSureMark(printer_id=b'\x30\x01\x03\x00\x00'),
+    }
+    return PrinterPool(devices, **kwargs), devices
+
+
+def test_identifies_printers():
+    pool, _ = make_pool()
+    with pool:
+        ids = {p.name: p.printer_id.raw() for p in pool.printers()}
+    assert ids == {'a': b'\x30\x03\x08\x00\x00', 'b': b'\x30\x01\x03\x00\x00'}
+
+
+def test_routes_by_requirement():
+    pool, devices = make_pool()
+    with pool:
+        f = pool.submit(lambda p: p.write(b'cheque'), requires=lambda pid: pid.has_micr())
+        f.result(timeout=5)
+        with pytest.raises(ValueError):
+            pool.submit(lambda p: None, requires=lambda pid: pid.is_Tx1())
+    assert pool.stats()['b']['jobs_done'] == 1
+    assert pool.stats()['a']['jobs_done'] == 0
+
+
+def test_jobs_on_one_printer_run_in_order():
+    pool, _ = make_pool(identify=False)
+    order = []
+    with pool:
+        futures = [pool.submit(lambda p, i=i: order.append(i), printer='a') for i in range(10)]
+        for f in futures:
+            f.result(timeout=5)
+    assert order == list(range(10))
+
+
+def test_job_exception_is_reported():
+    pool, _ = make_pool(identify=False)
+
+    def job(p):
+        raise OSError('port gone')
+
+    with pool:
+        f = pool.submit(job, printer='a')
+        with pytest.raises(OSError):
+            f.result(timeout=5)
+        # the printer keeps working
+        assert pool.submit(lambda p: 42, printer='a').result(timeout=5) == 42
+    assert pool.stats()['a']['jobs_failed'] == 1
+    assert pool.stats()['a']['jobs_done'] == 2
+
+
+def test_submit_after_shutdown_is_rejected():
+    pool, _ = make_pool(identify=False)
+    pool.shutdown()
+    with pytest.raises(ValueError):
+        pool.submit(lambda p: None, printer='a')
+    assert pool.stats()['a']['queue_depth'] == 0
+
+
+def test_shortest_queue_is_picked():
+    pool, _ = make_pool(identify=False)
+    release = threading.Event()
+    with pool:
+        blocked = pool.submit(lambda p: release.wait(5), printer='a')
+        f = pool.submit(lambda p: p)
+        assert f.result(timeout=5) is pool.printers()[1].printer
+        release.set()
+        blocked.result(timeout=5)
+
+
+def test_requires_devices():
+    with pytest.raises(ValueError):
+        PrinterPool({})
+
+
+def test_counters_are_updated_before_the_result():
+    clock = iter(range(100)).__next__
+    pool, _ = make_pool(clock=lambda: float(clock()))
+    with pool:
+        for i in range(20):
+            pool.submit(lambda p: None, printer='a').result(timeout=5)
+            assert pool.stats()['a']['jobs_done'] == i + 1
+        assert pool.stats()['a']['busy_time'] == 20.0
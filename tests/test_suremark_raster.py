@@ -0,0 +1,69 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from posprinter.suremark_raster import (CMD_PRINT_RASTER_IMAGE, PAPER_58MM_DOTS, PAPER_80MM_DOTS, RasterConverter,
+                                        fit_width, paper_width, raster_commands, to_monochrome)
+from posprinter.suremark_status import PrinterID
+
+
+def test_to_monochrome_threshold():
+    gray = np.array([[0, 127, 128, 255]], dtype=np.uint8)
+    assert to_monochrome(gray).tolist() == [[True, True, False, False]]
+
+
+def test_to_monochrome_dither_keeps_gray():
+    gray = np.full((8, 8), 128, dtype=np.uint8)
+    mono = to_monochrome(gray, dither=True)
+    assert mono.sum() == 32
+
+
+def test_to_monochrome_color():
+    rgb = np.zeros((2, 2, 3), dtype=np.uint8)
+    rgb[0, 0] = 255
+    assert to_monochrome(rgb).tolist() == [[False, True], [True, True]]
+
+
+def test_fit_width():
+    mono = np.ones((4, 4), dtype=np.bool_)
+    padded = fit_width(mono, 16, align='right')
+    assert padded.shape == (4, 16)
+    assert padded[:, 12:].all() and not padded[:, :12].any()
+    scaled = fit_width(np.ones((16, 32), dtype=np.bool_), 16)
+    assert scaled.shape == (8, 16)
+    with pytest.raises(ValueError):
+        fit_width(mono, 16, align='top')
+
+
+def test_raster_commands_bands():
+    mono = np.zeros((30, 16), dtype=np.bool_)
+    mono[:, 0] = True
+    data = raster_commands(mono, band_height=24)
+    first = CMD_PRINT_RASTER_IMAGE + b'\x00' + (2).to_bytes(2, 'little') + (24).to_bytes(2, 'little')
+    assert data.startswith(first + b'\x80\x00')
+    second = data.index(CMD_PRINT_RASTER_IMAGE, len(first))
+    assert second == len(first) + 24 * 2
+    assert data[second + 6:second + 8] == (6).to_bytes(2, 'little')
+    assert len(data) == 2 * 8 + 30 * 2
+
+
+def test_paper_width():
+    assert paper_width(PrinterID(b'\x30\x03\x08\x00\x00')) == PAPER_80MM_DOTS
+    assert paper_width(PrinterID(b'\x30\x03\x08\x01\x00')) == PAPER_58MM_DOTS
+
+
+def test_converter_cache():
+    conv = RasterConverter(width=64, maxsize=1)
+    a = np.zeros((8, 64), dtype=np.uint8)
+    b = np.full((8, 64), 255, dtype=np.uint8)
+    assert conv.convert(a) == conv.convert(a.copy())
+    conv.convert(b)
+    conv.convert(a)
+    assert conv.hits == 1
+    assert conv.misses == 3
+
+
+def test_converter_width():
+    with pytest.raises(ValueError):
+        RasterConverter(width=100)
+    assert RasterConverter(printer_id=PrinterID(b'\x30\x03\x08\x01\x00')).width() == PAPER_58MM_DOTS
@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from posprinter.suremark_scheduler import JobScheduler, PriorityClass, SegmentRecorder
+from posprinter.suremark_sim import VirtualClock
+
+CLASSES = (PriorityClass('receipt', 0, 10.0), PriorityClass('report', 1, 100.0))
+
+
+class Printer:
+    # records the segments, the first write blocks until released
+    def __init__(self):
+        self.writes = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.entered.set()
+        self.release.wait(5.0)
+        self.writes.append(bytes(data))
+
+
+def cut():
+    recorder = SegmentRecorder()
+    recorder.print_form_feed_cut()
+    return recorder.take()[0]
+
+
+def report(recorder):
+    for page in (b'page 1', b'page 2', b'page 3'):
+        recorder.write(page)
+        recorder.print_form_feed_cut()
+
+
+def test_segments_end_at_cuts():
+    recorder = SegmentRecorder()
+    with recorder.batch() as batch:
+        recorder.write(b'a')
+        recorder.write(b'b')
+        recorder.print_form_feed_cut()
+        recorder.write(b'c')
+    assert recorder.take() == [b'ab' + cut(), b'c']
+    assert batch.writes_saved() > 0
+
+
+def test_preemption_at_a_cut():
+    printer = Printer()
+    scheduler = JobScheduler(printer, CLASSES)
+    with scheduler:
+        done = scheduler.submit(report, 'report')
+        assert printer.entered.wait(5.0)
+        receipt = scheduler.submit(b'receipt', 'receipt')
+        printer.release.set()
+        receipt.result(5.0)
+        done.result(5.0)
+    assert printer.writes == [b'page 1' + cut(), b'receipt', b'page 2' + cut(), b'page 3' + cut()]
+    assert scheduler.class_stats('report').preemptions == 1
+    assert scheduler.class_stats('receipt').preemptions == 0
+    stats = scheduler.stats()
+    assert stats['report']['completed'] == 1
+    assert stats['receipt']['completed'] == 1
+
+
+@pytest.mark.parametrize('aging,first', [(0.5, b'report'), (None, b'receipt')])
+def test_waiting_jobs_are_promoted(aging, first):
+    printer = Printer()
+    printer.release.set()
+    clock = VirtualClock()
+    scheduler = JobScheduler(printer, CLASSES, aging=aging, clock=clock)
+    old = scheduler.submit(b'report', 'report')
+    # waited longer than half of the report SLO
+    clock.sleep(60.0)
+    receipt = scheduler.submit(b'receipt', 'receipt')
+    with scheduler:
+        old.result(5.0)
+        receipt.result(5.0)
+    assert printer.writes[0] == first
+    assert scheduler.stats()['report']['promotions'] == (1 if aging else 0)
+
+
+def test_failing_write():
+    class Failing:
+        def write(self, data):
+            raise OSError('port closed')
+
+    scheduler = JobScheduler(Failing(), CLASSES)
+    with scheduler:
+        future = scheduler.submit(b'receipt', 'receipt')
+        with pytest.raises(OSError):
+            future.result(5.0)
+    assert scheduler.class_stats('receipt').failed == 1
+    assert scheduler.queue_depth() == 0
+
+
+def test_invalid_jobs():
+    scheduler = JobScheduler(Printer(), CLASSES)
+    with pytest.raises(ValueError):
+        scheduler.submit(b'x', 'kitchen')
+    with pytest.raises(ValueError):
+        scheduler.submit(b'', 'receipt')
+    with pytest.raises(ValueError):
+        JobScheduler(Printer(), CLASSES, aging=0)
@@ -0,0 +1,91 @@
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_sim import SimulatedSureMark, VirtualClock
+
+
+def test_virtual_clock():
+    clock = VirtualClock(5.0)
+    clock.sleep(1.5)
+    clock.sleep(-1)
+    assert clock() == 6.5
+
+
+def test_write_takes_the_transmission_time():
+    sim = SimulatedSureMark(baudrate=9600)
+    sim.write(b'x' * 960)
+    assert sim.clock() == pytest.approx(1.0)
+    assert sim.bytes_received == 960
+
+
+def test_buffer_drains_and_overflows():
+    sim = SimulatedSureMark(baudrate=1000000, buffer_size=1000, drain_rate=100)
+    sim.write(b'x' * 1500)
+    assert sim.overflows == 500
+    assert sim.buffer_level() == pytest.approx(1000, abs=5)
+    sim.sleep(5)
+    assert sim.buffer_level() == pytest.approx(500, abs=5)
+    assert sim.bytes_printed == pytest.approx(500, abs=5)
+
+
+def test_status_response():
+    p = SureMark(SimulatedSureMark(ec_level=0x51))
+    m = p.query_status()
+    assert m.is_printer_id_response()
+    assert m.command_complete()
+    assert m.buffer_empty()
+    assert m.engineering_code_level() == 0x51
+    assert p.identify().raw() == SimulatedSureMark.PRINTER_ID
+
+
+def test_request_split_across_writes():
+    sim = SimulatedSureMark()
+    cmd = SureMark.CMD_RETRIEVE_PRINTER_ID
+    sim.write(b'text' + cmd[:1])
+    sim.write(cmd[1:])
+    assert sim.requests == 1
+    assert sim.overflows == 0
+
+
+def test_head_gets_hot():
+    sim = SimulatedSureMark(baudrate=1000000, drain_rate=2000, heat_limit=1000, cooling_rate=0)
+    sim.write(b'x' * 3000)
+    sim.sleep(1.0)
+    assert sim.head_hot()
+    m = SureMark(sim).query_status()
+    assert m.head_hot()
+
+
+def test_faults():
+    sim = SimulatedSureMark()
+    p = SureMark(sim)
+    sim.inject('reject')
+    assert p.query_status().command_rejected()
+    sim.inject('drop_response')
+    with pytest.raises(ValueError):
+        p.query_status()
+    sim.inject('cover_open', duration=1.0)
+    sim.write(b'x' * 10)
+    sim.sleep(0.5)
+    assert sim.buffer_level() == 10
+    sim.sleep(1.0)
+    assert sim.buffer_level() == 0
+    with pytest.raises(ValueError):
+        sim.inject('fire')
+
+
+def test_closed_port():
+    sim = SimulatedSureMark()
+    sim.close()
+    with pytest.raises(OSError):
+        sim.write(b'x')
+
+
+def test_counters_by_constant_or_int():
+    sim = SimulatedSureMark(counters={SureMark.STATS_RAW_NUMBER_CUTS_FAILED: 7,
+                                      SureMark.STATS_RAW_NUMBER_CUST_RECEIPT_COVER_OPENED[0]: 3})
+    p = SureMark(sim)
+    assert p.get_printer_usage_stat_number_failed_paper_cuts() == 7
+    assert p.get_printer_usage_stats_thermal_cover_opened() == 3
+    sim.counters[SureMark.STATS_RAW_NUMBER_CUTS_FAILED] = 8
+    assert p.get_printer_usage_stat_number_failed_paper_cuts() == 8
@@ -0,0 +1,42 @@
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_sim import SimulatedSureMark
+from posprinter.suremark_spooler import Spooler
+
+
+def make(**kwargs):
+    sim = SimulatedSureMark(**kwargs)
+    p = SureMark(sim)
+    return sim, p
+
+
+def test_large_job_does_not_overflow_the_buffer():
+    sim, p = make(baudrate=115200, drain_rate=1000)
+    spooler = Spooler(p, clock=sim.clock, sleep=sim.sleep)
+    spooler.print_job(b'x' * 20000)
+    # everything else received are the status polls
+    assert sim.bytes_received == 20000 + spooler.polls * len(SureMark.CMD_RETRIEVE_PRINTER_ID)
+    assert sim.overflows == 0
+    assert spooler.bytes_sent == 20000
+    assert spooler.stalls > 0
+    assert spooler.bytes_per_second() > 0
+
+
+def test_stall_timeout_while_cover_is_open():
+    sim, p = make(baudrate=115200)
+    sim.inject('cover_open', duration=60.0)
+    spooler = Spooler(p, stall_timeout=1.0, clock=sim.clock, sleep=sim.sleep)
+    with pytest.raises(TimeoutError):
+        spooler.print_job(b'x' * 20000)
+    assert sim.overflows == 0
+
+
+def test_invalid_parameters():
+    sim, p = make()
+    with pytest.raises(ValueError):
+        Spooler(None)
+    with pytest.raises(ValueError):
+        Spooler(p, chunk_size=0)
+    with pytest.raises(ValueError):
+        Spooler(p, chunk_size=512, headroom=256)
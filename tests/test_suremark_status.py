@@ -0,0 +1,53 @@
+from posprinter.suremark_status import PrinterMessage
+
+
+def message(status, payload=b''):
+    return PrinterMessage(status.to_bytes(8, 'little') + payload)
+
+
+def test_status_bits():
+    status = PrinterMessage.STATUS_COMMAND_COMPLETE | PrinterMessage.STATUS_BUFFER_EMPTY | (0x44 << 24)
+    m = message(status | PrinterMessage.STATUS_PRINTER_ID_RESPONSE, b'\x30\x03\x08\x00\x00')
+    assert m.command_complete()
+    assert not m.command_rejected()
+    assert m.buffer_empty()
+    assert not m.buffer_full()
+    assert not m.command_not_complete()
+    assert m.engineering_code_level() == 0x44
+    assert m.is_printer_id_response()
+    assert not m.is_mct_response()
+    assert m.raw_payload() == b'\x30\x03\x08\x00\x00'
+
+
+def test_payload_is_not_copied():
+    data = bytearray(PrinterMessage.STATUS_MCT_RESPONSE.to_bytes(8, 'little') + b'\x00\x01')
+    m = PrinterMessage(data)
+    data[9] = 2
+    assert bytes(m.payload()) == b'\x00\x02'
+
+
+def test_equality_and_diff():
+    a = message(PrinterMessage.STATUS_COMMAND_COMPLETE)
+    b = message(PrinterMessage.STATUS_COMMAND_COMPLETE)
+    c = message(PrinterMessage.STATUS_COMMAND_COMPLETE | PrinterMessage.STATUS_COVER_OPEN)
+    assert a == b
+    assert hash(a) == hash(b)
+    assert a != c
+    assert a.diff(c) == PrinterMessage.STATUS_COVER_OPEN
+    assert a.diff(c.status()) == PrinterMessage.STATUS_COVER_OPEN
+
+
+def test_conditions():
+    m = message(PrinterMessage.STATUS_COMMAND_REJECTED | PrinterMessage.STATUS_HEAD_HOT | (0xff << 24))
+    conditions = m.conditions()
+    assert 'Command rejected' in conditions
+    assert 'Print head or motor almost to hot to continue printing' in conditions
+    # the EC level is a number, not a condition
+    assert not any(c.startswith('EC') for c in conditions)
+
+
+def test_decode():
+    decoded = message(PrinterMessage.STATUS_BUFFER_FULL).decode()
+    assert len(decoded) == 8
+    assert decoded['Status byte 2'][7] == 'Buffer full (less than 1k left)'
+    assert decoded['Status byte 2'][6] == 'Buffer not empty'
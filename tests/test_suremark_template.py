@@ -0,0 +1,116 @@
+import decimal
+
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_template import (AmountSlot, DigitsSlot, TemplateCache, TextSlot, compile_template)
+
+
+def receipt(t):
+    t.align_positions(SureMark.ALIGN_POSITIONS_CENTER)
+    t.text(TextSlot('item', width=8))
+    t.text(AmountSlot('price', width=6))
+    t.print_line_feed()
+    t.barcode(DigitsSlot('sku', length=12), type=SureMark.BARCODE_EAN13)
+    t.cut()
+
+
+def test_render_fills_the_slots():
+    template = compile_template(receipt)
+    assert template.slot_names() == {'item', 'price', 'sku'}
+    data = template.render(item='Coffee', price=250, sku='400638133393')
+    assert b'Coffee    2.50\n' in data
+    # the check digit is added like SureMark.barcode does
+    barcode = SureMark.CMD_BARCODE_PRINT + SureMark.BARCODE_EAN13 + b'4006381333931\x00'
+    assert barcode in data
+    assert data.endswith(SureMark.CMD_PRINT_FORM_FEED_CUT)
+    # the static part is built once
+    assert template.static_size() == len(data) - len(b'Coffee    2.50') - len(barcode)
+
+
+def test_render_validates_values():
+    template = compile_template(receipt)
+    with pytest.raises(ValueError):
+        template.render(item='Coffee', price=250)
+    with pytest.raises(ValueError):
+        template.render(item='Coffee', price=250, sku='4006381333', extra=1)
+    with pytest.raises(ValueError):
+        template.render(item='Coffee\x1b', price=250, sku='400638133393')
+    with pytest.raises(ValueError):
+        template.render(item='Much too long', price=250, sku='400638133393')
+    with pytest.raises(ValueError):
+        template.render(item='Coffee', price=250, sku='4006381333')
+    with pytest.raises(TypeError):
+        template.render(item='Coffee', price=2.5, sku='400638133393')
+
+
+def test_amount_slot_takes_decimals():
+    assert AmountSlot('x', width=7).encode(decimal.Decimal('12.5')) == b'  12.50'
+    assert AmountSlot('x', decimals=0).encode(7) == b'7'
+
+
+def test_builder_only_offers_commands():
+    def build(t):
+        t.query_status()
+    with pytest.raises(AttributeError):
+        compile_template(build)
+
+    def build_constants(t):
+        t.write(t.CMD_PRINT_LINE_FEED)
+    assert compile_template(build_constants).render() == b'\n'
+
+
+def test_cache_keeps_the_most_recently_used():
+    cache = TemplateCache(maxsize=2)
+    first = cache.get('a', receipt)
+    assert cache.get('a', receipt) is first
+    cache.get('b', receipt)
+    cache.get('c', receipt)
+    assert len(cache) == 2
+    assert cache.get('a', receipt) is not first
+    assert cache.hits == 1
+    assert cache.misses == 4
+
+
+def test_barcode_slots_are_built_like_barcodes():
+    def build(t):
+        t.barcode(DigitsSlot('itf'), type=SureMark.BARCODE_ITF)
+        t.barcode(DigitsSlot('code'), type=SureMark.BARCODE_CODE_128A)
+    template = compile_template(build)
+    assert template.render(itf='1234567890123', code='1234') == b''.join([
+        SureMark.CMD_BARCODE_PRINT, SureMark.BARCODE_ITF, b'12345678901231\x00',
+        SureMark.CMD_BARCODE_PRINT, SureMark.BARCODE_CODE_128C, b'1234\x00'])
+    with pytest.raises(ValueError):
+        template.render(itf='12', code='12A')
+
+
+@pytest.mark.parametrize('type,length', [
+    (SureMark.BARCODE_EAN13, 11),
+    (SureMark.BARCODE_UPC_A, 10),
+    (SureMark.BARCODE_CODE_128C, 3),
+])
+def test_barcode_slot_length_must_fit(type, length):
+    def build(t):
+        t.barcode(DigitsSlot('sku', length=length), type=type)
+    with pytest.raises(ValueError):
+        compile_template(build)
+
+
+def test_text_uses_the_code_pages():
+    def build(t):
+        t.text('Crème ')
+        t.text(TextSlot('item'))
+        t.text(' brûlée')
+    template = compile_template(build, page=0)
+    assert template.render(item='Café') == 'Crème Café brûlée'.encode('cp437')
+    # a page switch in the slot is undone for the static text after it
+    assert template.render(item='Smørbrød') == b''.join([
+        'Crème Sm'.encode('cp437'), SureMark.CMD_SET_CODE_PAGE, b'\x02', 'ørbrød'.encode('cp850'),
+        SureMark.CMD_SET_CODE_PAGE, b'\x00', ' brûlée'.encode('cp437')])
+
+
+def test_text_selects_a_page_if_unknown():
+    def build(t):
+        t.text('Crème')
+    assert compile_template(build).render() == b'Cr' + SureMark.CMD_SET_CODE_PAGE + b'\x00' + 'ème'.encode('cp437')
+    assert TextSlot('x').encode('Smørbrød', page=2) == 'Smørbrød'.encode('cp850')
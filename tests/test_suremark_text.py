@@ -0,0 +1,74 @@
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_sim import SimulatedSureMark
+from posprinter.suremark_text import TextEncoder
+
+
+def test_ascii_never_switches():
+    enc = TextEncoder()
+    assert enc.encode('TOTAL 4.50\n') == b'TOTAL 4.50\n'
+    assert enc.page is None
+    assert enc.switches == 0
+
+
+def test_switches_only_when_needed():
+    enc = TextEncoder()
+    assert enc.encode('Crème') == b'Cr\x1bt\x00\x8ame'
+    assert enc.page == 0
+    # cp437 is active and has "é"
+    assert enc.encode('Café') == b'Caf\x82'
+    # cp437 has no "ø"
+    assert enc.encode('Smørbrød') == b'Sm\x1bt\x02\x9brbr\x9bd'
+    assert enc.page == 2
+    assert enc.switches == 2
+
+
+def test_fewest_switches():
+    enc = TextEncoder()
+    # cp850 has both characters, a single switch is enough
+    assert enc.encode('é ø') == b'\x1bt\x02\x82 \x9b'
+    enc = TextEncoder(page=19)
+    # "Ж" only exists in cp866, which has no "é"
+    assert enc.encode('Жé') == b'\x1bt\x11\x86\x1bt\x13\x82'
+    assert enc.page == 19
+
+
+def test_known_page():
+    enc = TextEncoder(page=2)
+    assert enc.encode('ø') == b'\x9b'
+    enc.reset()
+    assert enc.encode('ø') == b'\x1bt\x02\x9b'
+
+
+def test_unknown_characters():
+    assert TextEncoder().encode('a中b') == b'a?b'
+    enc = TextEncoder(errors='strict')
+    assert not enc.encodable('a中b')
+    assert enc.encodable('aéb')
+    with pytest.raises(ValueError):
+        enc.encode('a中b')
+    with pytest.raises(ValueError):
+        TextEncoder(errors='ignore')
+
+
+def test_cache():
+    enc = TextEncoder(page=0, cache_size=2)
+    enc.encode('é')
+    enc.encode('é')
+    assert enc.hits == 1
+    enc.encode('ü')
+    enc.encode('x')
+    enc.encode('é')
+    assert enc.misses == 4
+    # the result depends on the active page, which is part of the key
+    enc.reset()
+    assert enc.encode('é') == b'\x1bt\x00\x82'
+
+
+def test_printer_text():
+    sim = SimulatedSureMark()
+    p = SureMark(sim)
+    p.text('Café\n')
+    p.text('Crème\n')
+    assert sim.bytes_received == len(b'\x1bt\x00Caf\x82\nCr\x8ame\n')
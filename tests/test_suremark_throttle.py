@@ -0,0 +1,84 @@
+import pytest
+
+from posprinter.suremark import SureMark
+from posprinter.suremark_sim import SimulatedSureMark
+from posprinter.suremark_spooler import Spooler
+from posprinter.suremark_status import PrinterMessage
+from posprinter.suremark_throttle import ThermalThrottle
+
+
+def message(hot=False, full=False, empty=False):
+    status = PrinterMessage.STATUS_COMMAND_COMPLETE
+    if hot:
+        status |= PrinterMessage.STATUS_HEAD_HOT
+    if full:
+        status |= PrinterMessage.STATUS_BUFFER_FULL
+    if empty:
+        status |= PrinterMessage.STATUS_BUFFER_EMPTY
+    return PrinterMessage(status.to_bytes(8, 'little'))
+
+
+@pytest.mark.parametrize('drain_rate', [1000, 2000])
+def test_estimates_the_printers_drain_rate(drain_rate):
+    # the port is much faster than the printer, the send rate says nothing about the drain rate
+    sim = SimulatedSureMark(baudrate=115200, drain_rate=drain_rate)
+    throttle = ThermalThrottle()
+    spooler = Spooler(SureMark(sim), throttle=throttle, clock=sim.clock, sleep=sim.sleep)
+    spooler.print_job(b'x' * 40000)
+    assert throttle.drain_rate == pytest.approx(drain_rate, rel=0.1)
+
+
+def test_no_estimate_while_the_printer_idles():
+    throttle = ThermalThrottle()
+    for now in range(10):
+        throttle.delay(1000, now)
+        throttle.observe(message(empty=True), now)
+    assert throttle.drain_rate is None
+
+
+def test_paces_to_the_line_rate_before_an_estimate():
+    throttle = ThermalThrottle(line_rate=1000)
+    throttle.observe(message(), 0.0)
+    assert throttle.rate() is None
+    throttle.observe(message(hot=True), 1.0)
+    assert throttle.hot()
+    assert throttle.rate() == 1000 * ThermalThrottle.HOT_FRACTION
+    assert throttle.delay(100, 1.0) == 0.0
+    assert throttle.delay(100, 1.0) == pytest.approx(100 / throttle.rate())
+    # reduced while the buffer is full
+    throttle.observe(message(hot=True, full=True), 2.0)
+    assert throttle.rate() == 1000 * ThermalThrottle.HOT_FRACTION * ThermalThrottle.DECREASE
+
+
+def test_slowdown_time_includes_the_current_slowdown():
+    throttle = ThermalThrottle(line_rate=1000)
+    throttle.observe(message(), 0.0)
+    throttle.observe(message(hot=True), 1.0)
+    throttle.observe(message(hot=True), 3.0)
+    assert throttle.slowdown_time == 2.0
+    throttle.observe(message(), 4.0)
+    assert not throttle.hot()
+    assert throttle.rate() is None
+    assert throttle.slowdown_time == 3.0
+    assert throttle.slowdowns == 1
+
+
+def test_long_jobs_select_the_speed():
+    sim = SimulatedSureMark()
+    p = SureMark(sim)
+    throttle = ThermalThrottle(long_job=100, speed=SureMark.MAX_PRINT_SPEED_35,
+                               restore_speed=SureMark.MAX_PRINT_SPEED_52)
+    before = sim.bytes_received
+    throttle.job_started(p, 10)
+    throttle.job_finished(p)
+    assert sim.bytes_received == before
+    throttle.job_started(p, 100)
+    throttle.job_finished(p)
+    assert sim.bytes_received > before
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        ThermalThrottle(long_job=100)
+    with pytest.raises(ValueError):
+        ThermalThrottle(line_rate=0)
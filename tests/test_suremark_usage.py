@@ -0,0 +1,57 @@
+import pytest
+
+from posprinter.suremark import SureMark, mct_counter
+from posprinter.suremark_sim import SimulatedSureMark
+from posprinter.suremark_status import PrinterMessage
+
+
+def mct_message(payload):
+    status = PrinterMessage.STATUS_COMMAND_COMPLETE | PrinterMessage.STATUS_MCT_RESPONSE
+    return PrinterMessage(status.to_bytes(8, 'little') + payload)
+
+
+def test_snapshot_covers_every_counter():
+    stats = [getattr(SureMark, name) for name in dir(SureMark) if name.startswith('STATS_RAW_')]
+    assert sorted(SureMark.USAGE_SNAPSHOT_STATS) == sorted(stats)
+    assert all(isinstance(stat, bytes) for stat in stats)
+
+
+def test_snapshot_values():
+    counters = {
+        SureMark.STATS_RAW_MANUFACTURE_WEEK[0]: 2009,
+        SureMark.STATS_RAW_NUMBER_PAPER_CUTS[0]: 3,
+        SureMark.STATS_RAW_REMAINDER_NUMBER_PAPER_CUTS[0]: 5,
+        SureMark.STATS_RAW_NUMBER_CHARACTERS_THERMAL_LOW[0]: 1,
+        SureMark.STATS_RAW_NUMBER_CHARACTERS_THERMAL_HIGH[0]: 2,
+        SureMark.STATS_RAW_NUMBER_MAX_TEMP[0]: 61,
+        SureMark.STATS_RAW_NUMBER_MICR_READS[0]: 9,
+    }
+    sim = SimulatedSureMark(counters=counters)
+    p = SureMark(sim)
+    snapshot = p.get_usage_snapshot()
+    assert snapshot.manufacture_week == 2009
+    assert snapshot.paper_cuts == 3 * 32 + 5
+    assert snapshot.printed_characters_thermal == (1 << 16) | 2
+    assert snapshot.counters[SureMark.STATS_RAW_NUMBER_MAX_TEMP] == 61
+    assert snapshot.counters[SureMark.STATS_RAW_NUMBER_MICR_READS] == 9
+    assert snapshot.counters[SureMark.STATS_RAW_NUMBER_HOME_ERRORS] == 0
+    assert len(snapshot.counters) == len(SureMark.USAGE_SNAPSHOT_STATS)
+    # one write for all requests
+    assert sim.requests == len(SureMark.USAGE_SNAPSHOT_STATS)
+
+
+def test_mct_counter():
+    assert mct_counter(mct_message(b'\x01\x02')) == 0x0102
+
+
+def test_mct_counter_without_payload():
+    with pytest.raises(ValueError):
+        mct_counter(mct_message(b''))
+    with pytest.raises(ValueError):
+        mct_counter(mct_message(b'\x01'))
+
+
+def test_mct_counter_wrong_response():
+    status = PrinterMessage.STATUS_COMMAND_COMPLETE | PrinterMessage.STATUS_PRINTER_ID_RESPONSE
+    with pytest.raises(ValueError):
+        mct_counter(PrinterMessage(status.to_bytes(8, 'little') + b'\x01\x02'))